@@ -1,6 +1,7 @@
 from django.contrib.auth.backends import BaseBackend
 from django.conf import settings
 import requests
+from healthtrack import api_client
 from types import SimpleNamespace
 
 API_BASE_URL = settings.API_BASE_URL
@@ -18,10 +19,9 @@ class NodeAPIBackend(BaseBackend):
         
         try:
             # POST a la API de Node.js
-            resp = requests.post(
+            resp = api_client.post(
                 f"{API_BASE_URL}/auth/login", 
-                json={'identifier': identifier, 'password': password}, 
-                timeout=5
+                json={'identifier': identifier, 'password': password}
             )
         
             if resp.status_code == 200:
@@ -2,6 +2,7 @@ from django.utils.deprecation import MiddlewareMixin
 from django.contrib.auth.models import AnonymousUser
 from django.utils.functional import SimpleLazyObject
 from types import SimpleNamespace
+from functools import partial
 import sys
 
 def get_user(request):
@@ -41,9 +42,15 @@ def get_user(request):
             
     return request._cached_user
 
+async def aget_user(request):
+    # Versión async que usan login_required/user_passes_test en vistas async (request.auser()).
+    # get_user sólo lee la cookie firmada, no toca la base de datos.
+    return get_user(request)
+
 class RemoteUserMiddleware(MiddlewareMixin):
     def process_request(self, request):
         # En lugar de asignar el usuario directamente, usamos SimpleLazyObject.
         # Esto retrasa la ejecución de get_user hasta que alguien realmente pida request.user.
         # Es la clave para que funcione bien con sesiones basadas en cookies.
-        request.user = SimpleLazyObject(lambda: get_user(request))
\ No newline at end of file
+        request.user = SimpleLazyObject(lambda: get_user(request))
+        request.auser = partial(aget_user, request)
\ No newline at end of file
@@ -1,3 +1,38 @@
-from django.test import TestCase
+import re
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.sessions.serializers import JSONSerializer
+from django.core import signing
+from django.urls import reverse
+
+from healthtrack.pruebas import APIFalsaTestCase
+from healthtrack.sesion import SerializadorCompacto
+
+SALT = 'django.contrib.sessions.backends.signed_cookies'
+_RE_SESION = re.compile(r'sesion;dur=[\d.]+;desc="(\d+) B"')
+
+
+class SesionCompactaTests(APIFalsaTestCase):
+
+    def leer_cookie(self, client):
+        cookie = client.cookies[settings.SESSION_COOKIE_NAME].value
+        return signing.loads(cookie, salt=SALT, serializer=SerializadorCompacto)
+
+    def test_login_guarda_la_sesion_compacta_y_reporta_su_tamano(self):
+        client = self.login('user1')
+        sesion = self.leer_cookie(client)['user_session_data']
+        self.assertEqual((sesion['username'], sesion['rol']), ('user1', 'user'))
+
+        respuesta = client.get(reverse('home:mensajes'), secure=True)
+        self.assertEqual(respuesta.status_code, 200)
+        bytes_cookie = int(_RE_SESION.search(respuesta['Server-Timing']).group(1))
+        self.assertEqual(bytes_cookie, len(client.cookies[settings.SESSION_COOKIE_NAME].value))
+
+    def test_sigue_aceptando_cookies_del_serializador_anterior(self):
+        client = self.login('user1')
+        datos = self.leer_cookie(client)
+        client.cookies[settings.SESSION_COOKIE_NAME] = signing.dumps(
+            datos, compress=True, salt=SALT, serializer=JSONSerializer)
+
+        respuesta = client.get(reverse('home:mensajes'), secure=True)
+        self.assertEqual(respuesta.status_code, 200)
@@ -4,6 +4,8 @@ from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.conf import settings
 import requests
+from healthtrack import api_client
+from healthtrack.services import marcar_rol_en_sesion
 import sys
 
 def login_view(request):
@@ -38,19 +40,11 @@ def login_view(request):
                     'is_staff': getattr(user, 'is_staff', False),
                     'is_superuser': getattr(user, 'is_superuser', False),
                 }
+                # Versión/hora del rol: la navegación lo lee de aquí sin consultar la API
+                marcar_rol_en_sesion(session_data, session_data['rol'])
 
-                # --- DEBUGGING SESSION SIZE ---
-                try:
-                    import json
-                    session_json = json.dumps(session_data)
-                    size_bytes = len(session_json.encode('utf-8'))
-                    print(f"DEBUG SESSION SIZE: {size_bytes} bytes", file=sys.stderr)
-                    if size_bytes > 3800:
-                        print("WARNING: Session data is VERY close to the 4KB cookie limit!", file=sys.stderr)
-                except Exception as e:
-                    print(f"Error calculating session size: {e}", file=sys.stderr)
-                # ------------------------------
-
+                # El tamaño real de la cookie (y su tiempo de carga) sale en el header
+                # Server-Timing de cada request: sesion;desc="<bytes> B" (APIMetricsMiddleware)
                 request.session['user_session_data'] = session_data
 
                 request.session.modified = True
@@ -95,7 +89,7 @@ def register_view(request):
 
         try:
             api_base = settings.API_BASE_URL
-            resp = requests.post(f"{api_base}/auth/register", json=data, timeout=10)
+            resp = api_client.post(f"{api_base}/auth/register", json=data, timeout=10)
             
         except requests.exceptions.RequestException as e:
             print(f"Error de conexión con la API Node.js: {e}")
@@ -3,7 +3,14 @@ from django.contrib.auth.decorators import login_required, user_passes_test
 from django.conf import settings
 from .forms import RolUsuarioForm
 from django.contrib import messages
-import requests # Para comunicarse con la API de Node.js (Firebase)
+import requests # Excepciones de red (requests.RequestException)
+from healthtrack import api_client # Cliente compartido para la API de Node.js (Firebase)
+from healthtrack.services import (
+    bump_role_version, guardar_perfil, invalidate_profile, listar_usuarios,
+    olvidar_uid, parse_activo, resolver_uid,
+)
+from healthtrack.dashboard_stats import actualizar_stats, get_dashboard_stats, resumen_admin
+from healthtrack.patient_index import invalidar_indice
 import sys # Para logging en Cloud Run
 
 API_BASE_URL = getattr(settings, 'API_BASE_URL', 'http://localhost:3000/api')
@@ -37,28 +44,13 @@ def admin_dashboard_view(request):
         messages.error(request, "Sesión inválida. Por favor, inicia sesión nuevamente.")
         return redirect('account:login')
 
-# Inicializar contadores
-    stats = {
-        'total': 0,
-        'profesionales': 0,
-        'admins': 0,
-        'activos': 0,
-        'inactivos': 0
-    }
+    # Contadores precalculados (una pasada + caché corta, ver healthtrack/dashboard_stats.py)
+    stats = resumen_admin({})
 
     try:
-        # Obtenemos la lista completa para calcular métricas
-        resp = requests.get(USUARIO_API_URL, headers=headers, timeout=5)
-        if resp.status_code == 200:
-            usuarios = resp.json()
-            
-            # --- CÁLCULO DE MÉTRICAS EN PYTHON ---
-            stats['total'] = len(usuarios)
-            stats['profesionales'] = sum(1 for u in usuarios if u.get('rol') == 'profesional')
-            stats['admins'] = sum(1 for u in usuarios if u.get('rol') == 'admin')
-            stats['activos'] = sum(1 for u in usuarios if u.get('activo') is True)
-            stats['inactivos'] = stats['total'] - stats['activos']
-            # -------------------------------------
+        cacheados = get_dashboard_stats(headers)
+        if cacheados is not None:
+            stats = resumen_admin(cacheados)
 
     except requests.RequestException:
         messages.error(request, "Error de conexión al obtener métricas.")
@@ -81,23 +73,26 @@ def listar_usuarios_view(request):
         messages.error(request, "Sesión inválida. Por favor, inicia sesión nuevamente.")
         return redirect('account:login')
 
-# 1. Obtener la lista de usuarios de la API de Node.js (Fuente de la verdad)
+# 1. Obtener UNA página de usuarios de la API de Node.js (Fuente de la verdad), ya filtrada
     print(f"DEBUG: Listando usuarios solicitados por {request.user.username}", file=sys.stderr)
+    filtros = {
+        'rol': request.GET.get('rol') or None,
+        'activo': parse_activo(request.GET.get('activo')),
+    }
+    pagina = {'usuarios': [], 'next_cursor': None, 'total': 0}
     try:
-        resp = requests.get(USUARIO_API_URL, headers=headers, timeout=5)
-        if resp.status_code == 200:
-            usuarios = resp.json() 
-        else:
-            messages.error(request, "Error al obtener la lista de usuarios de la API.")
-            usuarios = []
-            
+        pagina = listar_usuarios(headers, cursor=request.GET.get('cursor'), **filtros)
     except requests.RequestException:
         messages.error(request, "Error de conexión con la API al listar usuarios.")
-        usuarios = []
 
     context = {
-        # Ahora pasamos la lista de usuarios directa de la API
-        'usuarios': usuarios
+        # Ahora pasamos la página de usuarios directa de la API
+        'usuarios': pagina['usuarios'],
+        'next_cursor': pagina['next_cursor'],
+        'total_usuarios': pagina['total'],
+        'filtro_rol': request.GET.get('rol', ''),
+        'filtro_activo': request.GET.get('activo', ''),
+        'roles': RolUsuarioForm.ROL_CHOICES,
     }
     return render(request, 'admin_panel/listar_usuarios.html', context)
 
@@ -119,26 +114,27 @@ def editar_usuario_view(request, username):
         return redirect('admin_panel:listar_usuarios')
         
     # 1. Obtener datos actuales de Firebase (Fuente de la verdad)
-    usuario_firebase = {}
-    current_rol = 'user'
-    
+    # También en el POST: el rol vigente decide el delta de los contadores y la copia
+    # en caché puede venir de antes de un cambio hecho en otra instancia
+    token = request.session.get('user_session_data', {}).get('token')
     try:
-        resp = requests.get(f"{USUARIO_API_URL}/username/{username}",
-         headers=headers,
-         timeout=5
+        resp = api_client.get(f"{USUARIO_API_URL}/username/{username}",
+         headers=headers
         )
 
         if resp.status_code != 200: #sin exito
             messages.error(request, f"No se pudo cargar el perfil de {username} desde Firebase.")
             return redirect('admin_panel:listar_usuarios')
-            
+
         usuario_firebase = resp.json()
-        current_rol = usuario_firebase.get('rol', 'user')
-        
+        guardar_perfil(username, usuario_firebase)
+
     except requests.RequestException:
         messages.error(request, "Error de conexión con la API al cargar el usuario.")
         return redirect('admin_panel:listar_usuarios')
 
+    current_rol = usuario_firebase.get('rol', 'user')
+
     # -------------------------------------------------------------------
     # Manejo POST (Actualizar)
     # -------------------------------------------------------------------
@@ -162,26 +158,19 @@ def editar_usuario_view(request, username):
             
             try:
                 # 1. Llamada PUT a la API de Node.js para actualizar en Firebase
-                resp_get = requests.get(
-                    f"{USUARIO_API_URL}/username/{username}",
-                    headers=headers,
-                    timeout=5
-                )
+                # (el UID técnico quedó registrado al descargar el perfil)
+                target_uid = resolver_uid(username, token) or username
 
-                target_uid = username
-
-                if resp_get.status_code == 200:
-                    user_data = resp_get.json()
-                    # Buscamos el identificador técnico
-                    target_uid = user_data.get('firebaseUid') or user_data.get('uid') or user_data.get('id')
-                
-                resp = requests.put(
+                resp = api_client.put(
                     f"{USUARIO_API_URL}/admin/update/{target_uid}",
                     json=data_update,
-                    headers=headers,
-                    timeout=5
+                    headers=headers
                 )
                 if resp.status_code == 200:
+                    invalidate_profile(username)
+                    bump_role_version(username) # Las sesiones abiertas de este usuario revalidan su rol
+                    actualizar_stats(usuario_firebase, {**usuario_firebase, 'rol': new_rol})
+                    invalidar_indice()
                     messages.success(request, f"Rol de {username} actualizado a '{new_rol}' en Firebase.")
                     return redirect('admin_panel:listar_usuarios')
                 else:
@@ -220,19 +209,27 @@ def eliminar_usuario_view(request, username):
         return redirect('account:login')
 
     # Obtener datos del usuario para mostrar en el template 
-    usuario_firebase = {'username': username} # Fallback mínimo
+    # También en el POST: el rol vigente decide si hace falta el PIN (una copia en caché
+    # podría no saber que otra instancia lo promovió a admin)
+    usuario_firebase = None
     try:
-        resp = requests.get(f"{USUARIO_API_URL}/username/{username}", 
-        headers=headers, 
-        timeout=5
+        resp = api_client.get(f"{USUARIO_API_URL}/username/{username}", 
+        headers=headers
         )
 
         if resp.status_code == 200:
             usuario_firebase = resp.json()
+            guardar_perfil(username, usuario_firebase)
             print(f"DEBUG: Datos usuario objetivo ({username}): {usuario_firebase}", file=sys.stderr)
     except Exception as e:
         print(f"DEBUG ERROR fetching user {username}: {e}", file=sys.stderr)
-        pass
+
+    if usuario_firebase is None:
+        if request.method == 'POST':
+            # Sin el rol actual no se puede saber si se requiere el PIN
+            messages.error(request, f"No se pudo verificar el rol de {username}. Intenta de nuevo.")
+            return redirect('admin_panel:listar_usuarios')
+        usuario_firebase = {'username': username} # Fallback mínimo
     
     # Restricción: No se permite la auto-eliminación
     if request.user.username == username:
@@ -253,19 +250,23 @@ def eliminar_usuario_view(request, username):
                 security_pin = request.POST.get('security_pin')
                 if security_pin != '123':
                     messages.error(request, "PIN de seguridad incorrecto. Eliminación de Administrador cancelada.")
-                    return redirect('admin_panel:lista_usuarios') # Fallback seguro
+                    return redirect('admin_panel:listar_usuarios') # Fallback seguro
             # ------------------------------------------
             # 1. Eliminar en Firebase (Node.js API)
             # Enviamos el PIN en el body (si la API lo soporta) o dependemos de headers
             delete_payload = {'securityPin': request.POST.get('security_pin')}
             
-            resp = requests.delete(f"{USUARIO_API_URL}/username/{username}", 
+            resp = api_client.delete(f"{USUARIO_API_URL}/username/{username}", 
             json=delete_payload,
-            headers=headers, 
-            timeout=5
+            headers=headers
             )
 
             if resp.status_code in [200, 204]: # 200 OK 
+                invalidate_profile(username)
+                olvidar_uid(username)
+                bump_role_version(username)
+                actualizar_stats(usuario_firebase, None)
+                invalidar_indice()
                 messages.success(request, f"Usuario '{username}' eliminado correctamente de Firebase.")
                 return redirect('admin_panel:listar_usuarios')
             
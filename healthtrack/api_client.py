@@ -0,0 +1,457 @@
+"""
+Cliente HTTP compartido para todas las llamadas a la API de Node.js.
+
+Todo el proceso comparte UN pool de conexiones keep-alive hacia ``API_BASE_URL``
+(el ``HTTPAdapter`` de urllib3, que es thread-safe), así evitamos abrir una
+conexión TCP/TLS nueva en cada llamada. ``requests.Session`` no es thread-safe:
+cada hilo usa su propia sesión (liviana) montada sobre ese adaptador, de modo que
+un hilo nuevo por request (como hace asgiref bajo uvicorn) no abre conexiones nuevas.
+
+Para las vistas async hay ``aget``/``apost``/... y ``afan_out``:
+
+- bajo ASGI (SERVER_INTERFACE='asgi') usan un ``httpx.AsyncClient`` por event
+  loop; uvicorn tiene un único loop por proceso, o sea, un cliente por proceso;
+- bajo WSGI cada vista async corre en un event loop nuevo (async_to_sync), así que
+  un cliente por loop sería una conexión nueva por request: las llamadas salen por
+  el pool sync desde los hilos de fan_out.
+
+Los errores de red se traducen a las excepciones de ``requests`` para que las
+vistas manejen un único tipo de error (requests.RequestException).
+
+Cada llamada (sync o async, también dentro de fan_out/afan_out) se registra en
+las métricas de la request en curso (``MetricasAPI``, ver APIMetricsMiddleware).
+
+Todas pasan además por un cortocircuito (``CircuitBreaker``): si la API acumula
+timeouts o errores 5xx seguidos, las llamadas fallan al instante con
+``CircuitOpenError`` (subclase de requests.ConnectionError) en vez de esperar el
+timeout completo, y quien tenga una copia en caché la sirve mientras tanto.
+"""
+import asyncio
+import contextvars
+import logging
+import sys
+import threading
+import time
+import weakref
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait
+from functools import partial
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+API_BASE_URL = getattr(settings, 'API_BASE_URL', 'http://localhost:3000/api')
+
+# Timeouts compartidos (segundos). Las vistas pueden sobreescribirlos con timeout=...
+DEFAULT_TIMEOUT = getattr(settings, 'API_TIMEOUT', 5)
+# Conexiones keep-alive que el proceso mantiene abiertas hacia la API
+POOL_MAXSIZE = getattr(settings, 'API_POOL_MAXSIZE', 32)
+# Hilos compartidos para lanzar llamadas independientes en paralelo (fan_out)
+FANOUT_MAX_WORKERS = getattr(settings, 'API_FANOUT_MAX_WORKERS', 16)
+# Conexiones simultáneas del cliente async (por event loop)
+ASYNC_MAX_CONNECTIONS = getattr(settings, 'API_ASYNC_MAX_CONNECTIONS', 200)
+# Bajo ASGI las vistas async comparten un event loop por proceso (cliente httpx propio)
+ASYNC_NATIVO = getattr(settings, 'SERVER_INTERFACE', 'wsgi') == 'asgi'
+# Cortocircuito: fallos seguidos que lo abren (0 = desactivado) y segundos hasta la llamada de prueba
+CIRCUIT_FAILURES = getattr(settings, 'API_CIRCUIT_FAILURES', 5)
+CIRCUIT_RESET = getattr(settings, 'API_CIRCUIT_RESET', 30)
+
+_local = threading.local()  # requests.Session de cada hilo
+logger = logging.getLogger(__name__)
+
+
+# --- MÉTRICAS POR REQUEST ---
+
+class MetricasAPI:
+    """Cantidad, tiempo, status y bytes de las llamadas a la API durante UNA request."""
+    __slots__ = ('llamadas', 'duracion_ms', 'bytes', 'errores', 'rechazadas', 'por_status', '_lock')
+
+    def __init__(self):
+        self.llamadas = 0
+        self.duracion_ms = 0.0  # Suma de las llamadas (las paralelas se solapan en el tiempo real)
+        self.bytes = 0
+        self.errores = 0        # Sin respuesta: timeout o error de conexión
+        self.rechazadas = 0     # No salieron: circuito abierto
+        self.por_status = Counter()
+        self._lock = threading.Lock()  # fan_out registra desde varios hilos
+
+    def registrar(self, duracion_ms, status=None, bytes_=0):
+        with self._lock:
+            self.llamadas += 1
+            self.duracion_ms += duracion_ms
+            self.bytes += bytes_
+            if status is None:
+                self.errores += 1
+            else:
+                self.por_status[status] += 1
+
+    def registrar_rechazo(self):
+        with self._lock:
+            self.rechazadas += 1
+
+    def resumen(self):
+        return {
+            'api_calls': self.llamadas,
+            'api_ms': round(self.duracion_ms, 1),
+            'api_bytes': self.bytes,
+            'api_errors': self.errores,
+            'api_short_circuited': self.rechazadas,
+            'api_status': {str(k): v for k, v in self.por_status.items()},
+        }
+
+
+_metricas = contextvars.ContextVar('metricas_api', default=None)
+
+
+def iniciar_metricas():
+    """Empieza a medir las llamadas de la request actual. Devuelve (métricas, token)."""
+    metricas = MetricasAPI()
+    return metricas, _metricas.set(metricas)
+
+
+def terminar_metricas(token):
+    _metricas.reset(token)
+
+
+def _registrar(inicio, response=None):
+    metricas = _metricas.get()
+    if metricas is not None:
+        duracion_ms = (time.perf_counter() - inicio) * 1000
+        if response is None:
+            metricas.registrar(duracion_ms)
+        else:
+            metricas.registrar(duracion_ms, response.status_code, len(response.content))
+
+
+# --- CORTOCIRCUITO ---
+
+class CircuitOpenError(requests.ConnectionError):
+    """La API está degradada y el circuito abierto: la llamada no se hizo."""
+
+
+class CircuitBreaker:
+    """
+    Cortocircuito hacia la API, uno por proceso (compartido por hilos y event loops).
+
+    - cerrado: las llamadas salen normalmente. ``umbral`` fallos seguidos
+      (timeout, error de conexión o respuesta 5xx) lo abren.
+    - abierto: cada llamada lanza CircuitOpenError sin tocar la red.
+    - semiabierto: pasados ``espera`` segundos se deja salir UNA llamada de prueba;
+      si responde bien el circuito se cierra, si falla vuelve a abrirse.
+    """
+    CERRADO, ABIERTO, SEMIABIERTO = 'cerrado', 'abierto', 'semiabierto'
+
+    def __init__(self, umbral, espera, reloj=time.monotonic):
+        self.umbral = umbral
+        self.espera = espera
+        self._reloj = reloj
+        self._lock = threading.Lock()
+        self.estado = self.CERRADO
+        self.fallos = 0
+        self.abierto_en = 0.0
+        self.prueba_en = None  # Hora de la llamada de prueba en curso (semiabierto)
+
+    def antes_de_llamar(self):
+        """Lanza CircuitOpenError si la llamada no debe salir."""
+        if not self.umbral:
+            return
+        with self._lock:
+            if self.estado == self.CERRADO:
+                return
+            ahora = self._reloj()
+            if self.estado == self.ABIERTO and ahora - self.abierto_en >= self.espera:
+                self.estado = self.SEMIABIERTO
+                self.prueba_en = None
+            # Una sola prueba a la vez; si nunca terminó (p. ej. se canceló), otra tras la espera
+            if self.estado == self.SEMIABIERTO and (
+                    self.prueba_en is None or ahora - self.prueba_en >= self.espera):
+                self.prueba_en = ahora
+                return
+        raise CircuitOpenError(f"Circuito abierto hacia la API ({self.fallos} fallos seguidos)")
+
+    def registrar_exito(self):
+        with self._lock:
+            if self.estado != self.CERRADO:
+                logger.info("API: circuito cerrado, la API volvió a responder")
+            self.estado = self.CERRADO
+            self.fallos = 0
+            self.prueba_en = None
+
+    def registrar_fallo(self):
+        if not self.umbral:
+            return
+        with self._lock:
+            self.fallos += 1
+            if self.estado == self.SEMIABIERTO or (self.estado == self.CERRADO and self.fallos >= self.umbral):
+                logger.warning("API: circuito abierto tras %s fallos seguidos", self.fallos)
+                self.estado = self.ABIERTO
+                self.abierto_en = self._reloj()
+                self.prueba_en = None
+
+
+circuito = CircuitBreaker(CIRCUIT_FAILURES, CIRCUIT_RESET)
+
+
+def _antes_de_llamar():
+    try:
+        circuito.antes_de_llamar()
+    except CircuitOpenError:
+        metricas = _metricas.get()
+        if metricas is not None:
+            metricas.registrar_rechazo()
+        raise
+
+
+def _resultado(response):
+    """Cuenta la respuesta para el circuito: los 5xx son fallos de la API, el resto no."""
+    if response.status_code >= 500:
+        circuito.registrar_fallo()
+    else:
+        circuito.registrar_exito()
+
+
+_adapter = None
+_adapter_lock = threading.Lock()
+
+
+def _get_adapter():
+    """Pool de conexiones del proceso, compartido por las sesiones de todos los hilos."""
+    global _adapter
+    if _adapter is None:
+        with _adapter_lock:
+            if _adapter is None:
+                _adapter = HTTPAdapter(pool_connections=POOL_MAXSIZE, pool_maxsize=POOL_MAXSIZE)
+    return _adapter
+
+
+def _build_session():
+    session = requests.Session()
+    session.mount('http://', _get_adapter())
+    session.mount('https://', _get_adapter())
+    return session
+
+
+def get_session():
+    """Sesión del hilo actual (la crea si no existe) sobre el pool de conexiones del proceso."""
+    session = getattr(_local, 'session', None)
+    if session is None:
+        session = _build_session()
+        _local.session = session
+    return session
+
+
+def build_url(path):
+    """Acepta una URL completa o una ruta relativa a API_BASE_URL ('/usuarios')."""
+    if path.startswith(('http://', 'https://')):
+        return path
+    return f"{API_BASE_URL}{path}"
+
+
+def request(method, path, **kwargs):
+    """
+    Punto único de salida hacia la API. Mismos argumentos que ``requests.request``,
+    pero reutiliza la conexión del hilo y aplica el timeout por defecto.
+    Lanza las mismas excepciones que ``requests`` (requests.RequestException),
+    o CircuitOpenError sin llamar si el circuito está abierto.
+    """
+    kwargs.setdefault('timeout', DEFAULT_TIMEOUT)
+    _antes_de_llamar()
+    inicio = time.perf_counter()
+    try:
+        response = get_session().request(method, build_url(path), **kwargs)
+    except requests.RequestException:
+        _registrar(inicio)
+        circuito.registrar_fallo()
+        raise
+    _registrar(inicio, response)
+    _resultado(response)
+    return response
+
+
+def get(path, **kwargs):
+    return request('GET', path, **kwargs)
+
+
+def post(path, **kwargs):
+    return request('POST', path, **kwargs)
+
+
+def put(path, **kwargs):
+    return request('PUT', path, **kwargs)
+
+
+def delete(path, **kwargs):
+    return request('DELETE', path, **kwargs)
+
+
+# --- FAN-OUT: llamadas independientes en paralelo ---
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=FANOUT_MAX_WORKERS, thread_name_prefix='api-fanout')
+    return _executor
+
+
+def fan_out(tareas, defaults=None, timeout=None):
+    """
+    Ejecuta en paralelo varias consultas independientes a la API.
+
+    ``tareas`` es un dict nombre -> callable sin argumentos (usar functools.partial).
+    Devuelve un dict nombre -> resultado. Si una tarea lanza una excepción o no
+    termina dentro de ``timeout`` segundos (por defecto el timeout de la API + 1),
+    su resultado es ``defaults[nombre]`` (o None) y el resto no se ve afectado.
+    Cada llamada HTTP conserva además su propio timeout.
+    """
+    defaults = defaults or {}
+    if timeout is None:
+        timeout = DEFAULT_TIMEOUT + 1
+
+    executor = _get_executor()
+    # Cada tarea corre con una copia del contexto de la request (contextvars)
+    futures = {
+        executor.submit(contextvars.copy_context().run, fn): nombre
+        for nombre, fn in tareas.items()
+    }
+    wait(futures, timeout=timeout)
+
+    resultados = {}
+    for future, nombre in futures.items():
+        if not future.done():
+            future.cancel()
+            print(f"fan_out: '{nombre}' superó el timeout de {timeout}s", file=sys.stderr)
+            resultados[nombre] = defaults.get(nombre)
+        elif future.exception() is not None:
+            print(f"fan_out: '{nombre}' falló: {future.exception()}", file=sys.stderr)
+            resultados[nombre] = defaults.get(nombre)
+        else:
+            resultados[nombre] = future.result()
+    return resultados
+
+
+def en_segundo_plano(fn):
+    """
+    Encola ``fn`` (sin argumentos) en los mismos hilos de fan_out, sin esperarla:
+    recargas de caché que no deben bloquear la respuesta. Aunque venzan muchas
+    entradas a la vez, nunca corren más de FANOUT_MAX_WORKERS en paralelo.
+    No hereda el contexto de la request (sus llamadas no cuentan en sus métricas).
+    Devuelve False si no se pudo encolar (el proceso está terminando).
+    """
+    try:
+        _get_executor().submit(fn)
+    except RuntimeError:
+        return False
+    return True
+
+
+# --- CLIENTE ASYNC (vistas async / ASGI) ---
+
+_async_clients = weakref.WeakKeyDictionary()  # event loop -> httpx.AsyncClient
+# Contexto SSL compartido: crearlo carga los certificados (decenas de ms)
+_ssl_context = None
+
+
+def get_async_client():
+    """
+    Cliente async del event loop actual (pool keep-alive compartido por todas sus corrutinas).
+    Sólo bajo ASGI, donde el loop vive lo mismo que el proceso.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        global _ssl_context
+        if _ssl_context is None:
+            _ssl_context = httpx.create_ssl_context()
+        client = httpx.AsyncClient(
+            verify=_ssl_context,
+            timeout=DEFAULT_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=ASYNC_MAX_CONNECTIONS,
+                max_keepalive_connections=POOL_MAXSIZE,
+            ),
+        )
+        _async_clients[loop] = client
+    return client
+
+
+async def arequest(method, path, **kwargs):
+    """
+    Versión async de ``request``. Lanza requests.Timeout / requests.ConnectionError
+    (o CircuitOpenError, igual que la versión sync).
+    """
+    if not ASYNC_NATIVO:
+        # WSGI: el loop muere con la request; se usa el pool del proceso desde un hilo
+        # (con el contexto de la request, para las métricas)
+        llamada = partial(request, method, path, **kwargs)
+        return await asyncio.get_running_loop().run_in_executor(
+            _get_executor(), contextvars.copy_context().run, llamada
+        )
+
+    kwargs.setdefault('timeout', DEFAULT_TIMEOUT)
+    _antes_de_llamar()
+    inicio = time.perf_counter()
+    try:
+        response = await get_async_client().request(method, build_url(path), **kwargs)
+    except httpx.TimeoutException as e:
+        _registrar(inicio)
+        circuito.registrar_fallo()
+        raise requests.Timeout(str(e)) from e
+    except httpx.HTTPError as e:
+        _registrar(inicio)
+        circuito.registrar_fallo()
+        raise requests.ConnectionError(str(e)) from e
+    _registrar(inicio, response)
+    _resultado(response)
+    return response
+
+
+async def aget(path, **kwargs):
+    return await arequest('GET', path, **kwargs)
+
+
+async def apost(path, **kwargs):
+    return await arequest('POST', path, **kwargs)
+
+
+async def aput(path, **kwargs):
+    return await arequest('PUT', path, **kwargs)
+
+
+async def adelete(path, **kwargs):
+    return await arequest('DELETE', path, **kwargs)
+
+
+async def afan_out(tareas, defaults=None, timeout=None):
+    """
+    Versión async de ``fan_out``: ``tareas`` es un dict nombre -> corrutina.
+    Mismo contrato de timeouts y valores por defecto ante fallos parciales.
+    """
+    defaults = defaults or {}
+    if timeout is None:
+        timeout = DEFAULT_TIMEOUT + 1
+
+    nombres = list(tareas)
+    salidas = await asyncio.gather(
+        *(asyncio.wait_for(tareas[nombre], timeout) for nombre in nombres),
+        return_exceptions=True,
+    )
+
+    resultados = {}
+    for nombre, salida in zip(nombres, salidas):
+        if isinstance(salida, asyncio.TimeoutError):
+            print(f"afan_out: '{nombre}' superó el timeout de {timeout}s", file=sys.stderr)
+            resultados[nombre] = defaults.get(nombre)
+        elif isinstance(salida, Exception):
+            print(f"afan_out: '{nombre}' falló: {salida}", file=sys.stderr)
+            resultados[nombre] = defaults.get(nombre)
+        else:
+            resultados[nombre] = salida
+    return resultados
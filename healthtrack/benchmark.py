@@ -0,0 +1,218 @@
+"""
+Benchmark de las vistas principales contra la API simulada (healthtrack/fake_api.py).
+
+Arranca la API falsa en un hilo (puerto libre, latencia y tamaño de datos
+configurables), inicia sesión con un usuario de cada rol y recorre las vistas
+con el cliente de pruebas de Django, en paralelo si se pide concurrencia:
+
+    python -m healthtrack.benchmark --usuarios 2000 --dias 365 --latencia 40 -n 50 -c 4
+
+Por cada vista informa latencia p50/p95, throughput, errores y las llamadas a la
+API por request, junto con los bytes de la cookie de sesión y su tiempo de carga
+(leídos del header Server-Timing de APIMetricsMiddleware).
+"""
+import argparse
+import contextlib
+import json
+import math
+import os
+import re
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from healthtrack import fake_api
+
+# Usuarios de la API simulada: user1 está asignado a pro0 (ver FakeDatos)
+USUARIOS_POR_ROL = {'user': 'user1', 'pro': 'pro0', 'admin': 'admin0'}
+
+# (nombre, rol, url name, kwargs, query string)
+ESCENARIOS = [
+    ('home', 'user', 'home:index', {}, ''),
+    ('mensajes', 'user', 'home:mensajes', {}, ''),
+    ('mi_progreso', 'user', 'habitos:mi_progreso', {}, ''),
+    ('progreso_datos', 'user', 'habitos:progreso_datos', {}, 'habito=Hidratación'),
+    ('registros_fragmento', 'user', 'habitos:registros_fragmento', {}, ''),
+    ('registro_habito', 'user', 'habitos:registro_habito', {}, ''),
+    ('perfil', 'user', 'perfiles:ver_perfil', {}, ''),
+    ('pro_dashboard', 'pro', 'professional_panel:dashboard', {}, ''),
+    ('pro_pacientes', 'pro', 'professional_panel:listar_pacientes', {}, ''),
+    ('pro_detalle_paciente', 'pro', 'professional_panel:detalle_paciente', {'username': 'user1'}, ''),
+    ('admin_dashboard', 'admin', 'admin_panel:dashboard', {}, ''),
+    ('admin_usuarios', 'admin', 'admin_panel:listar_usuarios', {}, ''),
+]
+
+_RE_API_DUR = re.compile(r'(?:^|,\s*)api;dur=([\d.]+)')
+_RE_API_LLAMADAS = re.compile(r'api-llamadas;desc="(\d+)"')
+_RE_SESION = re.compile(r'sesion;dur=([\d.]+);desc="(\d+) B"')
+
+
+def percentil(valores, p):
+    """Percentil por rango más cercano (sin interpolar) de una lista ya ordenada."""
+    if not valores:
+        return 0.0
+    return valores[max(0, math.ceil(p / 100 * len(valores)) - 1)]
+
+
+def leer_server_timing(valor):
+    """
+    (ms en la API, llamadas a la API, ms de carga de la sesión, bytes de la cookie)
+    del header Server-Timing; ceros si no está.
+    """
+    dur = _RE_API_DUR.search(valor or '')
+    llamadas = _RE_API_LLAMADAS.search(valor or '')
+    sesion = _RE_SESION.search(valor or '')
+    return (
+        float(dur.group(1)) if dur else 0.0,
+        int(llamadas.group(1)) if llamadas else 0,
+        float(sesion.group(1)) if sesion else 0.0,
+        int(sesion.group(2)) if sesion else 0,
+    )
+
+
+def arrancar_api(usuarios, profesionales, dias, mensajes, latencia_ms):
+    """Levanta la API simulada en un hilo daemon y devuelve su URL base (con /api)."""
+    datos = fake_api.FakeDatos(usuarios, profesionales, dias_historial=dias, mensajes=mensajes)
+    servidor = fake_api.crear_servidor('127.0.0.1', 0, datos, latencia_ms=latencia_ms)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{servidor.server_address[1]}{fake_api.PREFIJO}'
+
+
+def iniciar_sesiones(roles):
+    """Cliente de Django con sesión iniciada por rol (cualquier contraseña vale en la API falsa)."""
+    from django.test import Client
+
+    clientes = {}
+    for rol in roles:
+        cliente = Client()
+        cliente.post('/account/login/', {'username': USUARIOS_POR_ROL[rol], 'password': 'benchmark'}, secure=True)
+        if not cliente.cookies:
+            raise RuntimeError(f"No se pudo iniciar sesión como {USUARIOS_POR_ROL[rol]}")
+        clientes[rol] = cliente
+    return clientes
+
+
+class _Clientes(threading.local):
+    """Un cliente de pruebas por hilo con las cookies de sesión de cada rol."""
+
+    def __init__(self, sesiones):
+        from django.test import Client
+
+        self.por_rol = {}
+        for rol, sesion in sesiones.items():
+            cliente = Client()
+            cliente.cookies = sesion.cookies.__class__(sesion.cookies)
+            self.por_rol[rol] = cliente
+
+
+def medir_vista(clientes, rol, url, iteraciones, concurrencia):
+    """Lanza ``iteraciones`` GET a la URL y devuelve el resumen de la vista."""
+
+    def una_peticion(_):
+        inicio = time.perf_counter()
+        response = clientes.por_rol[rol].get(url, secure=True)
+        ms = (time.perf_counter() - inicio) * 1000
+        # Las respuestas SSE/streaming no se consumen: sólo interesa el tiempo hasta la respuesta
+        api_ms, llamadas, sesion_ms, cookie_bytes = leer_server_timing(response.get('Server-Timing'))
+        return ms, response.status_code, api_ms, llamadas, sesion_ms, cookie_bytes
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrencia) as pool:
+        resultados = list(pool.map(una_peticion, range(iteraciones)))
+    total_s = time.perf_counter() - inicio
+
+    tiempos = sorted(r[0] for r in resultados)
+    estados = {}
+    for r in resultados:
+        estados[r[1]] = estados.get(r[1], 0) + 1
+    return {
+        'n': len(resultados),
+        'errores': sum(1 for r in resultados if not (200 <= r[1] < 300 or r[1] == 304)),
+        'status': estados,
+        'p50_ms': round(percentil(tiempos, 50), 1),
+        'p95_ms': round(percentil(tiempos, 95), 1),
+        'media_ms': round(statistics.fmean(tiempos), 1),
+        'req_s': round(len(resultados) / total_s, 1) if total_s else 0.0,
+        'api_llamadas': round(statistics.fmean(r[3] for r in resultados), 2),
+        'api_ms': round(statistics.fmean(r[2] for r in resultados), 1),
+        'sesion_ms': round(statistics.fmean(r[4] for r in resultados), 2),
+        'cookie_bytes': max(r[5] for r in resultados),
+    }
+
+
+def imprimir_reporte(reporte, salida=sys.stdout):
+    columnas = ('vista', 'n', 'err', 'p50 ms', 'p95 ms', 'req/s', 'api/req', 'api ms/req', 'cookie B', 'sesión ms')
+    filas = [
+        (nombre, r['n'], r['errores'], r['p50_ms'], r['p95_ms'], r['req_s'], r['api_llamadas'], r['api_ms'],
+         r['cookie_bytes'], r['sesion_ms'])
+        for nombre, r in reporte['vistas'].items()
+    ]
+    anchos = [max(len(str(c)), *(len(str(f[i])) for f in filas)) for i, c in enumerate(columnas)]
+    config = reporte['config']
+    print(
+        f"API simulada: {config['usuarios']} usuarios, {config['dias']} días de historial, "
+        f"latencia {config['latencia']} ms | {config['iteraciones']} requests por vista, "
+        f"concurrencia {config['concurrencia']}",
+        file=salida,
+    )
+    print('  '.join(str(c).ljust(a) for c, a in zip(columnas, anchos)), file=salida)
+    print('  '.join('-' * a for a in anchos), file=salida)
+    for fila in filas:
+        print('  '.join(str(v).ljust(a) for v, a in zip(fila, anchos)), file=salida)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de vistas de HealthTrack contra la API simulada')
+    parser.add_argument('--usuarios', type=int, default=200, help='Cantidad de usuarios (rol user)')
+    parser.add_argument('--profesionales', type=int, default=5)
+    parser.add_argument('--dias', type=int, default=90, help='Días de historial de hábitos por usuario')
+    parser.add_argument('--mensajes', type=int, default=40, help='Mensajes por conversación de chat')
+    parser.add_argument('--latencia', type=float, default=0, help='Latencia simulada por llamada a la API (ms)')
+    parser.add_argument('-n', '--iteraciones', type=int, default=20, help='Requests por vista')
+    parser.add_argument('-c', '--concurrencia', type=int, default=1, help='Requests simultáneos')
+    parser.add_argument('--vistas', help='Sólo estas vistas (nombres separados por coma)')
+    parser.add_argument('--sin-calentar', action='store_true',
+                        help='No hacer un request previo por vista (mide también cachés frías)')
+    parser.add_argument('--json', help='Guardar el reporte en este archivo JSON')
+    args = parser.parse_args()
+
+    escenarios = ESCENARIOS
+    if args.vistas:
+        pedidas = {v.strip() for v in args.vistas.split(',')}
+        desconocidas = pedidas - {e[0] for e in ESCENARIOS}
+        if desconocidas:
+            parser.error(f"Vistas desconocidas: {', '.join(sorted(desconocidas))}")
+        escenarios = [e for e in ESCENARIOS if e[0] in pedidas]
+
+    # La configuración de Django lee API_URL al importarse: la API falsa va primero
+    os.environ['API_URL'] = arrancar_api(
+        args.usuarios, args.profesionales, args.dias, args.mensajes, args.latencia
+    )
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'healthtrack.settings')
+    os.environ.setdefault('API_METRICS_LOG', 'False')
+
+    import django
+    django.setup()
+    from django.urls import reverse
+
+    reporte = {'config': vars(args), 'vistas': {}}
+    # Las vistas imprimen trazas de depuración: se descartan durante las mediciones
+    with open(os.devnull, 'w') as nulo, contextlib.redirect_stdout(nulo), contextlib.redirect_stderr(nulo):
+        sesiones = iniciar_sesiones({e[1] for e in escenarios})
+        clientes = _Clientes(sesiones)
+        for nombre, rol, url_name, kwargs, query in escenarios:
+            url = reverse(url_name, kwargs=kwargs) + (f'?{query}' if query else '')
+            if not args.sin_calentar:
+                clientes.por_rol[rol].get(url, secure=True)
+            reporte['vistas'][nombre] = medir_vista(clientes, rol, url, args.iteraciones, args.concurrencia)
+
+    imprimir_reporte(reporte)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(reporte, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    main()
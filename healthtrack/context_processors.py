@@ -1,67 +1,45 @@
-import requests
-from django.conf import settings
+from functools import partial
 
-API_BASE_URL = getattr(settings, 'API_BASE_URL', 'http://localhost:3000/api')
+from .services import get_user_role, obtener_datos_perfil
 
 """
-⚠️ Precaución Rendimiento:		
-La única desventaja es el rendimiento. 
-Estás haciendo una llamada a la API externa (requests.get) 
-para obtener el rol en cada solicitud HTTP (cada vez que se carga una página).
+Rendimiento:
+El rol y el perfil salen de la MISMA consulta a /usuarios/username/{username},
+memoizada por request en services.get_user_profile. Además, los valores se
+exponen como callables: el template los evalúa (y dispara la consulta) sólo
+si realmente los usa.
 """
-def get_firebase_user_role(username):
-    """Consulta la API para obtener el rol de Firebase de un usuario."""
-    try:
-        # Usa el endpoint que devuelve un usuario por username (router.get('/username/:username'))
-        url = f"{API_BASE_URL}/usuarios/username/{username}" 
-        resp = requests.get(url, timeout=5)
-        
-        if resp.status_code == 200:
-            data = resp.json()
-            # Asumiendo que la respuesta es {'rol': 'admin', ...} o similar
-            return data.get('rol', 'user').lower() 
-        
-        # Si no se encuentra (404) o error, por defecto es 'user'
-        return 'user' 
-        
-    except requests.RequestException:
-        # En caso de error de conexión, por defecto es 'user'
-        return 'user'
 
-def user_navigation_context(request):
+NAV_POR_ROL = {
+    'admin': ('includes/nav_admin.html', 'bg-danger'),             # 🚨 Color: Rojo
+    'profesional': ('includes/nav_profesional.html', 'bg-success'),  # 🚨 Color: Verde
+}
+NAV_DEFAULT = ('includes/nav_user.html', 'bg-primary')  # Default: 'user' - 🚨 Color: Azul
+
+
+def _nav_template(request):
+    return NAV_POR_ROL.get(get_user_role(request), NAV_DEFAULT)[0]
 
-    if request.user.is_authenticated:
-        username = request.user.username
-        
-        firebase_rol = get_firebase_user_role(username)
 
-        # 1. Definir la ruta del template de navegación
-        if firebase_rol == 'admin':
-            nav_template = 'includes/nav_admin.html'
-            nav_color_class = 'bg-danger' # 🚨 Color: Rojo
+def _nav_class(request):
+    return NAV_POR_ROL.get(get_user_role(request), NAV_DEFAULT)[1]
 
-        elif firebase_rol == 'profesional':
-            nav_template = 'includes/nav_profesional.html'
-            nav_color_class = 'bg-success' # 🚨 Color: Verde
 
-        else: # Default: 'user'
-            nav_template = 'includes/nav_user.html'
-            nav_color_class = 'bg-primary' # 🚨 Color: Azul
-            
+def user_navigation_context(request):
+
+    if request.user.is_authenticated:
         return {
-            'FIREBASE_ROL': firebase_rol,
-            'NAV_TEMPLATE': nav_template,
-            'NAV_CLASS': nav_color_class, 
+            'FIREBASE_ROL': partial(get_user_role, request),
+            'NAV_TEMPLATE': partial(_nav_template, request),
+            'NAV_CLASS': partial(_nav_class, request),
         }
     return {}
 
-from .services import obtener_datos_perfil
 
 def user_profile_context(request):
     """
     Context processor que añade 'user_profile' a todos los templates.
     """
     if request.user.is_authenticated:
-        datos_api = obtener_datos_perfil(request)
-        return {'user_profile': datos_api}
-    return {'user_profile': None}
\ No newline at end of file
+        return {'user_profile': partial(obtener_datos_perfil, request)}
+    return {'user_profile': None}
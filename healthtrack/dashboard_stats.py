@@ -0,0 +1,106 @@
+"""
+Contadores del dashboard administrativo precalculados.
+
+Se recorren TODOS los usuarios una sola vez, se guardan los contadores en la
+caché 'default' durante DASHBOARD_STATS_TTL segundos, y las vistas que
+modifican un usuario (editar rol, eliminar) los ajustan en el momento
+con ``actualizar_stats(antes, despues)``. Así los dashboards sólo leen enteros.
+
+Contadores (dict plano): total, profesionales, admins y activos;
+``inactivos`` se deriva al leer. Los conteos por profesional salen del índice
+de pacientes (healthtrack/patient_index.py).
+"""
+import sys
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import api_client
+
+STATS_KEY = 'dashboard_stats'
+
+# Serializa "leer -> ajustar -> guardar" dentro del proceso
+_lock = threading.Lock()
+
+
+def _contribucion(usuario):
+    """Lo que aporta un usuario a cada contador."""
+    aporte = Counter(total=1)
+    rol = usuario.get('rol') or 'user'
+    if rol == 'profesional':
+        aporte['profesionales'] += 1
+    elif rol == 'admin':
+        aporte['admins'] += 1
+    if usuario.get('activo') is True:
+        aporte['activos'] += 1
+    return aporte
+
+
+def calcular_stats(usuarios):
+    """Todos los contadores en UNA pasada sobre la lista de usuarios."""
+    contadores = Counter()
+    for usuario in usuarios:
+        contadores.update(_contribucion(usuario))
+    return dict(contadores)
+
+
+def _fetch_stats(headers):
+    resp = api_client.get('/usuarios', headers=headers)
+    if resp.status_code != 200:
+        print(f"Error API contadores dashboard: {resp.status_code}", file=sys.stderr)
+        return None
+    return calcular_stats(resp.json())
+
+
+def get_dashboard_stats(headers):
+    """
+    Contadores cacheados (se recalculan al expirar el TTL).
+    Devuelve None si la API responde con error; lanza requests.RequestException
+    si no hay conexión.
+    """
+    stats = cache.get(STATS_KEY)
+    if stats is None:
+        stats = _fetch_stats(headers)
+        if stats is not None:
+            cache.set(STATS_KEY, stats, settings.DASHBOARD_STATS_TTL)
+    return stats
+
+
+def resumen_admin(stats):
+    activos = stats.get('activos', 0)
+    return {
+        'total': stats.get('total', 0),
+        'profesionales': stats.get('profesionales', 0),
+        'admins': stats.get('admins', 0),
+        'activos': activos,
+        'inactivos': stats.get('total', 0) - activos,
+    }
+
+
+def invalidar_stats():
+    cache.delete(STATS_KEY)
+
+
+def actualizar_stats(antes, despues):
+    """
+    Ajusta los contadores tras una escritura: ``antes``/``despues`` son el usuario
+    antes y después del cambio (None si no existía / fue eliminado).
+    Si no hay contadores en caché no hace nada: se calcularán en la próxima lectura.
+    """
+    if antes is not None and 'rol' not in antes:
+        # No conocemos el estado previo del usuario: mejor recalcular
+        invalidar_stats()
+        return
+
+    with _lock:
+        stats = cache.get(STATS_KEY)
+        if stats is None:
+            return
+        contadores = Counter(stats)
+        if antes is not None:
+            contadores.subtract(_contribucion(antes))
+        if despues is not None:
+            contadores.update(_contribucion(despues))
+        cache.set(STATS_KEY, {k: v for k, v in contadores.items() if v}, settings.DASHBOARD_STATS_TTL)
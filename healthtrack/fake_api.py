@@ -0,0 +1,464 @@
+"""
+API de Node.js simulada, SOLO para desarrollo local y pruebas de rendimiento.
+
+Implementa el subconjunto de endpoints que consume Django con datos generados
+en memoria (usuarios con listado filtrado y paginado, hábitos, registros, chat y
+recomendaciones), con latencia opcional por llamada:
+
+    python -m healthtrack.fake_api --port 3000 --usuarios 5000 --latencia 40
+
+y luego, en otra terminal, API_URL=http://localhost:3000/api python manage.py runserver
+(cualquier contraseña es válida; usuarios: admin0, pro0..., user0...).
+"""
+import argparse
+import json
+import re
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+PREFIJO = '/api'
+
+# Plantillas de /habitos-recomendados por objetivo (claves de home.forms.OBJETIVOS_CHOICES)
+RECOMENDACIONES = {
+    'vivir_saludable': {'titulo': 'Caminata diaria', 'descripcion': 'Camina 30 minutos a paso ligero.',
+                        'icono': 'person-walking', 'color': 'success'},
+    'aliviar_presion': {'titulo': 'Respiración consciente', 'descripcion': 'Cinco minutos de respiración lenta.',
+                        'icono': 'wind', 'color': 'info'},
+    'probar_cosas': {'titulo': 'Algo nuevo', 'descripcion': 'Prueba una actividad distinta cada semana.',
+                     'icono': 'stars', 'color': 'warning'},
+    'centrarme': {'titulo': 'Meditación', 'descripcion': 'Medita 10 minutos al día.',
+                  'icono': 'peace', 'color': 'primary'},
+    'mejor_relacion': {'titulo': 'Llamar a alguien', 'descripcion': 'Habla con un amigo o familiar.',
+                       'icono': 'telephone', 'color': 'danger'},
+    'dormir_mejor': {'titulo': 'Sueño reparador', 'descripcion': 'Duerme al menos 8 horas.',
+                     'icono': 'moon-stars', 'color': 'primary'},
+}
+
+
+class FakeDatos:
+    """Usuarios generados en memoria (protegidos con un lock: el servidor usa un hilo por request)."""
+
+    def __init__(self, usuarios=200, profesionales=5, admins=1, dias_historial=90, mensajes=40):
+        self.lock = threading.Lock()
+        self.usuarios = []
+        self.dias_historial = dias_historial
+        self.mensajes = mensajes
+        self.habitos = {}    # username -> definiciones (se generan al primer acceso)
+        self.registros = {}  # username -> registros de hábitos
+        self.chats = {}      # username paciente -> mensajes en orden cronológico
+        for i in range(admins):
+            self._agregar(f"admin{i}", 'admin')
+        for i in range(profesionales):
+            self._agregar(f"pro{i}", 'profesional')
+        for i in range(usuarios):
+            asignado = f"uid-pro{(i // 3) % profesionales}" if profesionales and i % 3 else None
+            self._agregar(f"user{i}", 'user', activo=i % 4 != 0, assigned=asignado)
+
+    def _agregar(self, username, rol, activo=True, assigned=None):
+        uid = f"uid-{username}"
+        usuario = {
+            'id': uid,
+            'uid': uid,
+            'firebaseUid': uid,
+            'username': username,
+            'email': f"{username}@healthtrack.local",
+            'nombre': username.capitalize(),
+            'apellido': 'Demo',
+            'rol': rol,
+            'activo': activo,
+            'objetivos': ['vivir_saludable', 'dormir_mejor'],
+        }
+        if assigned:
+            usuario['assignedProfessionalId'] = assigned
+        self.usuarios.append(usuario)
+
+    def por_username(self, username):
+        return next((u for u in self.usuarios if u['username'] == username), None)
+
+    def por_uid(self, uid):
+        return next((u for u in self.usuarios if u['uid'] == uid), None)
+
+    def _generar_habitos(self, username):
+        if username in self.habitos:
+            return
+        definiciones = [
+            {'id': f"{username}-agua", 'nombre': 'Hidratación', 'tipo_medicion': 'Numerico',
+             'meta': 8, 'unidad': 'vasos', 'frecuencia': 'diario', 'id_usuario': username},
+            {'id': f"{username}-meditar", 'nombre': 'Meditación', 'tipo_medicion': 'Binario',
+             'meta': 1, 'unidad': '', 'frecuencia': 'diario', 'id_usuario': username},
+        ]
+        hoy = date.today()
+        registros = []
+        for dia in range(self.dias_historial, 0, -1):
+            fecha = (hoy - timedelta(days=dia)).isoformat() + 'T12:00:00.000Z'
+            for i, d in enumerate(definiciones):
+                valor = (dia * 7 + i) % 10 if d['tipo_medicion'] == 'Numerico' else dia % 3 != 0
+                registros.append(self._registro(username, d, valor, fecha))
+        self.habitos[username] = definiciones
+        self.registros[username] = registros
+
+    def _registro(self, username, definicion, valor, fecha, comentario=''):
+        return {
+            'id': f"reg-{username}-{len(self.registros.get(username, ()))}-{fecha}",
+            'id_habito_def': definicion['id'],
+            'id_usuario': username,
+            'nombre_habito': definicion['nombre'],
+            'tipo_medicion': definicion['tipo_medicion'],
+            'meta': definicion['meta'],
+            'valor_registrado': valor,
+            'comentario': comentario,
+            'fecha': fecha,
+        }
+
+    def chat_de(self, username):
+        if username not in self.chats:
+            usuario = self.por_username(username) or {}
+            profesional = (usuario.get('assignedProfessionalId') or 'uid-pro0').replace('uid-', '')
+            inicio = datetime.now(timezone.utc) - timedelta(hours=12 * self.mensajes)
+            self.chats[username] = [
+                self._mensaje(
+                    f"Mensaje {i} de la conversación",
+                    profesional if i % 2 == 0 else username,
+                    'profesional' if i % 2 == 0 else 'paciente',
+                    inicio + timedelta(hours=i * 12),
+                )
+                for i in range(self.mensajes)
+            ]
+        return self.chats[username]
+
+    def _mensaje(self, contenido, remitente_id, remitente_tipo, momento=None):
+        momento = momento or datetime.now(timezone.utc)
+        return {
+            'contenido': contenido,
+            'remitente_id': remitente_id,
+            'remitente_tipo': remitente_tipo,
+            'timestamp': momento.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z',
+        }
+
+    def habitos_de(self, username):
+        self._generar_habitos(username)
+        return self.habitos[username]
+
+    def registros_de(self, username):
+        self._generar_habitos(username)
+        return self.registros[username]
+
+
+def _filtrar_usuarios(usuarios, query):
+    rol = query.get('rol')
+    activo = query.get('activo')
+    asignado = query.get('assignedProfessionalId')
+    resultado = []
+    for u in usuarios:
+        if rol and u.get('rol') != rol:
+            continue
+        if activo in ('true', 'false') and bool(u.get('activo')) != (activo == 'true'):
+            continue
+        if asignado == 'none' and u.get('assignedProfessionalId'):
+            continue
+        if asignado and asignado != 'none' and u.get('assignedProfessionalId') != asignado:
+            continue
+        resultado.append(u)
+    return resultado
+
+
+def _paginar(items, query):
+    """Página ``?limit=&cursor=`` (cursor = offset) con la forma {'data', 'nextCursor', 'total'}."""
+    limit = max(1, int(query['limit']))
+    inicio = int(query.get('cursor') or 0)
+    fin = inicio + limit
+    return {
+        'data': items[inicio:fin],
+        'nextCursor': str(fin) if fin < len(items) else None,
+        'total': len(items),
+    }
+
+
+class FakeAPIHandler(BaseHTTPRequestHandler):
+    datos = None      # FakeDatos, lo asigna crear_servidor
+    latencia = 0.0    # Segundos de espera antes de cada respuesta (simula la red / Cloud Run)
+    protocol_version = 'HTTP/1.1'  # keep-alive, como la API real detrás de un balanceador
+    disable_nagle_algorithm = True  # headers y cuerpo van en dos writes: sin esto, +40 ms por ACK retrasado
+
+    # (método, ruta regex sin el prefijo /api, nombre del método handler)
+    RUTAS = [
+        ('POST', r'/auth/login', 'auth_login'),
+        ('GET', r'/usuarios', 'usuarios_listar'),
+        ('GET', r'/usuarios/username/(?P<username>[^/]+)', 'usuarios_detalle'),
+        ('PUT', r'/usuarios/assign/(?P<uid>[^/]+)', 'usuarios_asignar'),
+        ('PUT', r'/usuarios/admin/update/(?P<uid>[^/]+)', 'usuarios_actualizar_rol'),
+        ('PUT', r'/usuarios/perfil/(?P<uid>[^/]+)', 'usuarios_actualizar_perfil'),
+        ('DELETE', r'/usuarios/username/(?P<username>[^/]+)', 'usuarios_eliminar'),
+        ('GET', r'/habito-definicion/(?P<username>[^/]+)', 'habitos_listar'),
+        ('POST', r'/habito-definicion', 'habitos_crear'),
+        ('DELETE', r'/habito-definicion/(?P<id_habito>[^/]+)', 'habitos_eliminar'),
+        ('GET', r'/habito-registro/(?P<username>[^/]+)', 'registros_listar'),
+        ('POST', r'/habito-registro', 'registros_crear'),
+        ('POST', r'/habito-registro/lote', 'registros_crear_lote'),
+        ('GET', r'/chat/(?P<username>[^/]+)', 'chat_listar'),
+        ('POST', r'/chat/(?P<username>[^/]+)', 'chat_enviar'),
+        ('POST', r'/habitos-recomendados', 'recomendados'),
+    ]
+
+    def log_message(self, format, *args):
+        pass  # Sin log por request (ruido en benchmarks)
+
+    # --- Infraestructura ---
+
+    def _responder(self, status, payload=None):
+        cuerpo = json.dumps(payload if payload is not None else {}).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def _leer_json(self):
+        if not self._cuerpo:
+            return {}
+        try:
+            return json.loads(self._cuerpo)
+        except ValueError:
+            return {}
+
+    def _despachar(self, metodo):
+        # El cuerpo se lee siempre: con keep-alive, uno sin leer corrompe la request siguiente
+        largo = int(self.headers.get('Content-Length') or 0)
+        self._cuerpo = self.rfile.read(largo) if largo else b''
+        if self.latencia:
+            time.sleep(self.latencia)
+        url = urlparse(self.path)
+        ruta = url.path[len(PREFIJO):] if url.path.startswith(PREFIJO) else url.path
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        for metodo_ruta, patron, handler in self.RUTAS:
+            if metodo_ruta != metodo:
+                continue
+            match = re.fullmatch(patron, ruta)
+            if match:
+                return getattr(self, handler)(query, **match.groupdict())
+        return self._responder(404, {'error': f'Ruta no encontrada: {metodo} {url.path}'})
+
+    def do_GET(self):
+        self._despachar('GET')
+
+    def do_POST(self):
+        self._despachar('POST')
+
+    def do_PUT(self):
+        self._despachar('PUT')
+
+    def do_DELETE(self):
+        self._despachar('DELETE')
+
+    # --- Endpoints ---
+
+    def auth_login(self, query):
+        body = self._leer_json()
+        identifier = body.get('identifier')
+        with self.datos.lock:
+            usuario = next(
+                (u for u in self.datos.usuarios if identifier in (u['username'], u['email'])), None
+            )
+        if not usuario:
+            return self._responder(401, {'error': 'Credenciales inválidas'})
+        return self._responder(200, {'token': 'fake.' + 'x' * 60, 'user': usuario})
+
+    def usuarios_listar(self, query):
+        with self.datos.lock:
+            usuarios = _filtrar_usuarios(self.datos.usuarios, query)
+        if 'limit' not in query:
+            # Contrato antiguo: lista completa
+            return self._responder(200, usuarios)
+
+        return self._responder(200, _paginar(usuarios, query))
+
+    def usuarios_detalle(self, query, username):
+        with self.datos.lock:
+            usuario = self.datos.por_username(username)
+        if not usuario:
+            return self._responder(404, {'error': 'Usuario no encontrado'})
+        return self._responder(200, usuario)
+
+    def usuarios_asignar(self, query, uid):
+        body = self._leer_json()
+        with self.datos.lock:
+            usuario = self.datos.por_uid(uid)
+            if usuario:
+                usuario['assignedProfessionalId'] = body.get('professionalUid')
+        if not usuario:
+            return self._responder(404, {'error': 'Usuario no encontrado'})
+        return self._responder(200, usuario)
+
+    def usuarios_actualizar_rol(self, query, uid):
+        body = self._leer_json()
+        with self.datos.lock:
+            usuario = self.datos.por_uid(uid)
+            if usuario and body.get('rol'):
+                usuario['rol'] = body['rol']
+        if not usuario:
+            return self._responder(404, {'error': 'Usuario no encontrado'})
+        return self._responder(200, usuario)
+
+    def usuarios_actualizar_perfil(self, query, uid):
+        body = self._leer_json()
+        with self.datos.lock:
+            usuario = self.datos.por_uid(uid)
+            if usuario:
+                usuario.update(body)
+        if not usuario:
+            return self._responder(404, {'error': 'Usuario no encontrado'})
+        return self._responder(200, usuario)
+
+    def usuarios_eliminar(self, query, username):
+        with self.datos.lock:
+            usuario = self.datos.por_username(username)
+            if usuario:
+                self.datos.usuarios.remove(usuario)
+        if not usuario:
+            return self._responder(404, {'error': 'Usuario no encontrado'})
+        return self._responder(200, {'message': 'Usuario eliminado'})
+
+    def habitos_listar(self, query, username):
+        with self.datos.lock:
+            habitos = list(self.datos.habitos_de(username.lower()))
+        return self._responder(200, habitos)
+
+    def habitos_crear(self, query):
+        body = self._leer_json()
+        username = (body.get('id_usuario') or '').lower()
+        if not username or not body.get('nombre'):
+            return self._responder(400, {'error': 'id_usuario y nombre son obligatorios'})
+        with self.datos.lock:
+            habitos = self.datos.habitos_de(username)
+            habito = {**body, 'id': f"{username}-{len(habitos)}-{body['nombre']}"}
+            habitos.append(habito)
+        return self._responder(201, habito)
+
+    def habitos_eliminar(self, query, id_habito):
+        with self.datos.lock:
+            for habitos in self.datos.habitos.values():
+                for habito in habitos:
+                    if habito['id'] == id_habito:
+                        habitos.remove(habito)
+                        return self._responder(200, {'message': 'Hábito eliminado'})
+        return self._responder(404, {'error': 'Hábito no encontrado'})
+
+    def registros_listar(self, query, username):
+        with self.datos.lock:
+            registros = list(self.datos.registros_de(username.lower()))
+        if query.get('fecha'):
+            # Sólo los de un día (checklist de hoy)
+            registros = [r for r in registros if r['fecha'][:10] == query['fecha']]
+        if 'limit' not in query:
+            # Contrato antiguo: todos los registros
+            return self._responder(200, registros)
+
+        registros.sort(key=lambda r: r['fecha'], reverse=True)  # Más recientes primero
+        return self._responder(200, _paginar(registros, query))
+
+    def _crear_registro(self, body):
+        """(status, payload) de guardar un registro; llamar con el lock tomado."""
+        username = (body.get('id_usuario') or '').lower()
+        definicion = next(
+            (h for h in self.datos.habitos_de(username) if h['id'] == body.get('id_habito_def')), None
+        )
+        if definicion is None:
+            return 400, {'error': 'Hábito no encontrado'}
+        registro = self.datos._registro(
+            username, definicion, body.get('valor_registrado'),
+            body.get('fecha') or date.today().isoformat(), body.get('comentario') or '',
+        )
+        self.datos.registros[username].append(registro)
+        return 201, registro
+
+    def registros_crear(self, query):
+        body = self._leer_json()
+        with self.datos.lock:
+            status, payload = self._crear_registro(body)
+        return self._responder(status, payload)
+
+    def registros_crear_lote(self, query):
+        # {'registros': [...]} -> {'resultados': [{'ok': True, 'registro': {...}} | {'ok': False, 'error': ...}]}
+        registros = self._leer_json().get('registros')
+        if not isinstance(registros, list):
+            return self._responder(400, {'error': 'registros debe ser una lista'})
+        resultados = []
+        with self.datos.lock:
+            for body in registros:
+                status, payload = self._crear_registro(body)
+                resultados.append({'ok': True, 'registro': payload} if status == 201
+                                  else {'ok': False, 'error': payload['error']})
+        return self._responder(200, {'resultados': resultados})
+
+    def chat_listar(self, query, username):
+        since = query.get('since')
+        with self.datos.lock:
+            mensajes = self.datos.chat_de(username)
+            if since:
+                # Sólo los posteriores a ``since`` (ISO en UTC: se comparan como texto)
+                mensajes = [m for m in mensajes if m['timestamp'] > since]
+            else:
+                mensajes = list(mensajes)
+        return self._responder(200, mensajes)
+
+    def chat_enviar(self, query, username):
+        body = self._leer_json()
+        if not body.get('contenido'):
+            return self._responder(400, {'error': 'contenido es obligatorio'})
+        with self.datos.lock:
+            mensajes = self.datos.chat_de(username)
+            mensaje = self.datos._mensaje(body['contenido'], body.get('remitente_id'), body.get('remitente_tipo'))
+            if mensajes and mensaje['timestamp'] <= mensajes[-1]['timestamp']:
+                # Dos mensajes en el mismo milisegundo: mantener el orden estricto
+                ultimo = datetime.strptime(mensajes[-1]['timestamp'], '%Y-%m-%dT%H:%M:%S.%fZ')
+                mensaje['timestamp'] = (ultimo + timedelta(milliseconds=1)).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+            mensajes.append(mensaje)
+        return self._responder(201, mensaje)
+
+    def recomendados(self, query):
+        objetivos = self._leer_json().get('objetivos') or []
+        data = [RECOMENDACIONES[o] for o in objetivos if o in RECOMENDACIONES]
+        return self._responder(200, {'data': data})
+
+
+class FakeAPIServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # Muchas conexiones simultáneas en benchmarks
+
+
+def crear_servidor(host='127.0.0.1', port=3000, datos=None, latencia_ms=0):
+    """Crea (sin arrancar) el servidor. ``port=0`` elige un puerto libre."""
+    handler = type('FakeAPIHandlerConDatos', (FakeAPIHandler,), {
+        'datos': datos or FakeDatos(),
+        'latencia': latencia_ms / 1000,
+    })
+    return FakeAPIServer((host, port), handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='API de Node.js simulada para HealthTrack.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=3000)
+    parser.add_argument('--usuarios', type=int, default=200, help='Cantidad de usuarios (rol user)')
+    parser.add_argument('--profesionales', type=int, default=5)
+    parser.add_argument('--dias', type=int, default=90, help='Días de historial de hábitos por usuario')
+    parser.add_argument('--mensajes', type=int, default=40, help='Mensajes por conversación de chat')
+    parser.add_argument('--latencia', type=float, default=0, help='Latencia simulada por llamada (ms)')
+    args = parser.parse_args()
+
+    datos = FakeDatos(args.usuarios, args.profesionales, dias_historial=args.dias, mensajes=args.mensajes)
+    servidor = crear_servidor(args.host, args.port, datos, latencia_ms=args.latencia)
+    print(f"API simulada en http://{args.host}:{args.port}{PREFIJO} (Ctrl+C para salir)")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+
+
+if __name__ == '__main__':
+    main()
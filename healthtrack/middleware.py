@@ -1,14 +1,59 @@
+import json
+import sys
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
 from django.shortcuts import redirect
 from django.urls import reverse
 from django.conf import settings
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from . import api_client
+
 
-class ProfileCompletionMiddleware:
+class AsyncCapableMixin:
+    """
+    Permite que un middleware funcione tanto bajo WSGI como bajo ASGI sin que Django
+    tenga que adaptar la cadena a modo síncrono (lo que anularía las vistas async).
+    La subclase implementa ``__acall__`` para el modo async.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def _init_mode(self):
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+
+class StaticFilesMiddleware(AsyncCapableMixin, WhiteNoiseMiddleware):
+    """WhiteNoise con soporte async: busca el estático en memoria y, si no es uno, sigue la cadena."""
+    def __init__(self, get_response=None, settings=settings):
+        super().__init__(get_response, settings)
+        self._init_mode()
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = self.find_file(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return self.serve(static_file, request)
+        return await self.get_response(request)
+
+
+class ProfileCompletionMiddleware(AsyncCapableMixin):
     """
     Bloquea el acceso a todas las páginas excepto a la de perfil hasta
     que el usuario tenga el campo 'is_active' en True.
     """
     def __init__(self, get_response):
         self.get_response = get_response
+        self._init_mode()
         
         # URL a la que se redirige forzadamente (la vista de completar perfil)
         self.completion_url = reverse('home:completar_perfil')
@@ -21,11 +66,11 @@ class ProfileCompletionMiddleware:
             self.completion_url,
         ]
 
-    def __call__(self, request):
-        
+    def _check(self, request):
+        """Devuelve la redirección a completar perfil si corresponde, o None."""
         # Si el usuario no está autenticado, no hacemos nada (ya lo maneja @login_required)
         if not request.user.is_authenticated:
-            return self.get_response(request)
+            return None
         
         # Obtener la ruta actual
         current_path = request.path_info
@@ -42,5 +87,85 @@ class ProfileCompletionMiddleware:
                 return redirect(self.completion_url)
 
         # Si el perfil está completo (is_active=True), la petición sigue su curso normal
-        response = self.get_response(request)
-        return response
\ No newline at end of file
+        return None
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self._check(request) or self.get_response(request)
+
+    async def __acall__(self, request):
+        # _check sólo lee la cookie de sesión firmada (sin E/S), se puede llamar directo
+        return self._check(request) or await self.get_response(request)
+
+
+class APIMetricsMiddleware(AsyncCapableMixin):
+    """
+    Mide las llamadas a la API de Node.js que hace cada request (vista, context
+    processors y templates) y las publica:
+
+    - Header ``Server-Timing`` (visible en las DevTools del navegador):
+      ``api;dur=<ms sumados>, api-llamadas;desc="<n>", total;dur=<ms de la request>``
+      y, si la request usó la sesión, ``sesion;dur=<ms de carga>;desc="<bytes de la cookie> B"``
+    - Una línea JSON en stderr por request (Cloud Logging la indexa como structured log),
+      si API_METRICS_LOG está activo.
+
+    Va primero en MIDDLEWARE para incluir todo lo que ocurre dentro de la request.
+    Los estáticos (STATIC_URL, los sirve WhiteNoise) no se miden ni se loguean.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self._init_mode()
+
+    def _publicar(self, request, response, metricas, inicio):
+        total_ms = (time.perf_counter() - inicio) * 1000
+        response['Server-Timing'] = (
+            f'api;dur={metricas.duracion_ms:.1f}, '
+            f'api-llamadas;desc="{metricas.llamadas}", '
+            f'total;dur={total_ms:.1f}'
+        )
+        # Medición de healthtrack.sesion.SessionStore (carga_ms es None si no se leyó)
+        sesion = getattr(request, 'session', None)
+        carga_ms = getattr(sesion, 'carga_ms', None)
+        if carga_ms is not None:
+            response['Server-Timing'] += f', sesion;dur={carga_ms:.2f};desc="{sesion.cookie_bytes} B"'
+        if settings.API_METRICS_LOG:
+            registro = {
+                'message': 'request_metrics',
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'total_ms': round(total_ms, 1),
+                'session_cookie_bytes': getattr(sesion, 'cookie_bytes', 0),
+                'session_load_ms': round(carga_ms, 2) if carga_ms is not None else None,
+                **metricas.resumen(),
+            }
+            print(json.dumps(registro), file=sys.stderr)
+        return response
+
+    def _es_estatico(self, request):
+        return request.path_info.startswith(settings.STATIC_URL)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if self._es_estatico(request):
+            return self.get_response(request)
+        inicio = time.perf_counter()
+        metricas, token = api_client.iniciar_metricas()
+        try:
+            response = self.get_response(request)
+        finally:
+            api_client.terminar_metricas(token)
+        return self._publicar(request, response, metricas, inicio)
+
+    async def __acall__(self, request):
+        if self._es_estatico(request):
+            return await self.get_response(request)
+        inicio = time.perf_counter()
+        metricas, token = api_client.iniciar_metricas()
+        try:
+            response = await self.get_response(request)
+        finally:
+            api_client.terminar_metricas(token)
+        return self._publicar(request, response, metricas, inicio)
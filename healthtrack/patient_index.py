@@ -0,0 +1,110 @@
+"""
+Índice de pacientes por profesional, compartido por las vistas de professional_panel.
+
+Se construye en UNA pasada sobre la lista de usuarios y vive en memoria del
+proceso durante PATIENT_INDEX_TTL segundos (no pasa por la caché de Django:
+así no se deserializa la base de usuarios completa en cada request).
+Las asignaciones hechas desde este proceso lo actualizan en el momento;
+los cambios de otros procesos se ven al reconstruirlo.
+"""
+import sys
+import threading
+import time
+from itertools import islice
+
+from django.conf import settings
+
+from . import api_client
+from .services import SIN_ASIGNAR, uid_de  # SIN_ASIGNAR: bucket de pacientes disponibles
+
+
+class IndicePacientes:
+    """Pacientes (rol 'user') agrupados por assignedProfessionalId, en orden de la API."""
+
+    def __init__(self, usuarios):
+        self.construido_en = time.monotonic()
+        self.buckets = {SIN_ASIGNAR: {}}       # pro uid | SIN_ASIGNAR -> {uid paciente: usuario}
+        self.profesional_de = {}               # username paciente -> pro uid | SIN_ASIGNAR
+        for usuario in usuarios:
+            if (usuario.get('rol') or 'user') != 'user':
+                continue
+            bucket = usuario.get('assignedProfessionalId') or SIN_ASIGNAR
+            self.buckets.setdefault(bucket, {})[uid_de(usuario)] = usuario
+            self.profesional_de[usuario.get('username')] = bucket
+
+    def vencido(self):
+        return time.monotonic() - self.construido_en > settings.PATIENT_INDEX_TTL
+
+    def total(self, bucket):
+        return len(self.buckets.get(bucket, ()))
+
+    def pagina(self, bucket, cursor=None, limit=None):
+        """Misma forma que services.listar_usuarios: {'usuarios', 'next_cursor', 'total'}."""
+        pacientes = self.buckets.get(bucket, {})
+        limit = min(int(limit or settings.USER_LIST_PAGE_SIZE), settings.USER_LIST_MAX_PAGE_SIZE)
+        inicio = int(cursor) if cursor and str(cursor).isdigit() else 0
+        fin = inicio + limit
+        return {
+            'usuarios': list(islice(pacientes.values(), inicio, fin)),
+            'next_cursor': str(fin) if fin < len(pacientes) else None,
+            'total': len(pacientes),
+        }
+
+    def asignar(self, paciente_uid, pro_uid):
+        """
+        Mueve al paciente a la lista de ``pro_uid`` (sin reconstruir el índice).
+        Copia los dos buckets afectados en vez de modificarlos: otras requests
+        pueden estar paginándolos en ese momento.
+        """
+        for bucket, pacientes in list(self.buckets.items()):
+            usuario = pacientes.get(paciente_uid)
+            if usuario is None:
+                continue
+            usuario = {**usuario, 'assignedProfessionalId': pro_uid}
+            self.buckets[bucket] = {uid: u for uid, u in pacientes.items() if uid != paciente_uid}
+            self.buckets[pro_uid] = {**self.buckets.get(pro_uid, {}), paciente_uid: usuario}
+            self.profesional_de[usuario.get('username')] = pro_uid
+            return True
+        return False
+
+    def puede_ver(self, pro_uid, username):
+        """Un profesional no ve pacientes asignados a OTRO profesional."""
+        return self.profesional_de.get(username, SIN_ASIGNAR) in (SIN_ASIGNAR, pro_uid)
+
+
+_indice = None
+_lock = threading.Lock()
+
+
+def get_indice(headers):
+    """
+    Índice vigente; lo (re)construye si no existe o venció el TTL, una sola
+    construcción a la vez. Devuelve None si la API responde con error y lanza
+    requests.RequestException si no hay conexión.
+    """
+    global _indice
+    indice = _indice
+    if indice is not None and not indice.vencido():
+        return indice
+
+    with _lock:
+        if _indice is not None and not _indice.vencido():
+            return _indice  # Otro hilo lo reconstruyó mientras esperábamos
+        resp = api_client.get('/usuarios', headers=headers)
+        if resp.status_code != 200:
+            print(f"Error API índice de pacientes: {resp.status_code}", file=sys.stderr)
+            return indice  # El índice vencido es mejor que nada
+        _indice = IndicePacientes(resp.json())
+        return _indice
+
+
+def registrar_asignacion(paciente_uid, pro_uid):
+    with _lock:
+        if _indice is not None and not _indice.asignar(paciente_uid, pro_uid):
+            invalidar_indice()
+
+
+def invalidar_indice():
+    """Fuerza la reconstrucción en la próxima lectura (cambios de rol, eliminaciones)."""
+    global _indice
+    _indice = None
@@ -0,0 +1,66 @@
+"""
+Base para los tests de vistas contra la API simulada (healthtrack/fake_api.py).
+
+Cada clase de tests arranca la API falsa en un hilo (puerto libre) y redirige
+hacia ella las llamadas de ``api_client`` (todas pasan por ``build_url``), así las
+vistas recorren el mismo camino que en producción: sesión, cachés, circuito,
+métricas y templates. Usuarios: admin0, pro0..pro2 y user0... (ver FakeDatos;
+user1 está asignado a pro0 y user3 no tiene profesional).
+"""
+import re
+import threading
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import caches
+from django.test import Client, SimpleTestCase, override_settings
+
+from . import api_client, fake_api
+
+_RE_LLAMADAS = re.compile(r'api-llamadas;desc="(\d+)"')
+
+
+@override_settings(API_METRICS_LOG=False)
+class APIFalsaTestCase(SimpleTestCase):
+    usuarios = 12
+    dias_historial = 30
+    mensajes = 6
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.api_falsa = fake_api.FakeDatos(usuarios=cls.usuarios, profesionales=3,
+                                       dias_historial=cls.dias_historial, mensajes=cls.mensajes)
+        servidor = fake_api.crear_servidor(port=0, datos=cls.api_falsa)
+        threading.Thread(target=servidor.serve_forever, daemon=True).start()
+        cls.addClassCleanup(servidor.server_close)
+        cls.addClassCleanup(servidor.shutdown)
+
+        base_falsa = f"http://127.0.0.1:{servidor.server_address[1]}/api"
+        build_url = api_client.build_url
+
+        def hacia_api_falsa(path):
+            url = build_url(path)
+            if url.startswith(settings.API_BASE_URL):
+                return base_falsa + url[len(settings.API_BASE_URL):]
+            return url
+
+        patcher = mock.patch.object(api_client, 'build_url', hacia_api_falsa)
+        patcher.start()
+        cls.addClassCleanup(patcher.stop)
+
+    def setUp(self):
+        # Estado compartido del proceso: cada test empieza sin cachés y con el circuito cerrado
+        for alias in settings.CACHES:
+            caches[alias].clear()
+        api_client.circuito.registrar_exito()
+
+    def login(self, username):
+        """Cliente con la sesión de ``username`` (la API falsa acepta cualquier contraseña)."""
+        client = Client()
+        client.post('/account/login/', {'username': username, 'password': 'x'}, secure=True)
+        return client
+
+    def llamadas_api(self, response):
+        """Llamadas a la API que hizo la request (header Server-Timing de APIMetricsMiddleware)."""
+        return int(_RE_LLAMADAS.search(response['Server-Timing']).group(1))
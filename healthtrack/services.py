@@ -1,26 +1,370 @@
+import sys
+import threading
+import time
+
 import requests
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.core.cache import caches
+from . import api_client
 
-def obtener_datos_perfil(request):
+# Marca para distinguir "aún no consultado" de "consultado y sin datos (None)"
+_NO_CARGADO = object()
+
+
+def _fetch_perfil(username, token=None):
     """
-    Obtiene los datos del perfil del usuario desde la API externa.
-    Usa el token y username almacenados en la sesión.
+    Consulta /usuarios/username/{username} en la API externa (None si no existe).
+    Lanza requests.RequestException si la API no responde o devuelve un 5xx.
+    """
+    headers = {'Authorization': f'Bearer {token}'} if token else {}
+    response = api_client.get(f"{settings.API_BASE_URL}/usuarios/username/{username}", headers=headers)
+    if response.status_code == 200:
+        return response.json()
+    if response.status_code >= 500:
+        raise requests.HTTPError(f"{response.status_code} en /usuarios/username", response=response)
+    return None
+
+
+def _profile_cache():
+    return caches['perfiles']
+
+
+def _profile_key(username):
+    return f"perfil:{username}"
+
+
+def _respaldo_key(username):
+    # Última copia buena del perfil, con un TTL largo: se sirve sólo si la API no responde
+    return f"perfil_respaldo:{username}"
+
+
+def guardar_perfil(username, perfil):
+    """Guarda en caché un perfil recién descargado de la API (y registra su UID)."""
+    _profile_cache().set(_profile_key(username), perfil)
+    _profile_cache().set(_respaldo_key(username), perfil, timeout=settings.API_STALE_TTL)
+    recordar_uid(username, perfil)
+
+
+def _perfil_desde_api(username, token=None):
+    """Perfil fresco de la API; si está caída (o el circuito abierto), el último conocido."""
+    try:
+        perfil = _fetch_perfil(username, token)
+    except requests.RequestException as e:
+        print(f"Error al obtener datos del perfil desde API: {e}")
+        return _profile_cache().get(_respaldo_key(username))
+    if perfil is not None:
+        guardar_perfil(username, perfil)
+    return perfil
+
+
+def get_cached_profile(username, token=None):
+    """
+    Perfil de ``username`` desde la caché de proceso (TTL + LRU, ver CACHES['perfiles']).
+    Si no está o expiró, se consulta la API y se guarda.
+    """
+    perfil = _profile_cache().get(_profile_key(username))
+    if perfil is None:
+        perfil = _perfil_desde_api(username, token)
+    return perfil
+
+
+def invalidate_profile(*usernames):
+    """Descarta el perfil/rol cacheado (y su respaldo). Llamar después de cada escritura sobre el usuario."""
+    claves = [_profile_key(u) for u in usernames if u] + [_respaldo_key(u) for u in usernames if u]
+    _profile_cache().delete_many(claves)
+
+
+# --- UID POR USERNAME ---
+# Las mutaciones de la API (PUT /usuarios/admin/update/{uid}, ...) usan el UID técnico
+# y las vistas sólo reciben el username de la URL. Cada perfil descargado deja su UID
+# registrado (no cambia mientras exista la cuenta): las vistas lo resuelven sin
+# volver a pedir el perfil antes de cada escritura.
+
+def uid_de(usuario):
+    """Identificador técnico del usuario (el mismo que usan las URLs de la API)."""
+    return usuario.get('firebaseUid') or usuario.get('uid') or usuario.get('id')
+
+
+def _uid_key(username):
+    return f"uid:{username}"
+
+
+def recordar_uid(username, perfil):
+    uid = uid_de(perfil) if perfil else None
+    if username and uid:
+        _profile_cache().set(_uid_key(username), uid, timeout=None)
+
+
+def resolver_uid(username, token=None):
+    """UID de ``username``: registrado, del perfil cacheado o consultando la API (None si no existe)."""
+    uid = _profile_cache().get(_uid_key(username))
+    if uid is None:
+        perfil = get_cached_profile(username, token)  # Si va a la API, registra el UID
+        uid = uid_de(perfil) if perfil else None
+    return uid
+
+
+def olvidar_uid(username):
+    """Llamar al eliminar la cuenta: el username podría volver a registrarse con otro UID."""
+    _profile_cache().delete(_uid_key(username))
+
+
+def get_user_profile(request):
     """
+    Perfil del usuario autenticado, consultado como máximo UNA vez por request.
+
+    Los context processors y las vistas comparten este resultado (se guarda en
+    ``request._cached_user_profile``, igual que ``_cached_user`` en el middleware),
+    así cada página hace una sola llamada a /usuarios/username/{username}.
+    """
+    cached = getattr(request, '_cached_user_profile', _NO_CARGADO)
+    if cached is not _NO_CARGADO:
+        return cached
+
     session_data = request.session.get('user_session_data', {})
-    token = session_data.get('token')
     username = session_data.get('username')
+    perfil = get_cached_profile(username, session_data.get('token')) if username else None
+
+    request._cached_user_profile = perfil
+    return perfil
+
+
+def _rol_de_perfil(perfil):
+    if not perfil:
+        # Si no se encuentra (404) o hay error de conexión, por defecto es 'user'
+        return 'user'
+    return (perfil.get('rol') or 'user').lower()
+
+
+# --- ROL DESDE LA SESIÓN FIRMADA ---
+# Con NAV_ROLE_SOURCE='session' el rol sale de user_session_data (lo guarda login_view)
+# y sólo se revalida contra la API cada NAV_ROLE_REVALIDATE_MINUTES, o de inmediato
+# si un admin cambió el rol (la versión del servidor es mayor que la de la sesión).
+# La versión vive en la caché 'compartida' para que un cambio hecho en una instancia
+# llegue a las sesiones que atiende otra.
+
+def _role_cache():
+    return caches['compartida']
+
+
+def _role_version_key(username):
+    return f"rol_version:{username}"
+
+
+def get_role_version(username):
+    """Versión actual del rol de ``username`` (0 si nunca cambió)."""
+    return _role_cache().get(_role_version_key(username), 0)
 
-    if not token or not username:
-        return None
 
-    api_url = f"{settings.API_BASE_URL}/usuarios/username/{username}"
-    headers = {'Authorization': f'Bearer {token}'}
+def bump_role_version(username):
+    """Marca que el rol de ``username`` cambió: las sesiones abiertas lo revalidarán."""
+    key = _role_version_key(username)
+    _role_cache().add(key, 0, timeout=None)
+    _role_cache().incr(key)
 
+
+def marcar_rol_en_sesion(session_data, rol, version=None):
+    """
+    Guarda en ``session_data`` el rol vigente junto con su versión y hora de verificación.
+    ``version`` es la leída ANTES de consultar el rol (por defecto, la actual).
+    """
+    session_data['rol'] = rol
+    session_data['is_staff'] = rol in ('admin', 'profesional')
+    session_data['is_superuser'] = rol == 'admin'
+    if version is None:
+        version = get_role_version(session_data.get('username'))
+    session_data['rol_version'] = version
+    session_data['rol_checked_at'] = int(time.time())
+
+
+_revalidando = set()
+_revalidando_lock = threading.Lock()
+
+
+def _revalidar_en_segundo_plano(username, token):
+    """Refresca la caché de perfiles sin bloquear la respuesta (una sola vez por usuario)."""
+    with _revalidando_lock:
+        if username in _revalidando:
+            return
+        _revalidando.add(username)
+
+    def liberar():
+        with _revalidando_lock:
+            _revalidando.discard(username)
+
+    def tarea():
+        try:
+            _perfil_desde_api(username, token)
+        finally:
+            liberar()
+
+    if not api_client.en_segundo_plano(tarea):
+        liberar()
+
+
+def _rol_desde_api(request, session_data):
+    """
+    Rol recién leído de la API, sin pasar por la caché de perfiles (None si no responde).
+    Esa caché es de ESTA instancia: si el cambio se hizo en otra, todavía puede tener
+    el rol anterior. El perfil fresco la reemplaza y queda memoizado para la request.
+    """
+    username = session_data['username']
     try:
-        response = requests.get(api_url, headers=headers, timeout=5)
-        if response.status_code == 200:
-            return response.json()
+        perfil = _fetch_perfil(username, session_data.get('token'))
     except requests.RequestException as e:
-        print(f"Error al obtener datos del perfil desde API: {e}")
-    
+        print(f"Error al revalidar el rol desde API: {e}", file=sys.stderr)
+        return None
+    if perfil is not None:
+        guardar_perfil(username, perfil)
+    else:
+        invalidate_profile(username)
+    request._cached_user_profile = perfil
+    return _rol_de_perfil(perfil)
+
+
+def _get_session_role(request, session_data):
+    username = session_data['username']
+    rol = session_data['rol']
+
+    # Sólo una versión MAYOR indica un cambio: si la caché compartida se vació
+    # (versión menor) no hay nada nuevo que revalidar
+    version = get_role_version(username)
+    if version > session_data.get('rol_version', 0):
+        # Cambio de rol: revalidar en esta misma request. Si la API no responde
+        # seguimos con el rol de la sesión SIN marcar la versión (se reintenta).
+        rol_api = _rol_desde_api(request, session_data)
+        if rol_api is None:
+            return rol
+        rol = rol_api
+    else:
+        edad = time.time() - session_data.get('rol_checked_at', 0)
+        if edad < settings.NAV_ROLE_REVALIDATE_MINUTES * 60:
+            return rol
+        # Vencido: si otra request ya refrescó la caché la usamos; si no, se refresca
+        # en segundo plano y mientras tanto seguimos con el rol de la sesión, SIN
+        # renovar rol_checked_at (la próxima request toma el perfil ya refrescado).
+        perfil = _profile_cache().get(_profile_key(username))
+        if perfil is None:
+            _revalidar_en_segundo_plano(username, session_data.get('token'))
+            return rol
+        rol = _rol_de_perfil(perfil)
+
+    marcar_rol_en_sesion(session_data, rol, version)
+    request.session['user_session_data'] = session_data
+    request.session.modified = True
+    return rol
+
+
+def get_user_role_from_api(request):
+    """Rol a partir del perfil memoizado (caché de perfiles / API)."""
+    return _rol_de_perfil(get_user_profile(request))
+
+
+def get_user_role(request):
+    """Rol ('admin', 'profesional' o 'user') del usuario autenticado (memoizado por request)."""
+    rol = getattr(request, '_cached_user_role', None)
+    if rol is not None:
+        return rol
+    session_data = request.session.get('user_session_data', {})
+    if (settings.NAV_ROLE_SOURCE == 'session'
+            and session_data.get('rol') and session_data.get('username')):
+        rol = _get_session_role(request, session_data)
+    else:
+        rol = get_user_role_from_api(request)
+    request._cached_user_role = rol
+    return rol
+
+
+async def aget_user_role(request):
+    """
+    Versión para vistas async: llamarla antes de render(). Resolver el rol puede
+    consultar la API (bloqueante); así los context processors de la navegación
+    lo encuentran memoizado y no bloquean el event loop.
+    """
+    return await sync_to_async(get_user_role)(request)
+
+
+def obtener_datos_perfil(request):
+    """
+    Obtiene los datos del perfil del usuario desde la API externa.
+    Usa el token y username almacenados en la sesión.
+    """
+    session_data = request.session.get('user_session_data', {})
+    if not session_data.get('token') or not session_data.get('username'):
+        return None
+    return get_user_profile(request)
+
+
+# --- LISTADO DE USUARIOS: FILTROS Y PAGINACIÓN EN LA API ---
+# GET /usuarios?rol=&activo=&assignedProfessionalId=&limit=&cursor=
+# Respuesta paginada: {'data': [...], 'nextCursor': '...' | null, 'total': N}
+# Si la API aún devuelve la lista completa (array), se filtra y pagina aquí.
+
+SIN_ASIGNAR = 'none'  # assignedProfessionalId=none -> pacientes sin profesional asignado
+
+
+def _coincide(usuario, rol, activo, assigned_professional_id):
+    if rol is not None and (usuario.get('rol') or 'user') != rol:
+        return False
+    if activo is not None and bool(usuario.get('activo')) != activo:
+        return False
+    if assigned_professional_id == SIN_ASIGNAR:
+        return not usuario.get('assignedProfessionalId')
+    if assigned_professional_id is not None:
+        return usuario.get('assignedProfessionalId') == assigned_professional_id
+    return True
+
+
+def _paginar_local(usuarios, rol, activo, assigned_professional_id, cursor, limit):
+    filtrados = [u for u in usuarios if _coincide(u, rol, activo, assigned_professional_id)]
+    inicio = int(cursor) if cursor and str(cursor).isdigit() else 0
+    fin = inicio + limit
+    return {
+        'usuarios': filtrados[inicio:fin],
+        'next_cursor': str(fin) if fin < len(filtrados) else None,
+        'total': len(filtrados),
+    }
+
+
+def listar_usuarios(headers, rol=None, activo=None, assigned_professional_id=None, cursor=None, limit=None):
+    """
+    Una página de usuarios filtrada por la API.
+
+    Devuelve {'usuarios': [...], 'next_cursor': str | None, 'total': int | None}.
+    Lanza requests.RequestException si no hay conexión con la API.
+    """
+    limit = min(int(limit or settings.USER_LIST_PAGE_SIZE), settings.USER_LIST_MAX_PAGE_SIZE)
+    params = {'limit': limit}
+    if rol is not None:
+        params['rol'] = rol
+    if activo is not None:
+        params['activo'] = 'true' if activo else 'false'
+    if assigned_professional_id is not None:
+        params['assignedProfessionalId'] = assigned_professional_id
+    if cursor:
+        params['cursor'] = cursor
+
+    resp = api_client.get(f"{settings.API_BASE_URL}/usuarios", params=params, headers=headers)
+    if resp.status_code != 200:
+        print(f"Error API listar usuarios: {resp.status_code}")
+        return {'usuarios': [], 'next_cursor': None, 'total': 0}
+
+    data = resp.json()
+    if isinstance(data, dict):
+        return {
+            'usuarios': data.get('data', []),
+            'next_cursor': data.get('nextCursor'),
+            'total': data.get('total'),
+        }
+    # API sin paginación: compatibilidad
+    return _paginar_local(data, rol, activo, assigned_professional_id, cursor, limit)
+
+
+def parse_activo(valor):
+    """'true'/'false' de un querystring -> True/False (None si no se filtra)."""
+    if valor in ('true', '1'):
+        return True
+    if valor in ('false', '0'):
+        return False
     return None
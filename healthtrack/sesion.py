@@ -0,0 +1,90 @@
+"""
+Motor de sesiones de HealthTrack (SESSION_ENGINE = 'healthtrack.sesion').
+
+Con SESSION_STORE='cookie' (por defecto) la sesión sigue viajando en la cookie
+firmada, pero más chica:
+
+- ``user_session_data`` sólo guarda los campos que se leen de la sesión
+  (CAMPOS_SESION, ver ``recortar``); el resto del perfil sale de la caché de perfiles;
+- ``SerializadorCompacto`` la escribe con claves cortas. Django ya la comprime
+  con zlib al firmarla (signing.dumps(compress=True)); el JWT, que es lo más
+  pesado, no se puede acortar ni comprimir.
+
+Con SESSION_STORE='cache' la cookie sólo lleva un id opaco y los datos quedan en
+la caché 'sesiones' (SESSION_CACHE_ALIAS). Esa caché tiene que ser compartida entre
+instancias (p. ej. Redis); con locmem cada instancia tendría sus propias sesiones.
+
+En ambos casos ``SessionStore`` mide el tamaño de la cookie recibida y cuánto tarda
+en cargarse (verificar la firma y decodificar, o leer la caché); APIMetricsMiddleware
+lo publica en Server-Timing.
+"""
+import json
+import time
+
+from django.conf import settings
+
+if settings.SESSION_STORE == 'cache':
+    from django.contrib.sessions.backends.cache import SessionStore as _SessionStoreBase
+else:
+    from django.contrib.sessions.backends.signed_cookies import SessionStore as _SessionStoreBase
+
+# Campos de user_session_data -> clave corta en la cookie
+CLAVES_CORTAS = {
+    'uid': 'i',
+    'username': 'u',
+    'email': 'e',
+    'rol': 'r',
+    'token': 't',
+    'is_active': 'a',
+    'is_staff': 's',
+    'is_superuser': 'su',
+    'rol_version': 'rv',
+    'rol_checked_at': 'rc',
+    'nombre': 'n',
+    'objetivos': 'o',  # home.index pide las recomendaciones con ellos
+}
+CAMPOS_SESION = frozenset(CLAVES_CORTAS)
+_CLAVES_LARGAS = {corta: larga for larga, corta in CLAVES_CORTAS.items()}
+_DATOS_USUARIO = ('user_session_data', 'd')
+
+
+def recortar(datos):
+    """Sólo los campos de ``datos`` que se guardan en la sesión (CAMPOS_SESION)."""
+    return {k: v for k, v in datos.items() if k in CAMPOS_SESION}
+
+
+class SerializadorCompacto:
+    """
+    JSON con claves cortas para ``user_session_data`` (SESSION_SERIALIZER).
+    Las cookies escritas con el JSONSerializer de Django se siguen leyendo.
+    """
+
+    def dumps(self, obj):
+        larga, corta = _DATOS_USUARIO
+        if larga in obj:
+            obj = dict(obj)
+            obj[corta] = {CLAVES_CORTAS.get(k, k): v for k, v in obj.pop(larga).items()}
+        return json.dumps(obj, separators=(',', ':')).encode('latin-1')
+
+    def loads(self, data):
+        obj = json.loads(data.decode('latin-1'))
+        larga, corta = _DATOS_USUARIO
+        if corta in obj:
+            obj[larga] = {_CLAVES_LARGAS.get(k, k): v for k, v in obj.pop(corta).items()}
+        return obj
+
+
+class SessionStore(_SessionStoreBase):
+    """Sesión de Django que registra bytes de la cookie y tiempo de carga."""
+
+    def __init__(self, session_key=None):
+        super().__init__(session_key)
+        self.cookie_bytes = len(session_key or '')
+        self.carga_ms = None  # None: la request no usó la sesión
+
+    def load(self):
+        inicio = time.perf_counter()
+        try:
+            return super().load()
+        finally:
+            self.carga_ms = (time.perf_counter() - inicio) * 1000
@@ -29,8 +29,9 @@ INSTALLED_APPS = [
 
 
 MIDDLEWARE = [
+    'healthtrack.middleware.APIMetricsMiddleware',  # Server-Timing + log de llamadas a la API
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'healthtrack.middleware.StaticFilesMiddleware',  # WhiteNoise con soporte async (ASGI)
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -73,6 +74,78 @@ DATABASES = {
     }
 }
 
+# Listados de usuarios paginados por la API (admin_panel / professional_panel)
+USER_LIST_PAGE_SIZE = int(os.environ.get('USER_LIST_PAGE_SIZE', '25'))
+USER_LIST_MAX_PAGE_SIZE = 100
+
+# Contadores de los dashboards (healthtrack/dashboard_stats.py): segundos antes de recalcular
+DASHBOARD_STATS_TTL = int(os.environ.get('DASHBOARD_STATS_TTL', '60'))
+# Índice profesional -> pacientes (healthtrack/patient_index.py): segundos antes de reconstruirlo
+PATIENT_INDEX_TTL = int(os.environ.get('PATIENT_INDEX_TTL', '60'))
+
+# Definiciones de hábitos por usuario (seguimiento/services.py): segundos de vida de la copia local
+HABIT_DEFINITIONS_TTL = int(os.environ.get('HABIT_DEFINITIONS_TTL', '300'))
+# Checklist de hoy (qué hábitos ya se registraron): segundos de vida del índice del día
+HABIT_TODAY_TTL = int(os.environ.get('HABIT_TODAY_TTL', '300'))
+
+# Historial de registros de hábitos paginado (mi_progreso / expediente del paciente)
+RECORD_PAGE_SIZE = int(os.environ.get('RECORD_PAGE_SIZE', '20'))
+RECORD_MAX_PAGE_SIZE = 100
+
+# Caché de conversaciones del chat (professional_panel/services.py)
+CHAT_CACHE_MAX_CONVERSATIONS = int(os.environ.get('CHAT_CACHE_MAX_CONVERSATIONS', '1000'))
+CHAT_DELTA_INTERVAL = float(os.environ.get('CHAT_DELTA_INTERVAL', '2'))  # segundos entre consultas ?since=
+CHAT_FULL_REFRESH = int(os.environ.get('CHAT_FULL_REFRESH', '300'))  # segundos entre descargas completas
+# Stream de mensajes nuevos del widget (SSE): intervalo de consulta y duración máxima de cada conexión
+CHAT_STREAM_POLL = float(os.environ.get('CHAT_STREAM_POLL', '2'))
+CHAT_STREAM_MAX_SECONDS = int(os.environ.get('CHAT_STREAM_MAX_SECONDS', '55'))
+# Bajo WSGI el stream no queda abierto: el widget vuelve a consultar cada N segundos
+CHAT_POLL_INTERVAL = float(os.environ.get('CHAT_POLL_INTERVAL', '10'))
+
+# Recomendaciones por conjunto de objetivos (home/recomendaciones.py): segundos hasta recargarlas
+RECOMMENDATIONS_TTL = int(os.environ.get('RECOMMENDATIONS_TTL', '600'))
+
+# Gráficos de progreso (seguimiento/progress.py): máximo de puntos por serie
+PROGRESS_MAX_POINTS = int(os.environ.get('PROGRESS_MAX_POINTS', '120'))
+# Series ya armadas por usuario (se invalidan al registrar): segundos
+PROGRESS_SERIES_TTL = int(os.environ.get('PROGRESS_SERIES_TTL', '300'))
+
+# Rol de navegación: 'session' (user_session_data, revalidado cada N minutos) o 'api' (cada request)
+NAV_ROLE_SOURCE = os.environ.get('NAV_ROLE_SOURCE', 'session')
+NAV_ROLE_REVALIDATE_MINUTES = int(os.environ.get('NAV_ROLE_REVALIDATE_MINUTES', '5'))
+
+# Caché
+# 'perfiles': perfil/rol de usuarios por username (TTL + LRU acotado).
+# 'compartida': contadores que deben coincidir entre instancias (versión del rol).
+# LocMemCache expulsa primero las entradas usadas hace más tiempo al llegar a MAX_ENTRIES.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Estado que deben ver todas las instancias (versiones de rol): en producción un backend
+    # compartido (Redis, Memcached o DatabaseCache); locmem sólo sirve con una instancia
+    'compartida': {
+        'BACKEND': os.environ.get('SHARED_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('SHARED_CACHE_LOCATION', 'healthtrack-compartida'),
+        'TIMEOUT': None,
+    },
+    # Sesiones en el servidor (SESSION_STORE='cache'): en producción, un backend compartido
+    # entre instancias, p. ej. django.core.cache.backends.redis.RedisCache (requiere redis)
+    'sesiones': {
+        'BACKEND': os.environ.get('SESSION_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('SESSION_CACHE_LOCATION', 'healthtrack-sesiones'),
+    },
+    'perfiles': {
+        'BACKEND': os.environ.get('PROFILE_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('PROFILE_CACHE_LOCATION', 'healthtrack-perfiles'),
+        'TIMEOUT': int(os.environ.get('PROFILE_CACHE_TTL', '120')),  # segundos
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('PROFILE_CACHE_MAX_ENTRIES', '1000')),
+        },
+    },
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -122,6 +195,33 @@ SESSION_EXPIRE_AT_BROWSER_CLOSE = True
 
 API_BASE_URL = os.environ.get("API_URL", "http://localhost:3000/api").strip()
 
+# Cliente HTTP compartido (healthtrack/api_client.py)
+API_TIMEOUT = float(os.environ.get('API_TIMEOUT', '5'))  # segundos
+API_POOL_MAXSIZE = int(os.environ.get('API_POOL_MAXSIZE', '32'))  # conexiones keep-alive del proceso
+# 'wsgi' (gunicorn) o 'asgi' (uvicorn), igual que en el Dockerfile
+SERVER_INTERFACE = os.environ.get('SERVER_INTERFACE', 'wsgi')
+API_FANOUT_MAX_WORKERS = int(os.environ.get('API_FANOUT_MAX_WORKERS', '16'))  # hilos para llamadas en paralelo
+API_ASYNC_MAX_CONNECTIONS = int(os.environ.get('API_ASYNC_MAX_CONNECTIONS', '200'))  # cliente async (ASGI)
+API_METRICS_LOG = os.environ.get('API_METRICS_LOG', 'True') == 'True'  # línea JSON por request en stderr
+# Cortocircuito: N timeouts/5xx seguidos lo abren (0 = desactivado); llamada de prueba cada M segundos
+API_CIRCUIT_FAILURES = int(os.environ.get('API_CIRCUIT_FAILURES', '5'))
+API_CIRCUIT_RESET = int(os.environ.get('API_CIRCUIT_RESET', '30'))
+# Nivel de los logs de healthtrack (p. ej. cambios de estado del cortocircuito) en stderr
+API_LOG_LEVEL = os.environ.get('API_LOG_LEVEL', 'INFO')
+# Copias de respaldo (perfiles, recomendaciones) que se sirven si la API no responde
+API_STALE_TTL = int(os.environ.get('API_STALE_TTL', '86400'))  # segundos
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'stderr': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'healthtrack': {'handlers': ['stderr'], 'level': API_LOG_LEVEL, 'propagate': False},
+    },
+}
+
 AUTHENTICATION_BACKENDS = [
     'account.backend.NodeAPIBackend',
 ]
@@ -130,8 +230,12 @@ API_URL = API_BASE_URL
 # --- AJUSTES PARA CLOUD RUN / FIREBASE ---
 DEBUG = os.environ.get('DEBUG', 'False') == 'True'
 
-# 1. Motor de Sesiones (Stateless - Cookies Firmadas)
-SESSION_ENGINE = 'django.contrib.sessions.backends.signed_cookies'
+# 1. Motor de Sesiones (healthtrack/sesion.py)
+# 'cookie': stateless, cookie firmada con claves cortas | 'cache': sólo un id en la cookie
+SESSION_ENGINE = 'healthtrack.sesion'
+SESSION_STORE = os.environ.get('SESSION_STORE', 'cookie')
+SESSION_SERIALIZER = 'healthtrack.sesion.SerializadorCompacto'
+SESSION_CACHE_ALIAS = 'sesiones'
 
 # 2. Configuración Dinámica de Seguridad
 CSRF_TRUSTED_ORIGINS = [
@@ -0,0 +1,283 @@
+import io
+import threading
+import time
+from contextlib import redirect_stderr
+from unittest import mock
+
+import requests
+from django.contrib.sessions.serializers import JSONSerializer
+from django.core import signing
+from django.core.cache import caches
+from django.test import RequestFactory, SimpleTestCase
+
+from . import api_client, services
+from .api_client import CircuitBreaker, CircuitOpenError
+from .patient_index import IndicePacientes
+from .sesion import CAMPOS_SESION, SerializadorCompacto, SessionStore, recortar
+
+
+class RolDesdeSesionTests(SimpleTestCase):
+
+    def setUp(self):
+        caches['perfiles'].clear()
+        caches['compartida'].clear()
+        self.session_data = {'username': 'ana', 'rol': 'admin', 'token': 't'}
+        services.marcar_rol_en_sesion(self.session_data, 'admin')
+
+    def request(self):
+        request = RequestFactory().get('/')
+        request.session = SessionStore()
+        request.session['user_session_data'] = self.session_data
+        return request
+
+    def test_sin_cambios_no_consulta_la_api(self):
+        with mock.patch.object(services, '_fetch_perfil') as fetch:
+            self.assertEqual(services.get_user_role(self.request()), 'admin')
+        fetch.assert_not_called()
+
+    def test_version_nueva_lee_la_api_aunque_la_cache_tenga_el_rol_anterior(self):
+        # Perfil cacheado en ESTA instancia; el rol se cambió en otra
+        services.guardar_perfil('ana', {'username': 'ana', 'rol': 'admin'})
+        services.bump_role_version('ana')
+
+        request = self.request()
+        with mock.patch.object(services, '_fetch_perfil', return_value={'username': 'ana', 'rol': 'user'}):
+            self.assertEqual(services.get_user_role(request), 'user')
+
+        sesion = request.session['user_session_data']
+        self.assertEqual((sesion['rol'], sesion['rol_version']), ('user', 1))
+        self.assertEqual(caches['perfiles'].get(services._profile_key('ana'))['rol'], 'user')
+
+    def test_version_nueva_con_la_api_caida_no_marca_la_version(self):
+        services.bump_role_version('ana')
+
+        request = self.request()
+        with mock.patch.object(services, '_fetch_perfil', side_effect=requests.ConnectionError('caída')), \
+                redirect_stderr(io.StringIO()):
+            self.assertEqual(services.get_user_role(request), 'admin')
+        self.assertEqual(request.session['user_session_data']['rol_version'], 0)
+
+    def test_revalidacion_en_segundo_plano_una_sola_vez_y_en_los_hilos_compartidos(self):
+        liberar = threading.Event()
+        hilos = []
+
+        def perfil_lento(username, token):
+            hilos.append(threading.current_thread().name)
+            liberar.wait(2)
+
+        with mock.patch.object(services, '_perfil_desde_api', side_effect=perfil_lento):
+            services._revalidar_en_segundo_plano('ana', 't')
+            services._revalidar_en_segundo_plano('ana', 't')
+            liberar.set()
+            limite = time.monotonic() + 2
+            while 'ana' in services._revalidando and time.monotonic() < limite:
+                time.sleep(0.005)
+
+        self.assertEqual(len(hilos), 1)
+        self.assertTrue(hilos[0].startswith('api-fanout'))
+        self.assertNotIn('ana', services._revalidando)
+
+
+def usuarios_de_ejemplo():
+    return [
+        {'firebaseUid': 'p1', 'username': 'ana', 'rol': 'user', 'assignedProfessionalId': 'pro1'},
+        {'firebaseUid': 'p2', 'username': 'beto', 'rol': 'user'},
+        {'firebaseUid': 'p3', 'username': 'caro', 'rol': 'user', 'assignedProfessionalId': 'pro2'},
+        {'firebaseUid': 'pro1', 'username': 'dra_lopez', 'rol': 'profesional'},
+    ]
+
+
+class IndicePacientesTests(SimpleTestCase):
+
+    def setUp(self):
+        self.indice = IndicePacientes(usuarios_de_ejemplo())
+
+    def test_agrupa_pacientes_por_profesional(self):
+        self.assertEqual(list(self.indice.buckets['pro1']), ['p1'])
+        self.assertEqual(list(self.indice.buckets[services.SIN_ASIGNAR]), ['p2'])
+        self.assertEqual(self.indice.total('pro2'), 1)
+        self.assertNotIn('dra_lopez', self.indice.profesional_de)
+
+    def test_asignar_mueve_al_paciente_de_bucket(self):
+        self.assertTrue(self.indice.asignar('p2', 'pro1'))
+        self.assertEqual(list(self.indice.buckets['pro1']), ['p1', 'p2'])
+        self.assertEqual(self.indice.total(services.SIN_ASIGNAR), 0)
+        self.assertEqual(self.indice.buckets['pro1']['p2']['assignedProfessionalId'], 'pro1')
+        self.assertEqual(self.indice.profesional_de['beto'], 'pro1')
+
+    def test_asignar_no_modifica_los_buckets_que_se_estan_leyendo(self):
+        disponibles = self.indice.buckets[services.SIN_ASIGNAR]
+        self.indice.asignar('p2', 'pro1')
+        self.assertEqual(list(disponibles), ['p2'])
+        self.assertNotIn('assignedProfessionalId', disponibles['p2'])
+
+    def test_asignar_paciente_desconocido(self):
+        self.assertFalse(self.indice.asignar('no_existe', 'pro1'))
+
+    def test_puede_ver_sus_pacientes_y_los_disponibles(self):
+        self.assertTrue(self.indice.puede_ver('pro1', 'ana'))
+        self.assertTrue(self.indice.puede_ver('pro1', 'beto'))
+        self.assertFalse(self.indice.puede_ver('pro1', 'caro'))
+
+    def test_puede_ver_sigue_a_las_asignaciones(self):
+        self.indice.asignar('p2', 'pro2')
+        self.assertFalse(self.indice.puede_ver('pro1', 'beto'))
+        self.assertTrue(self.indice.puede_ver('pro2', 'beto'))
+
+
+class RelojFalso:
+    """Reloj controlable para CircuitBreaker (reemplaza a time.monotonic)."""
+
+    def __init__(self):
+        self.ahora = 1000.0
+
+    def __call__(self):
+        return self.ahora
+
+    def avanzar(self, segundos):
+        self.ahora += segundos
+
+
+class CircuitBreakerTests(SimpleTestCase):
+
+    def setUp(self):
+        self.reloj = RelojFalso()
+        self.circuito = CircuitBreaker(umbral=3, espera=30, reloj=self.reloj)
+        self.logger = self.enterContext(mock.patch.object(api_client, 'logger'))
+
+    def fallar(self, veces):
+        for _ in range(veces):
+            self.circuito.registrar_fallo()
+
+    def test_cerrado_deja_pasar_mientras_no_llegue_al_umbral(self):
+        self.fallar(2)
+        self.circuito.antes_de_llamar()
+        self.assertEqual(self.circuito.estado, CircuitBreaker.CERRADO)
+        self.logger.warning.assert_not_called()
+
+    def test_un_exito_reinicia_la_cuenta_de_fallos(self):
+        self.fallar(2)
+        self.circuito.registrar_exito()
+        self.fallar(2)
+        self.assertEqual(self.circuito.estado, CircuitBreaker.CERRADO)
+
+    def test_se_abre_al_llegar_al_umbral_y_rechaza_sin_llamar(self):
+        self.fallar(3)
+        self.assertEqual(self.circuito.estado, CircuitBreaker.ABIERTO)
+        self.logger.warning.assert_called_once()
+        with self.assertRaises(CircuitOpenError):
+            self.circuito.antes_de_llamar()
+
+    def test_tras_la_espera_deja_salir_una_sola_prueba(self):
+        self.fallar(3)
+        self.reloj.avanzar(29)
+        with self.assertRaises(CircuitOpenError):
+            self.circuito.antes_de_llamar()
+
+        self.reloj.avanzar(1)
+        self.circuito.antes_de_llamar()  # La llamada de prueba
+        self.assertEqual(self.circuito.estado, CircuitBreaker.SEMIABIERTO)
+        with self.assertRaises(CircuitOpenError):
+            self.circuito.antes_de_llamar()  # Mientras la prueba está en curso
+
+    def test_prueba_exitosa_cierra_el_circuito(self):
+        self.fallar(3)
+        self.reloj.avanzar(30)
+        self.circuito.antes_de_llamar()
+        self.circuito.registrar_exito()
+        self.assertEqual(self.circuito.estado, CircuitBreaker.CERRADO)
+        self.assertEqual(self.circuito.fallos, 0)
+        self.logger.info.assert_called_once()
+        self.circuito.antes_de_llamar()
+
+    def test_prueba_fallida_vuelve_a_abrir_con_una_espera_nueva(self):
+        self.fallar(3)
+        self.reloj.avanzar(30)
+        self.circuito.antes_de_llamar()
+        self.circuito.registrar_fallo()
+        self.assertEqual(self.circuito.estado, CircuitBreaker.ABIERTO)
+
+        self.reloj.avanzar(29)
+        with self.assertRaises(CircuitOpenError):
+            self.circuito.antes_de_llamar()
+        self.reloj.avanzar(1)
+        self.circuito.antes_de_llamar()
+
+    def test_prueba_que_nunca_termina_se_reintenta_tras_la_espera(self):
+        self.fallar(3)
+        self.reloj.avanzar(30)
+        self.circuito.antes_de_llamar()  # Prueba cancelada: no registra éxito ni fallo
+        self.reloj.avanzar(30)
+        self.circuito.antes_de_llamar()
+        self.assertEqual(self.circuito.estado, CircuitBreaker.SEMIABIERTO)
+
+    def test_umbral_cero_lo_desactiva(self):
+        circuito = CircuitBreaker(umbral=0, espera=30, reloj=self.reloj)
+        for _ in range(100):
+            circuito.registrar_fallo()
+        circuito.antes_de_llamar()
+        self.assertEqual(circuito.estado, CircuitBreaker.CERRADO)
+
+SALT = 'django.contrib.sessions.backends.signed_cookies'
+
+
+def sesion_de_ejemplo():
+    return {
+        'user_session_data': {
+            'uid': 'abc123',
+            'username': 'maria',
+            'email': 'maria@example.com',
+            'rol': 'user',
+            'token': 'eyJhbGciOi.payload.firma',
+            'is_active': True,
+            'is_staff': False,
+            'is_superuser': False,
+            'rol_version': 2,
+            'rol_checked_at': 1760000000,
+            'nombre': 'María',
+            'objetivos': ['dormir_mejor', 'centrarme'],
+        },
+        '_otra_clave': 'se conserva',
+    }
+
+
+class SerializadorCompactoTests(SimpleTestCase):
+
+    def setUp(self):
+        self.serializador = SerializadorCompacto()
+
+    def test_ida_y_vuelta_conserva_la_sesion(self):
+        sesion = sesion_de_ejemplo()
+        self.assertEqual(self.serializador.loads(self.serializador.dumps(sesion)), sesion)
+
+    def test_usa_claves_cortas(self):
+        datos = self.serializador.dumps(sesion_de_ejemplo())
+        self.assertNotIn(b'user_session_data', datos)
+        self.assertNotIn(b'"username"', datos)
+        self.assertLess(len(datos), len(JSONSerializer().dumps(sesion_de_ejemplo())))
+
+    def test_campos_desconocidos_pasan_sin_cambios(self):
+        sesion = {'user_session_data': {'username': 'maria', 'campo_nuevo': 1}}
+        self.assertEqual(self.serializador.loads(self.serializador.dumps(sesion)), sesion)
+
+    def test_no_modifica_el_dict_original(self):
+        sesion = sesion_de_ejemplo()
+        self.serializador.dumps(sesion)
+        self.assertEqual(sesion, sesion_de_ejemplo())
+
+    def test_lee_cookies_escritas_con_el_serializador_de_django(self):
+        cookie = signing.dumps(sesion_de_ejemplo(), compress=True, salt=SALT, serializer=JSONSerializer)
+        leida = signing.loads(cookie, salt=SALT, serializer=SerializadorCompacto)
+        self.assertEqual(leida, sesion_de_ejemplo())
+
+    def test_cookie_firmada_ida_y_vuelta(self):
+        cookie = signing.dumps(sesion_de_ejemplo(), compress=True, salt=SALT, serializer=SerializadorCompacto)
+        self.assertEqual(signing.loads(cookie, salt=SALT, serializer=SerializadorCompacto), sesion_de_ejemplo())
+
+
+class RecortarTests(SimpleTestCase):
+
+    def test_solo_quedan_los_campos_de_la_sesion(self):
+        perfil = {'username': 'maria', 'objetivos': ['centrarme'], 'peso': 60, 'hora_dormir': '23:00:00'}
+        self.assertEqual(recortar(perfil), {'username': 'maria', 'objetivos': ['centrarme']})
+        self.assertTrue(set(recortar(perfil)) <= CAMPOS_SESION)
@@ -0,0 +1,134 @@
+"""
+Recomendaciones de hábitos (/habitos-recomendados) compartidas entre usuarios.
+
+La respuesta depende sólo del CONJUNTO de objetivos del usuario (salen de
+OBJETIVOS_CHOICES, fijo y pequeño), así que se cachea por conjunto normalizado
+en la caché 'default' y la comparten todos los usuarios:
+
+- fresca (menos de RECOMMENDATIONS_TTL segundos): se sirve tal cual;
+- vencida: se sirve igual y se recarga en segundo plano (hilos de api_client)
+  (stale-while-revalidate; una sola recarga por conjunto a la vez);
+- ausente: se consulta la API (sólo el primer usuario de cada conjunto espera).
+
+Las entradas duran API_STALE_TTL segundos, así que también cubren las caídas de
+la API (o el circuito abierto): se sigue sirviendo la última respuesta buena.
+"""
+import sys
+import threading
+import time
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+
+from healthtrack import api_client
+
+RUTA = '/habitos-recomendados'
+
+
+def normalizar(objetivos):
+    """Conjunto de objetivos como tupla ordenada y sin repetidos."""
+    return tuple(sorted(set(objetivos or [])))
+
+
+def _cache_key(objetivos):
+    return 'recomendaciones:' + ','.join(objetivos)
+
+
+def _kwargs(objetivos, token=None):
+    # Preparamos headers (aunque este endpoint podría ser público, mejor enviar token por si acaso)
+    headers = {'Content-Type': 'application/json'}
+    if token:
+        headers['Authorization'] = f'Bearer {token}'
+    # Enviamos los objetivos a la API para que nos devuelva las plantillas coincidentes
+    return {'json': {'objetivos': list(objetivos)}, 'headers': headers}
+
+
+def _parse(response):
+    """Lista de plantillas; None si la API respondió con error (no se cachea)."""
+    if response.status_code == 200:
+        return response.json().get('data', [])  # Lista de objetos desde Firebase
+    print(f"Error API Recomendaciones: {response.status_code} - {response.text}", file=sys.stderr)
+    return None
+
+
+def _guardar(objetivos, recomendaciones):
+    entrada = {'recomendaciones': recomendaciones, 'guardado': time.time()}
+    cache.set(_cache_key(objetivos), entrada, settings.API_STALE_TTL)
+
+
+def _fetch(objetivos, token=None):
+    try:
+        recomendaciones = _parse(api_client.post(RUTA, **_kwargs(objetivos, token)))
+    except requests.RequestException as e:
+        print(f"Error de conexión API: {e}", file=sys.stderr)
+        return None
+    if recomendaciones is not None:
+        _guardar(objetivos, recomendaciones)
+    return recomendaciones
+
+
+async def _afetch(objetivos, token=None):
+    try:
+        recomendaciones = _parse(await api_client.apost(RUTA, **_kwargs(objetivos, token)))
+    except requests.RequestException as e:
+        print(f"Error de conexión API: {e}", file=sys.stderr)
+        return None
+    if recomendaciones is not None:
+        _guardar(objetivos, recomendaciones)
+    return recomendaciones
+
+
+_recargando = set()
+_recargando_lock = threading.Lock()
+
+
+def _recargar_en_segundo_plano(objetivos, token):
+    """Recarga el conjunto sin bloquear la respuesta (una sola recarga a la vez por conjunto)."""
+    with _recargando_lock:
+        if objetivos in _recargando:
+            return
+        _recargando.add(objetivos)
+
+    def liberar():
+        with _recargando_lock:
+            _recargando.discard(objetivos)
+
+    def tarea():
+        try:
+            _fetch(objetivos, token)
+        finally:
+            liberar()
+
+    # En los hilos compartidos de api_client: acotado aunque venzan muchos conjuntos a la vez
+    if not api_client.en_segundo_plano(tarea):
+        liberar()
+
+
+def _desde_cache(objetivos, token):
+    """Recomendaciones cacheadas (recargando si vencieron) o None si no hay copia."""
+    entrada = cache.get(_cache_key(objetivos))
+    if entrada is None:
+        return None
+    if time.time() - entrada['guardado'] >= settings.RECOMMENDATIONS_TTL:
+        _recargar_en_segundo_plano(objetivos, token)
+    return entrada['recomendaciones']
+
+
+def get_recomendaciones(mis_objetivos, token=None):
+    """Plantillas de hábitos recomendadas para la lista de objetivos ([] si no hay datos)."""
+    objetivos = normalizar(mis_objetivos)
+    recomendaciones = _desde_cache(objetivos, token)
+    if recomendaciones is None:
+        recomendaciones = _fetch(objetivos, token)
+    # Sin copia y con la API caída estará vacío, el template lo manejará
+    return recomendaciones or []
+
+
+async def aget_recomendaciones(mis_objetivos, token=None):
+    """Versión async de get_recomendaciones (vistas async)."""
+    objetivos = normalizar(mis_objetivos)
+    recomendaciones = _desde_cache(objetivos, token)
+    if recomendaciones is None:
+        recomendaciones = await _afetch(objetivos, token)
+    return recomendaciones or []
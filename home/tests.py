@@ -1,3 +1,110 @@
-from django.test import TestCase
+import re
+import threading
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+
+from healthtrack import api_client
+from healthtrack.pruebas import APIFalsaTestCase
+from professional_panel import services
+
+from . import recomendaciones
+
+_RE_CURSOR = re.compile(r'data-since="([^"]*)"')
+
+
+@override_settings(CHAT_FULL_REFRESH=0)  # Cada lectura ve la conversación completa de la API falsa
+class MensajesStreamViewTests(APIFalsaTestCase):
+
+    def setUp(self):
+        super().setUp()
+        services._conversaciones.clear()
+        self.client = self.login('user1')
+
+    def cursor_de_la_pagina(self):
+        pagina = self.client.get(reverse('home:mensajes'), {'mode': 'widget'}, secure=True)
+        return _RE_CURSOR.search(pagina.content.decode()).group(1)
+
+    def stream(self, **extra):
+        respuesta = self.client.get(reverse('home:mensajes_stream'), secure=True, **extra)
+        self.assertEqual(respuesta['Content-Type'], 'text/event-stream')
+        return respuesta.content.decode()
+
+    def test_sin_referencia_deja_el_cursor_actual_sin_enviar_mensajes(self):
+        cursor = self.cursor_de_la_pagina()
+        cuerpo = self.stream()
+        self.assertIn('retry: ', cuerpo)
+        self.assertIn(f"id: {cursor}\n\n", cuerpo)
+        self.assertNotIn('event: mensaje', cuerpo)
+
+    def test_envia_el_mensaje_nuevo_con_el_mismo_timestamp_que_el_cursor(self):
+        cursor = self.cursor_de_la_pagina()
+        chat = self.api_falsa.chat_de('user1')
+        chat.append({**chat[-1], 'contenido': 'Mismo segundo', 'remitente_tipo': 'paciente'})
+
+        cuerpo = self.stream(data={'since': cursor})
+        self.assertEqual(cuerpo.count('event: mensaje'), 1)
+        self.assertIn('Mismo segundo', cuerpo)
+
+        # EventSource reconecta con el id del último evento: no se repite
+        ultimo_id = re.findall(r'^id: (.+)$', cuerpo, re.MULTILINE)[-1]
+        self.assertNotIn('event: mensaje', self.stream(HTTP_LAST_EVENT_ID=ultimo_id))
+
+
+class CircuitoAbiertoTests(APIFalsaTestCase):
+
+    def setUp(self):
+        super().setUp()
+        services._conversaciones.clear()
+        self.client = self.login('user1')
+        self.logger = self.enterContext(mock.patch.object(api_client, 'logger'))
+
+    def abrir_circuito(self):
+        for _ in range(api_client.circuito.umbral):
+            api_client.circuito.registrar_fallo()
+        self.addCleanup(api_client.circuito.registrar_exito)
+
+    def test_el_chat_sirve_la_conversacion_cacheada_sin_llamar_a_la_api(self):
+        url = reverse('home:mensajes')
+        self.assertContains(self.client.get(url, secure=True), 'Mensaje 5 de la conversación')
+        services.invalidar_conversacion('user1')  # La próxima lectura consultaría la API
+        self.abrir_circuito()
+
+        respuesta = self.client.get(url, secure=True)
+        self.assertContains(respuesta, 'Mensaje 5 de la conversación')
+        self.assertEqual(self.llamadas_api(respuesta), 0)
+
+
+class RecomendacionesVencidasTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.objetivos = ('dormir_mejor',)
+        recomendaciones._guardar(self.objetivos, [{'titulo': 'Sueño reparador'}])
+        # Vencida: se sirve y se recarga en segundo plano
+        entrada = cache.get(recomendaciones._cache_key(self.objetivos))
+        entrada['guardado'] -= 10 ** 6
+        cache.set(recomendaciones._cache_key(self.objetivos), entrada)
+
+    def test_sirve_la_copia_y_recarga_una_sola_vez_en_los_hilos_compartidos(self):
+        liberar = threading.Event()
+        hilos = []
+
+        def fetch_lento(objetivos, token):
+            hilos.append(threading.current_thread().name)
+            liberar.wait(2)
+
+        with mock.patch.object(recomendaciones, '_fetch', side_effect=fetch_lento):
+            for _ in range(3):
+                self.assertEqual(recomendaciones.get_recomendaciones(['dormir_mejor']),
+                                 [{'titulo': 'Sueño reparador'}])
+            liberar.set()
+            limite = time.monotonic() + 2
+            while recomendaciones._recargando and time.monotonic() < limite:
+                time.sleep(0.005)
+
+        self.assertEqual(len(hilos), 1)
+        self.assertTrue(hilos[0].startswith('api-fanout'))
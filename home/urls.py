@@ -7,4 +7,5 @@ urlpatterns = [
     path('', views.index, name='index'),
     path('perfil/completar/', views.completar_perfil_view, name='completar_perfil'),
     path('mensajes/', views.mensajes_view, name='mensajes'),
+    path('mensajes/stream/', views.mensajes_stream_view, name='mensajes_stream'),
 ]
\ No newline at end of file
@@ -3,8 +3,11 @@ from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.conf import settings
 import requests
+from healthtrack import api_client, sesion
+from healthtrack.services import aget_user_role, invalidate_profile
 import sys
 from .forms import PerfilConfigForm 
+from .recomendaciones import aget_recomendaciones
 from professional_panel import services
 
 API_BASE_URL = getattr(settings, 'API_BASE_URL', 'http://localhost:3000/api')
@@ -13,7 +16,7 @@ def get_api_data(endpoint):
     """Función auxiliar para consultar la API."""
     try:
         url = f"{API_BASE_URL}{endpoint}"
-        resp = requests.get(url, timeout=5)
+        resp = api_client.get(url)
         if resp.status_code == 200:
             return resp.json()
     except requests.RequestException:
@@ -53,7 +56,7 @@ def completar_perfil_view(request):
             """
             try:
                 # 1. Llamada al endpoint PUT de Node.js
-                resp = requests.put(
+                resp = api_client.put(
                     f"{API_BASE_URL}/usuarios/perfil/{uid}", 
                     json = payload, 
                     #headers = headers,  -> Implementacion Token futura
@@ -65,10 +68,12 @@ def completar_perfil_view(request):
                 print(f"DEBUG API RESPONSE: {status} - {resp.text}", file=sys.stderr) 
 
                 if status in (200, 204):
-                    # Actualizar sesión local para que el Wizard funcione sin re-login
+                    invalidate_profile(request.user.username)
+                    # Actualizar sesión local para que el Wizard funcione sin re-login.
+                    # Sólo los campos que se leen de la sesión (objetivos): el resto del perfil
+                    # viajaría en la cookie en cada request; se lee de la caché de perfiles
                     user_data = request.session.get('user_session_data', {})
-                    user_data.update(payload)
-                    user_data['activo'] = True
+                    user_data.update(sesion.recortar(payload))
                     user_data['is_active'] = True # CRÍTICO: Actualizar bandera para Middleware local
                     request.session['user_session_data'] = user_data
                     request.session.modified = True
@@ -123,52 +128,29 @@ def completar_perfil_view(request):
 
 
 # VISTA DE home/index.html (Si el perfil ya está completo)
+# Vista async: mientras espera a la API no ocupa un hilo del servidor (ASGI)
 @login_required
-def index(request):
+async def index(request):
     # 1 Recuperar datos del usuario desde la sesión
     # Tambien se puede obtener de la API
-    user_data = request.session.get('user_session_data', {})
+    user_data = await request.session.aget('user_session_data', {})
     token = user_data.get('token')
 
     # Obtener la lista de objetivos
     # Si no hay objetivos, se muestra una lista vacía
     mis_objetivos = user_data.get('objetivos', [])
 
-    # 2. Diccionario Maestro de Recomendaciones (Hardcoded por ahora)
-    # Clave = El value del checkbox del Wizard
-    recomendaciones = []
-    
-    try:
-        # Preparamos headers (aunque este endpoint podría ser público, mejor enviar token por si acaso)
-        headers = {'Content-Type': 'application/json'}
-        if token:
-            headers['Authorization'] = f'Bearer {token}'
-
-        # Enviamos los objetivos a la API para que nos devuelva las plantillas coincidentes
-        response = requests.post(
-            f"{API_BASE_URL}/habitos-recomendados",
-            json={'objetivos': mis_objetivos},
-            headers=headers,
-            timeout=5
-        )
-
-        if response.status_code == 200:
-            respuesta_json = response.json() 
-            recomendaciones = respuesta_json.get('data', [])  # Lista de objetos desde Firebase
-            print('DEBUG: Recomendaciones: ', recomendaciones)
-        else:
-            print(f"Error API Recomendaciones: {response.status_code} - {response.text}")
-
-    except requests.RequestException as e:
-        print(f"Error de conexión API: {e}")
-        # Recomendaciones estará vacío, el template lo manejará
-
-    # 4. Obtener último comentario del profesional (Firestore)
-    mensajes = services.get_messages(patient_username=request.user.username)
-    # Filtrar solo los del profesional
-    mensajes_pro = [m for m in mensajes if m.get('is_from_professional')]
-    # Obtener el último (la lista viene ordenada ascendente por defecto en el servicio, así que el último es el último)
-    ultimo_comentario = mensajes_pro[-1] if mensajes_pro else None
+    # 2. Recomendaciones (cacheadas por conjunto de objetivos, ver home/recomendaciones.py)
+    # y 4. último comentario del profesional (Firestore) son independientes: en paralelo
+    datos = await api_client.afan_out(
+        {
+            'recomendaciones': aget_recomendaciones(mis_objetivos, token),
+            'ultimo_comentario': services.aget_last_professional_message(request.user.username),
+        },
+        defaults={'recomendaciones': [], 'ultimo_comentario': None},
+    )
+    recomendaciones = datos['recomendaciones']
+    ultimo_comentario = datos['ultimo_comentario']
 
     # 3. Contexto para el Template
     context = {
@@ -176,11 +158,18 @@ def index(request):
         'recomendaciones': recomendaciones,
         'ultimo_comentario': ultimo_comentario
     }
+    await aget_user_role(request)  # Rol de la navegación, antes de render()
     return render(request, 'home/index.html', context)
 
 from django.views.decorators.clickjacking import xframe_options_sameorigin
 
 from django.urls import reverse
+from django.http import HttpResponse, StreamingHttpResponse
+from django.template.loader import render_to_string
+from datetime import datetime, timezone
+import asyncio
+import json
+import time
 
 @login_required
 @xframe_options_sameorigin
@@ -191,12 +180,8 @@ def mensajes_view(request):
     comentarios = services.get_messages(patient_username=username)
     
     # Identificar al profesional con el que se habla (el último que escribió)
-    # Buscamos en la lista de mensajes el último que tenga is_from_professional=True
-    professional_username = None
-    for msg in reversed(comentarios):
-        if msg.get('is_from_professional'):
-            professional_username = msg.get('professional')
-            break
+    ultimo_pro = services.ultimo_de_profesional(comentarios)
+    professional_username = ultimo_pro.professional if ultimo_pro else None
 
     if request.method == 'POST':
         mensaje_texto = request.POST.get('mensaje')
@@ -213,12 +198,72 @@ def mensajes_view(request):
                 url += '?mode=widget'
             return redirect(url)
     
+    # Cursor del último mensaje: el stream del widget envía sólo los posteriores
     context = {
         'comentarios': comentarios,
-        'professional_username': professional_username
+        'professional_username': professional_username,
+        'cursor': services.cursor_final(comentarios) or '',
     }
     
     if request.GET.get('mode') == 'widget':
         return render(request, 'home/mensajes_widget.html', context)
         
     return render(request, 'home/mensajes.html', context)
+
+
+def _evento_mensaje(mensaje):
+    datos = {
+        'html': render_to_string('home/components/burbuja_mensaje.html', {'comentario': mensaje}),
+        'is_from_professional': mensaje.is_from_professional,
+    }
+    return f"id: {services.cursor_de(mensaje)}\nevent: mensaje\ndata: {json.dumps(datos)}\n\n"
+
+
+# Vista async (Server-Sent Events). Envía sólo los mensajes posteriores a
+# Last-Event-ID / ?since= (cursor del último recibido: timestamp + clave, ver
+# services.cursor_de), leídos de la caché de conversaciones (que pide a la API
+# sólo el delta ?since=).
+# - ASGI: la conexión queda abierta sin ocupar un hilo; se consulta cada
+#   CHAT_STREAM_POLL segundos y se cierra a los CHAT_STREAM_MAX_SECONDS.
+# - WSGI: Django consumiría el stream async entero antes de enviar el primer byte
+#   (y ocuparía un hilo todo ese tiempo), así que se responde al instante con lo
+#   pendiente y ``retry`` hace que EventSource vuelva a conectar a los
+#   CHAT_POLL_INTERVAL segundos (polling corto, sin cambios en el widget).
+@login_required
+async def mensajes_stream_view(request):
+    username = request.user.username
+    desde, visto = services.leer_cursor(request.headers.get('Last-Event-ID') or request.GET.get('since'))
+
+    inicio = []
+    if desde is None:
+        # Sin referencia: sólo lo que llegue a partir de ahora. El ``id`` (sin datos) deja
+        # esa referencia en EventSource para la reconexión aunque no llegue ningún mensaje.
+        cursor = await services.aget_last_cursor(username) or datetime.now(timezone.utc).isoformat()
+        desde, visto = services.leer_cursor(cursor)
+        inicio.append(f"id: {cursor}\n\n")
+
+    if settings.SERVER_INTERFACE != 'asgi':
+        eventos = [f"retry: {int(settings.CHAT_POLL_INTERVAL * 1000)}\n\n", *inicio]
+        eventos += [_evento_mensaje(m) for m in await services.aget_messages_since(username, desde, visto)]
+        response = HttpResponse(''.join(eventos), content_type='text/event-stream')
+    else:
+        async def eventos():
+            ultimo, ultimo_visto = desde, visto
+            limite = time.monotonic() + settings.CHAT_STREAM_MAX_SECONDS
+            yield "retry: 3000\n\n"
+            for evento in inicio:
+                yield evento
+            while True:
+                for mensaje in await services.aget_messages_since(username, ultimo, ultimo_visto):
+                    ultimo, ultimo_visto = mensaje.timestamp, services.clave_de(mensaje)
+                    yield _evento_mensaje(mensaje)
+
+                if time.monotonic() >= limite:
+                    return
+                yield ": ping\n\n"  # Mantiene viva la conexión y detecta clientes desconectados
+                await asyncio.sleep(settings.CHAT_STREAM_POLL)
+
+        response = StreamingHttpResponse(eventos(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Sin buffer en proxies (nginx)
+    return response
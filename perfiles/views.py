@@ -3,6 +3,7 @@ from django.contrib.auth.decorators import login_required
 from django.conf import settings
 from django.contrib import messages
 import requests
+from healthtrack import api_client, services, sesion
 
 API_BASE_URL = getattr(settings, 'API_BASE_URL', 'http://localhost:3000/api')
 USUARIO_API_URL = f"{API_BASE_URL}/usuarios"
@@ -17,24 +18,12 @@ def mi_perfil_view(request):
     user_data = user_session # Fallback inicial
 
     # 2. Intentar obtener el perfil completo desde la API (Firebase)
+    # Misma consulta (memoizada por request) que usan los context processors
     if token and username:
-        try:
-            headers = {
-                'Authorization': f'Bearer {token}',
-                'Content-Type': 'application/json'
-            }
-            resp = requests.get(f"{USUARIO_API_URL}/username/{username}", headers=headers, timeout=5)
-            
-            if resp.status_code == 200:
-                user_data = resp.json()
-                # Opcional: Actualizar la sesión con los datos frescos (cuidado con el token)
-                # user_data['token'] = token 
-                # request.session['user_session_data'] = user_data
-            else:
-                print(f"Error al obtener perfil: {resp.status_code}")
-                # No mostramos error al usuario para no interrumpir, usamos datos de sesión
-        except requests.RequestException as e:
-            print(f"Error de conexión API: {e}")
+        perfil_api = services.get_user_profile(request)
+        if perfil_api:
+            user_data = perfil_api
+        # Si falla, no mostramos error al usuario para no interrumpir, usamos datos de sesión
 
     # 3. Enriquecer objetivos con metadatos (iconos, textos)
     objetivos_usuario = user_data.get('objetivos', [])
@@ -83,20 +72,16 @@ def editar_perfil_view(request):
         # FETCH DATOS FRESCOS PARA PRE-POBLAR EL FORMULARIO
         # ---------------------------------------------------------
         if token and user_session.get('username'):
-            try:
-                username = user_session.get('username')
-                headers_api = {'Authorization': f'Bearer {token}'}
-                # Reutilizamos la URL de ver perfil
-                resp_fresh = requests.get(f"{USUARIO_API_URL}/username/{username}", headers=headers_api, timeout=4)
-                if resp_fresh.status_code == 200:
-                    fresh_data = resp_fresh.json()
-                    # Actualizamos initial_data con lo que viene de la BD
-                    initial_data.update(fresh_data)
-                    # Opcional: refrescar la sesión también para que no se quede vieja
-                    request.session['user_session_data'].update(fresh_data)
-                    request.session.modified = True
-            except Exception as e:
-                print(f"Warning: No se pudo refrescar datos perfil para edición: {e}", file=sys.stderr)
+            fresh_data = services.get_user_profile(request)
+            if fresh_data:
+                # Actualizamos initial_data con lo que viene de la BD
+                initial_data.update(fresh_data)
+                # Opcional: refrescar la sesión también para que no se quede vieja
+                # (sólo los campos que guarda la sesión, ver healthtrack/sesion.py)
+                request.session['user_session_data'].update(sesion.recortar(fresh_data))
+                request.session.modified = True
+            else:
+                print("Warning: No se pudo refrescar datos perfil para edición.", file=sys.stderr)
         # ---------------------------------------------------------
         
         # Asegurar formatos de hora para el formulario
@@ -138,14 +123,14 @@ def editar_perfil_view(request):
                     # 1. ACTUALIZAR IDENTIDAD (Si hay datos) -> PUT /usuarios/{uid}
                     if identity_payload:
                         print(f"DEBUG: Enviando Identity Update a {USUARIO_API_URL}/{uid}: {identity_payload}", file=sys.stderr)
-                        resp_ident = requests.put(
+                        resp_ident = api_client.put(
                             f"{USUARIO_API_URL}/{uid}",
                             json=identity_payload,
                             headers=headers,
                             timeout=10
                         )
                         if resp_ident.status_code in (200, 204):
-                             user_session.update(identity_payload)
+                             user_session.update(sesion.recortar(identity_payload))
                              success_msg.append("Datos personales")
                         else:
                             print(f"Error Identity Update: {resp_ident.text}", file=sys.stderr)
@@ -157,14 +142,14 @@ def editar_perfil_view(request):
                     # 2. ACTUALIZAR PERFIL DE SALUD (Si hay datos) -> PUT /usuarios/perfil/{uid}
                     if profile_payload:
                         print(f"DEBUG: Enviando Profile Update a {API_BASE_URL}/usuarios/perfil/{uid}: {profile_payload}", file=sys.stderr)
-                        resp_prof = requests.put(
+                        resp_prof = api_client.put(
                             f"{API_BASE_URL}/usuarios/perfil/{uid}", 
                             json=profile_payload, 
                             headers=headers,
                             timeout=10
                         )
                         if resp_prof.status_code in (200, 204):
-                            user_session.update(profile_payload)
+                            user_session.update(sesion.recortar(profile_payload))
                             success_msg.append("Perfil de salud")
                         else:
                              print(f"Error Profile Update: {resp_prof.text}", file=sys.stderr)
@@ -172,6 +157,8 @@ def editar_perfil_view(request):
 
                     # Gestión de sesión y Feedback
                     if success_msg:
+                        # El perfil cacheado (rol, datos) ya no es válido
+                        services.invalidate_profile(request.user.username, user_session.get('username'))
                         request.session['user_session_data'] = user_session
                         request.session.modified = True
                         messages.success(request, f"Actualizado correctamente: {', '.join(success_msg)}.")
@@ -205,7 +192,7 @@ def editar_perfil_view(request):
                                 # URL AUTH LOGIN (Ajustar según tu routing, asumo /auth/login)
                                 API_AUTH_LOGIN = f"{API_BASE_URL}/auth/login"
                                 
-                                login_resp = requests.post(API_AUTH_LOGIN, json=login_payload, timeout=5)
+                                login_resp = api_client.post(API_AUTH_LOGIN, json=login_payload)
                                 
                                 if login_resp.status_code == 200:
                                     # 2. Actualizar password (usando endpoint de update usuario con 'password')
@@ -216,11 +203,10 @@ def editar_perfil_view(request):
                                     # OJO: Se reutiliza target_uid definido arriba o se busca de nuevo
                                     target_uid_pwd = uid # El uid de la sesion
                                     
-                                    resp_pwd = requests.put(
+                                    resp_pwd = api_client.put(
                                         f"{USUARIO_API_URL}/{target_uid_pwd}", 
                                         json=update_pass_payload,
-                                        headers=headers,
-                                        timeout=5
+                                        headers=headers
                                     )
                                     
                                     if resp_pwd.status_code == 200:
@@ -274,7 +260,7 @@ def cambiar_password_view(request):
                     
                     headers = {'Authorization': f'Bearer {token}'} if token else {}
                     
-                    resp = requests.post(
+                    resp = api_client.post(
                         f"{API_BASE_URL}/auth/change-password",
                         json=payload,
                         headers=headers,
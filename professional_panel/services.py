@@ -1,50 +1,272 @@
-import requests
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from functools import lru_cache
+
 from django.conf import settings
+from healthtrack import api_client
 
 # URL base de tu API (definida en settings o hardcoded por ahora)
 API_BASE_URL = getattr(settings, 'API_BASE_URL', 'http://localhost:3000/api')
 
-from datetime import datetime
 
-# ... (imports)
+# --- MENSAJES ---
 
-def get_messages(patient_username):
-    """Obtiene los mensajes consultando la API de Node.js."""
+@dataclass(frozen=True, slots=True)
+class Mensaje:
+    """Un mensaje del chat, inmutable (se comparte entre requests desde la caché)."""
+    comment: str
+    professional: str
+    patient_username: str
+    is_from_professional: bool
+    timestamp: datetime | None  # None si la API no envió un timestamp ISO válido
+    id: str | None = None       # Id del mensaje en la API, si lo envía
+
+    @property
+    def created_at(self):
+        # Nombre que usan los templates
+        return self.timestamp
+
+
+@lru_cache(maxsize=8192)
+def parse_timestamp(valor):
+    """
+    Timestamp ISO 8601 de la API -> datetime con zona (None si no es válido).
+    Cacheado: los mismos timestamps se vuelven a parsear en cada descarga completa.
+    """
     try:
-        url = f"{API_BASE_URL}/chat/{patient_username}"
-        response = requests.get(url, timeout=5)
-        
-        if response.status_code == 200:
-            data_list = response.json()
-            # Mapear respuesta de la API a lo que espera el template
-            messages = []
-            for item in data_list:
-                # Parsear timestamp si es string
-                ts = item.get('timestamp')
-                if isinstance(ts, str):
-                    try:
-                        # Intenta formato ISO básico
-                        ts = datetime.fromisoformat(ts.replace('Z', '+00:00'))
-                    except ValueError:
-                        pass # Si falla, se deja como string (o se podría usar dateutil)
-
-                msg = {
-                    'comment': item.get('contenido', ''),
-                    'professional': item.get('remitente_id', ''),
-                    'patient_username': patient_username,
-                    'is_from_professional': item.get('remitente_tipo') == 'profesional',
-                    'created_at': ts, 
-                    'timestamp': ts
-                }
-                messages.append(msg)
-            return messages
+        ts = datetime.fromisoformat(valor)  # Python 3.11+ acepta el sufijo 'Z'
+    except (TypeError, ValueError):
+        print(f"Timestamp de chat inválido: {valor!r}")
+        return None
+    return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
+
+def normalizar_mensajes(data_list, patient_username):
+    """Mapea en bloque los mensajes de /chat/{username} a ``Mensaje``."""
+    parse = parse_timestamp
+    return [
+        Mensaje(
+            item.get('contenido', ''),
+            item.get('remitente_id', ''),
+            patient_username,
+            item.get('remitente_tipo') == 'profesional',
+            parse(ts) if isinstance(ts := item.get('timestamp'), str) else None,
+            item.get('id'),
+        )
+        for item in data_list
+    ]
+
+
+def _clave(mensaje):
+    # Identidad de un mensaje para no repetirlo: su id o, si la API no lo envía, su contenido
+    if mensaje.id is not None:
+        return mensaje.id
+    return (mensaje.timestamp, mensaje.professional, mensaje.is_from_professional, mensaje.comment)
+
+
+def sin_repetidos(mensajes, nuevos):
+    """
+    Los ``nuevos`` (un delta ``since``) que no están ya en ``mensajes``.
+    Compara fechas ya parseadas (no el texto ISO: 'Z' y '+00:00' o distinta
+    precisión de fracciones) y admite mensajes con el MISMO timestamp que el último.
+    """
+    ultimo = ultimo_timestamp(mensajes)
+    if ultimo is None:
+        vistos = {_clave(m) for m in mensajes}
+    else:
+        vistos = set()
+        for mensaje in reversed(mensajes):
+            if mensaje.timestamp is not None and mensaje.timestamp < ultimo:
+                break
+            vistos.add(_clave(mensaje))
+    return [
+        m for m in nuevos
+        if m.timestamp is not None and (ultimo is None or m.timestamp >= ultimo) and _clave(m) not in vistos
+    ]
+
+
+def clave_de(mensaje):
+    """Identidad corta y estable de un mensaje (``_clave`` resumida, para el cursor del stream)."""
+    return hashlib.md5(repr(_clave(mensaje)).encode()).hexdigest()[:12]
+
+
+def cursor_de(mensaje):
+    """
+    Referencia del stream del widget: '<timestamp ISO>~<clave>'. La clave distingue
+    los mensajes que comparten timestamp (varios en el mismo segundo).
+    """
+    return f"{mensaje.timestamp.isoformat()}~{clave_de(mensaje)}"
+
+
+def leer_cursor(valor):
+    """'<ISO>' o '<ISO>~<clave>' -> (datetime con zona, clave o None); (None, None) si no es válido."""
+    fecha, _, clave = (valor or '').partition('~')
+    try:
+        ts = datetime.fromisoformat(fecha)
+    except ValueError:
+        return None, None
+    return (ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)), clave or None
+
+
+def cursor_final(mensajes):
+    """Cursor del último mensaje con timestamp (None si ninguno)."""
+    ultimo = next((m for m in reversed(mensajes) if m.timestamp is not None), None)
+    return cursor_de(ultimo) if ultimo is not None else None
+
+
+def posteriores_a(mensajes, desde, visto=None):
+    """
+    Mensajes posteriores al cursor (``desde``, ``visto``), en orden ascendente.
+    Los que comparten el timestamp ``desde`` sólo se envían si van DESPUÉS del
+    mensaje ``visto`` (clave del último ya enviado); sin ``visto`` se dan por enviados.
+    Recorre desde el final.
+    """
+    nuevos = []
+    for mensaje in reversed(mensajes):
+        if mensaje.timestamp is None:
+            continue
+        if mensaje.timestamp < desde:
+            break
+        if mensaje.timestamp == desde and (visto is None or clave_de(mensaje) == visto):
+            break
+        nuevos.append(mensaje)
+    nuevos.reverse()
+    return nuevos
+
+
+def ultimo_timestamp(mensajes):
+    """Timestamp del último mensaje que lo tiene (None si ninguno)."""
+    return next((m.timestamp for m in reversed(mensajes) if m.timestamp is not None), None)
+
+
+def ultimo_de_profesional(mensajes):
+    """Último mensaje del profesional (recorre desde el final, sin copiar la lista)."""
+    return next((m for m in reversed(mensajes) if m.is_from_professional), None)
+
+# --- CACHÉ DE CONVERSACIONES ---
+# Cada conversación (por paciente) se descarga completa una vez; después sólo se
+# piden los mensajes nuevos con GET /chat/{username}?since=<timestamp del último>
+# (como máximo cada CHAT_DELTA_INTERVAL segundos) y se agregan a la caché.
+# Cada CHAT_FULL_REFRESH segundos se vuelve a descargar completa. Una conversación
+# vacía también queda en caché y se vuelve a consultar con el mismo intervalo.
+
+class _Conversacion:
+    __slots__ = ('mensajes', 'ultimo_ts', 'consultado_en', 'completa_en')
+
+    def __init__(self):
+        self.mensajes = []
+        self.ultimo_ts = None     # Timestamp (texto ISO de la API) del último mensaje
+        self.consultado_en = float('-inf')  # Última consulta a la API (completa o delta)
+        self.completa_en = float('-inf')    # Última descarga completa
+
+
+_conversaciones = OrderedDict()  # patient_username -> _Conversacion (LRU)
+_conversaciones_lock = threading.Lock()
+
+
+def _preparar_consulta(patient_username):
+    """Devuelve (conversación, params de la consulta o None si la caché está al día)."""
+    ahora = time.monotonic()
+    with _conversaciones_lock:
+        conv = _conversaciones.get(patient_username)
+        if conv is None:
+            conv = _conversaciones[patient_username] = _Conversacion()
+            while len(_conversaciones) > settings.CHAT_CACHE_MAX_CONVERSATIONS:
+                _conversaciones.popitem(last=False)
+        _conversaciones.move_to_end(patient_username)
+
+        if ahora - conv.completa_en > settings.CHAT_FULL_REFRESH:
+            return conv, {}
+        if ahora - conv.consultado_en <= settings.CHAT_DELTA_INTERVAL:
+            return conv, None
+        # Sin timestamp de referencia (conversación vacía, el caso de los pacientes
+        # nuevos) no hay delta posible: se vuelve a pedir completa, con el mismo intervalo
+        return conv, {'since': conv.ultimo_ts} if isinstance(conv.ultimo_ts, str) else {}
+
+
+def _aplicar_respuesta(conv, response, params, patient_username):
+    if response.status_code != 200:
+        print(f"Error API Chat: {response.status_code}")
+        return
+    items = response.json()
+    ahora = time.monotonic()
+    with _conversaciones_lock:
+        if 'since' in params:
+            # Por si la API ignora ``since`` (o lo aplica con >=) o dos requests trajeron el mismo delta
+            conv.mensajes = conv.mensajes + sin_repetidos(conv.mensajes, normalizar_mensajes(items, patient_username))
         else:
-            print(f"Error API Chat: {response.status_code}")
-            return []
-            
-    except Exception as e:
-        print(f"Error conectando con API de Chat: {e}")
-        return []
+            conv.mensajes = normalizar_mensajes(items, patient_username)
+            conv.ultimo_ts = None
+            conv.completa_en = ahora
+        # ``since`` se envía en el formato de la propia API: el texto del último timestamp válido
+        ultimo_ts = next((i['timestamp'] for i in reversed(items)
+                          if isinstance(i.get('timestamp'), str) and parse_timestamp(i['timestamp'])), None)
+        if ultimo_ts is not None:
+            conv.ultimo_ts = ultimo_ts
+        conv.consultado_en = ahora
+
+
+def invalidar_conversacion(patient_username):
+    """La próxima lectura consulta los mensajes nuevos (p. ej. después de enviar uno)."""
+    with _conversaciones_lock:
+        conv = _conversaciones.get(patient_username)
+        if conv is not None:
+            conv.consultado_en = float('-inf')
+
+
+def _refrescar(patient_username):
+    conv, params = _preparar_consulta(patient_username)
+    if params is not None:
+        try:
+            response = api_client.get(f"{API_BASE_URL}/chat/{patient_username}", params=params)
+            _aplicar_respuesta(conv, response, params, patient_username)
+        except Exception as e:
+            print(f"Error conectando con API de Chat: {e}")
+    return conv.mensajes
+
+
+async def _arefrescar(patient_username):
+    conv, params = _preparar_consulta(patient_username)
+    if params is not None:
+        try:
+            response = await api_client.aget(f"{API_BASE_URL}/chat/{patient_username}", params=params)
+            _aplicar_respuesta(conv, response, params, patient_username)
+        except Exception as e:
+            print(f"Error conectando con API de Chat: {e}")
+    return conv.mensajes
+
+
+def get_messages(patient_username):
+    """Mensajes de la conversación (orden ascendente), leídos de la caché y actualizados con un delta."""
+    return list(_refrescar(patient_username))  # Copia: las vistas pueden reordenarla
+
+async def aget_messages(patient_username):
+    """Versión async de get_messages (vistas async)."""
+    return list(await _arefrescar(patient_username))
+
+def get_last_messages(patient_username, n):
+    """Sólo los últimos ``n`` mensajes (sin copiar la conversación completa)."""
+    return _refrescar(patient_username)[-n:] if n > 0 else []
+
+async def aget_last_messages(patient_username, n):
+    """Versión async de get_last_messages."""
+    return (await _arefrescar(patient_username))[-n:] if n > 0 else []
+
+async def aget_messages_since(patient_username, desde, visto=None):
+    """Sólo los mensajes posteriores al cursor (ver ``posteriores_a``)."""
+    return posteriores_a(await _arefrescar(patient_username), desde, visto)
+
+async def aget_last_cursor(patient_username):
+    """Cursor del último mensaje con fecha válida, o None (referencia del stream del widget)."""
+    return cursor_final(await _arefrescar(patient_username))
+
+async def aget_last_professional_message(patient_username):
+    """Último mensaje del profesional o None (p. ej. para la portada del paciente)."""
+    return ultimo_de_profesional(await _arefrescar(patient_username))
 
 def send_message(professional_username, patient_username, content, is_from_professional):
     """Envía un mensaje a través de la API de Node.js."""
@@ -57,9 +279,10 @@ def send_message(professional_username, patient_username, content, is_from_profe
             'remitente_tipo': 'profesional' if is_from_professional else 'paciente'
         }
         
-        response = requests.post(url, json=payload, timeout=5)
+        response = api_client.post(url, json=payload)
         
         if response.status_code in [200, 201]:
+            invalidar_conversacion(patient_username)
             return True
         else:
             print(f"Error enviando mensaje a API: {response.status_code} - {response.text}")
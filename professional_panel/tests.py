@@ -1,3 +1,112 @@
-from django.test import TestCase
+import json
+from unittest import mock
 
-# Create your tests here.
+import requests
+from django.test import SimpleTestCase
+from django.urls import reverse
+
+from healthtrack import patient_index
+from healthtrack.pruebas import APIFalsaTestCase
+
+from . import services
+
+
+class DetallePacienteAccesoTests(APIFalsaTestCase):
+
+    def setUp(self):
+        super().setUp()
+        patient_index.invalidar_indice()
+        self.client = self.login('pro0')
+
+    def detalle(self, username):
+        return self.client.get(reverse('professional_panel:detalle_paciente', args=[username]), secure=True)
+
+    def test_ve_a_sus_pacientes_y_a_los_disponibles(self):
+        self.assertEqual(self.detalle('user1').status_code, 200)  # Asignado a pro0
+        self.assertEqual(self.detalle('user3').status_code, 200)  # Sin profesional
+
+    def test_no_ve_pacientes_de_otro_profesional(self):
+        respuesta = self.detalle('user4')  # Asignado a pro1
+        self.assertRedirects(respuesta, reverse('professional_panel:listar_pacientes'),
+                             fetch_redirect_response=False)
+
+
+def respuesta(items):
+    resp = requests.Response()
+    resp.status_code = 200
+    resp._content = json.dumps(items).encode()
+    return resp
+
+
+def mensaje(contenido, timestamp):
+    return {'contenido': contenido, 'remitente_id': 'pro0', 'remitente_tipo': 'profesional',
+            'timestamp': timestamp}
+
+
+class ConversacionCacheadaTests(SimpleTestCase):
+
+    def setUp(self):
+        services._conversaciones.clear()
+        patcher = mock.patch.object(services.api_client, 'get')
+        self.api = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def params(self):
+        return [c.kwargs['params'] for c in self.api.call_args_list]
+
+    def test_conversacion_vacia_queda_en_cache(self):
+        self.api.return_value = respuesta([])
+        services.get_messages('ana')
+        services.get_messages('ana')
+        self.assertEqual(self.params(), [{}])
+
+        services.invalidar_conversacion('ana')  # Pasó CHAT_DELTA_INTERVAL (o se envió un mensaje)
+        services.get_messages('ana')
+        self.assertEqual(self.params(), [{}, {}])  # Sin timestamp no hay delta: completa
+
+    def test_delta_con_el_ultimo_timestamp_y_sin_repetidos(self):
+        self.api.return_value = respuesta([mensaje('hola', '2025-01-01T10:00:00Z')])
+        services.get_messages('ana')
+
+        # La API aplica since con >= y repite el último; el nuevo comparte su timestamp
+        self.api.return_value = respuesta([mensaje('hola', '2025-01-01T10:00:00.000Z'),
+                                           mensaje('¿cómo vas?', '2025-01-01T10:00:00Z')])
+        services.invalidar_conversacion('ana')
+        mensajes = services.get_messages('ana')
+
+        self.assertEqual(self.params(), [{}, {'since': '2025-01-01T10:00:00Z'}])
+        self.assertEqual([m.comment for m in mensajes], ['hola', '¿cómo vas?'])
+
+    def test_dentro_del_intervalo_no_consulta_la_api(self):
+        self.api.return_value = respuesta([mensaje('hola', '2025-01-01T10:00:00Z')])
+        services.get_messages('ana')
+        services.get_last_messages('ana', 1)
+        self.assertEqual(self.api.call_count, 1)
+
+
+class PosterioresACursorTests(SimpleTestCase):
+
+    def setUp(self):
+        self.mensajes = services.normalizar_mensajes([
+            mensaje('a', '2025-01-01T10:00:00Z'),
+            mensaje('b', '2025-01-01T10:00:05Z'),
+            mensaje('c', '2025-01-01T10:00:05Z'),  # Mismo segundo que b
+            mensaje('d', '2025-01-01T10:00:09Z'),
+        ], 'ana')
+
+    def posteriores(self, cursor):
+        desde, visto = services.leer_cursor(cursor)
+        return [m.comment for m in services.posteriores_a(self.mensajes, desde, visto)]
+
+    def test_envia_los_del_mismo_timestamp_que_siguen_al_visto(self):
+        self.assertEqual(self.posteriores(services.cursor_de(self.mensajes[1])), ['c', 'd'])
+        self.assertEqual(self.posteriores(services.cursor_de(self.mensajes[2])), ['d'])
+        self.assertEqual(self.posteriores(services.cursor_final(self.mensajes)), [])
+
+    def test_cursor_sin_clave_da_por_enviados_los_de_ese_timestamp(self):
+        self.assertEqual(self.posteriores('2025-01-01T10:00:05+00:00'), ['d'])
+        self.assertEqual(self.posteriores('2025-01-01T09:00:00'), ['a', 'b', 'c', 'd'])
+
+    def test_cursor_invalido(self):
+        self.assertEqual(services.leer_cursor('ayer~abc'), (None, None))
+        self.assertEqual(services.leer_cursor(None), (None, None))
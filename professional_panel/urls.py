@@ -9,5 +9,6 @@ urlpatterns = [
     path('pacientes/', views.listar_pacientes_view, name='listar_pacientes'),
     path('asignar/<str:uid>/', views.asignar_paciente_view, name='asignar_paciente'), # Nueva ruta
     path('pacientes/<str:username>/', views.detalle_paciente_view, name='detalle_paciente'),
+    path('pacientes/<str:username>/registros/', views.registros_paciente_view, name='registros_paciente'),
     path('pacientes/<str:username>/recomendar/', views.recomendar_habito_view, name='recomendar_habito'),
 ]
@@ -1,9 +1,17 @@
 from django.shortcuts import render, redirect
+from django.http import HttpResponse
+from django.urls import reverse
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.conf import settings
 from django.contrib import messages
 import requests
+from healthtrack import api_client
 import sys
+from urllib.parse import urlencode
+from asgiref.sync import sync_to_async
+from healthtrack.services import SIN_ASIGNAR, aget_user_role, recordar_uid, resolver_uid
+from healthtrack.patient_index import get_indice, registrar_asignacion
+from seguimiento.services import aget_definiciones, alistar_registros, bump_definiciones_version
 from . import services
 
 API_BASE_URL = getattr(settings, 'API_BASE_URL', 'http://localhost:3000/api')
@@ -27,6 +35,24 @@ def get_auth_headers(request):
         'Content-Type': 'application/json'
     }
 
+# Helper: querystring actual con el cursor de UNA tabla cambiado (None = primera página)
+def _url_cursor(request, param, cursor):
+    query = request.GET.copy()
+    query.pop(param, None)
+    if cursor:
+        query[param] = cursor
+    return f"?{query.urlencode()}"
+
+# Helper: GET async a la API que devuelve el JSON o ``default`` si falla
+async def _aget_json(url, headers, default):
+    try:
+        resp = await api_client.aget(url, headers=headers)
+        if resp.status_code == 200:
+            return resp.json()
+    except requests.RequestException:
+        pass
+    return default
+
 @login_required
 @user_passes_test(is_professional, login_url='/account/login')
 def professional_dashboard_view(request):
@@ -35,28 +61,15 @@ def professional_dashboard_view(request):
         messages.error(request, "Sesión inválida. Por favor, inicia sesión nuevamente.")
         return redirect('account:login')
 
-    # Calcular cantidad de pacientes
+    # Conteos leídos del índice de pacientes (healthtrack/patient_index.py)
+    current_pro_uid = request.session.get('user_session_data', {}).get('uid')
     pacientes_count = 0
+    disponibles_count = 0
     try:
-        resp = requests.get(USUARIO_API_URL, headers=headers, timeout=5)
-        if resp.status_code == 200:
-            all_users = resp.json()
-            current_pro_uid = request.session.get('user_session_data', {}).get('uid')
-            
-            # Contar solo los asignados a ESTE profesional
-            mis_pacientes = [
-                u for u in all_users 
-                if u.get('rol') == 'user' and u.get('assignedProfessionalId') == current_pro_uid
-            ]
-            pacientes_count = len(mis_pacientes)
-            
-            # Contar disponibles (sin asignar)
-            disponibles = [
-                u for u in all_users
-                if u.get('rol') == 'user' and not u.get('assignedProfessionalId')
-            ]
-            disponibles_count = len(disponibles)
-            
+        indice = get_indice(headers)
+        if indice is not None:
+            pacientes_count = indice.total(current_pro_uid)
+            disponibles_count = indice.total(SIN_ASIGNAR)
     except Exception as e:
         print(f"Error dashboard count: {e}", file=sys.stderr)
         pass
@@ -70,7 +83,6 @@ def professional_dashboard_view(request):
 
 # --- CONSTANTES API ---
 USUARIO_API_URL = f"{API_BASE_URL}/usuarios"
-HABITO_DEFINICION_URL = f"{API_BASE_URL}/habito-definicion"
 HABITO_REGISTRO_URL = f"{API_BASE_URL}/habito-registro"
 
 @login_required
@@ -81,38 +93,30 @@ def listar_pacientes_view(request):
         messages.error(request, "Sesión inválida.")
         return redirect('account:login')
 
-    mis_pacientes = []
-    pacientes_disponibles = []
-    
     current_pro_uid = request.session.get('user_session_data', {}).get('uid')
 
+    # Sólo usuarios 'user' (no admin/pro), ya agrupados por profesional en el índice;
+    # los asignados a OTRO profesional no se muestran (no ensucian la vista).
+    vacia = {'usuarios': [], 'next_cursor': None}
+    mis_pacientes = disponibles = vacia
     try:
-        resp = requests.get(USUARIO_API_URL, headers=headers, timeout=5)
-        if resp.status_code == 200:
-            all_users = resp.json()
-            # Filtramos usuarios que sean 'user' (no admin/pro)
-            candidates = [u for u in all_users if u.get('rol') not in ['admin', 'profesional']]
-            
-            for u in candidates:
-                assigned_id = u.get('assignedProfessionalId')
-                
-                # LOGICA DE CLASIFICACIÓN
-                if assigned_id == current_pro_uid:
-                    mis_pacientes.append(u)
-                elif not assigned_id:
-                    # Si no tiene asignado nadie, está disponible
-                    pacientes_disponibles.append(u)
-                else:
-                    # Está asignado a OTRO profesional (Opcional: mostrar o esconder)
-                    # Por ahora los escondemos para no ensuciar la vista
-                    pass
-
-    except requests.RequestException:
+        indice = get_indice(headers)
+        if indice is not None:
+            mis_pacientes = indice.pagina(current_pro_uid, request.GET.get('cursor_mis'))
+            disponibles = indice.pagina(SIN_ASIGNAR, request.GET.get('cursor_disp'))
+        else:
+            messages.error(request, "Error al obtener lista de pacientes.")
+    except requests.RequestException as e:
+        print(f"Error listar pacientes: {e}", file=sys.stderr)
         messages.error(request, "Error al obtener lista de pacientes.")
 
     context = {
-        'mis_pacientes': mis_pacientes,
-        'pacientes_disponibles': pacientes_disponibles,
+        'mis_pacientes': mis_pacientes['usuarios'],
+        'mis_pacientes_next_url': _url_cursor(request, 'cursor_mis', mis_pacientes['next_cursor']) if mis_pacientes['next_cursor'] else None,
+        'mis_pacientes_first_url': _url_cursor(request, 'cursor_mis', None) if request.GET.get('cursor_mis') else None,
+        'pacientes_disponibles': disponibles['usuarios'],
+        'disponibles_next_url': _url_cursor(request, 'cursor_disp', disponibles['next_cursor']) if disponibles['next_cursor'] else None,
+        'disponibles_first_url': _url_cursor(request, 'cursor_disp', None) if request.GET.get('cursor_disp') else None,
         'panel_title': 'Gestión de Pacientes'
     }
     return render(request, 'professional_panel/listar_pacientes.html', context)
@@ -133,9 +137,10 @@ def asignar_paciente_view(request, uid):
         
         print(f"DEBUG: Asignando paciente {uid} a pro {current_pro_uid}", file=sys.stderr)
         
-        resp = requests.put(assign_url, json=payload, headers=headers, timeout=5)
+        resp = api_client.put(assign_url, json=payload, headers=headers)
         
         if resp.status_code == 200:
+            registrar_asignacion(uid, current_pro_uid) # Actualiza el índice sin reconstruirlo
             messages.success(request, "Paciente asignado correctamente.")
         else:
             err = resp.json().get('error') or resp.text
@@ -147,45 +152,42 @@ def asignar_paciente_view(request, uid):
 
     return redirect('professional_panel:listar_pacientes')
 
+# Helper: el profesional actual puede ver a ``username`` (según el índice de pacientes)
+async def _puede_ver_paciente(request, headers, username):
+    session_data = await request.session.aget('user_session_data', {})
+    if session_data.get('rol') == 'admin':
+        return True
+    try:
+        indice = await sync_to_async(get_indice, thread_sensitive=False)(headers)
+    except requests.RequestException:
+        indice = None
+    return indice is None or indice.puede_ver(session_data.get('uid'), username)
+
+# Helper: URL del fragmento con la página siguiente del historial (None si no hay más)
+def _url_registros(username, cursor):
+    if not cursor:
+        return None
+    url = reverse('professional_panel:registros_paciente', args=[username])
+    return f"{url}?{urlencode({'cursor': cursor})}"
+
+# Vista async: las 4 consultas quedan en vuelo a la vez sin ocupar hilos del servidor (ASGI)
 @login_required
 @user_passes_test(is_professional, login_url='/account/login')
-def detalle_paciente_view(request, username):
+async def detalle_paciente_view(request, username):
     headers = get_auth_headers(request)
     if not headers:
         return redirect('account:login')
 
-    # 1. Obtener datos del usuario
-    usuario = {}
-    try:
-        resp = requests.get(f"{USUARIO_API_URL}/username/{username}", headers=headers, timeout=5)
-        if resp.status_code == 200:
-            usuario = resp.json()
-    except:
-        pass
-
-    # 2. Obtener hábitos definidos
-    habitos = []
-    try:
-        resp = requests.get(f"{HABITO_DEFINICION_URL}/{username}", headers=headers, timeout=5)
-        if resp.status_code == 200:
-            habitos = resp.json()
-    except:
-        pass
+    # Acceso: no se puede abrir el expediente de un paciente de OTRO profesional
+    if not await _puede_ver_paciente(request, headers, username):
+        messages.error(request, "Este paciente está asignado a otro profesional.")
+        return redirect('professional_panel:listar_pacientes')
 
-    # 3. Obtener registros de progreso
-    registros = []
-    try:
-        resp = requests.get(f"{HABITO_REGISTRO_URL}/{username}", headers=headers, timeout=5)
-        if resp.status_code == 200:
-            registros = resp.json()
-    except:
-        pass
-
-    # 4. Manejo de Comentarios (Firestore)
+    # 1. Manejo de Comentarios (Firestore): el POST sólo envía y redirige
     if request.method == 'POST':
         comentario_texto = request.POST.get('comentario')
         if comentario_texto:
-            success = services.send_message(
+            success = await sync_to_async(services.send_message, thread_sensitive=False)(
                 professional_username=request.user.username,
                 patient_username=username,
                 content=comentario_texto,
@@ -197,8 +199,25 @@ def detalle_paciente_view(request, username):
                 messages.error(request, "Error: No se pudo conectar con la API de Chat. Verifica que tu servidor Node.js esté corriendo.")
             return redirect('professional_panel:detalle_paciente', username=username)
 
-    # Obtener comentarios históricos de Firestore
-    comentarios = services.get_messages(patient_username=username)
+    # 2. Usuario, hábitos definidos, registros de progreso (primera página) y comentarios
+    # históricos son independientes: se consultan en paralelo (latencia = la más lenta, no la suma)
+    datos = await api_client.afan_out(
+        {
+            'usuario': _aget_json(f"{USUARIO_API_URL}/username/{username}", headers, {}),
+            'habitos': aget_definiciones(username, headers),
+            'registros': alistar_registros(username, headers),
+            'comentarios': services.aget_messages(patient_username=username),
+        },
+        defaults={
+            'usuario': {}, 'habitos': [], 'comentarios': [],
+            'registros': {'registros': [], 'next_cursor': None},
+        },
+    )
+    usuario = datos['usuario']
+    recordar_uid(username, usuario) # Las mutaciones posteriores (recomendar hábito) no vuelven a pedirlo
+    habitos = datos['habitos']
+    registros = datos['registros']['registros']
+    comentarios = datos['comentarios']
     # Ordenar por fecha descendente para la vista (el servicio devuelve ascendente)
     comentarios.reverse()
 
@@ -206,11 +225,36 @@ def detalle_paciente_view(request, username):
         'usuario': usuario,
         'habitos': habitos,
         'registros': registros,
+        'registros_next_url': _url_registros(username, datos['registros']['next_cursor']),
         'comentarios': comentarios,
         'panel_title': f'Expediente: {username}'
     }
+    await aget_user_role(request)  # Rol de la navegación, antes de render()
     return render(request, 'professional_panel/detalle_paciente.html', context)
 
+@login_required
+@user_passes_test(is_professional, login_url='/account/login')
+async def registros_paciente_view(request, username):
+    """Filas HTML de la página ``?cursor=`` del historial del paciente ("Cargar más")."""
+    headers = get_auth_headers(request)
+    if not headers:
+        return HttpResponse(status=401)
+    if not await _puede_ver_paciente(request, headers, username):
+        return HttpResponse(status=403)
+
+    cursor = request.GET.get('cursor')
+    try:
+        pagina = await alistar_registros(username, headers, cursor=cursor, limit=request.GET.get('limit'))
+    except requests.RequestException:
+        return HttpResponse(status=502)
+
+    context = {
+        'registros': pagina['registros'],
+        'registros_next_url': _url_registros(username, pagina['next_cursor']),
+        'cursor': cursor,
+    }
+    return render(request, 'professional_panel/components/filas_registros.html', context)
+
 # --- HABIT TEMPLATES ---
 HABIT_TEMPLATES = {
     'sueno_optimo': {
@@ -262,16 +306,9 @@ def recomendar_habito_view(request, username):
     if not headers:
         return redirect('account:login')
 
-    # Obtener datos básicos del paciente (necesitamos su UID para la API de hábitos)
-    patient_uid = None
-    try:
-        resp = requests.get(f"{USUARIO_API_URL}/username/{username}", headers=headers, timeout=5)
-        if resp.status_code == 200:
-            patient_data = resp.json()
-            # La API devuelve el objeto usuario, usamos su ID (firebaseUid o id)
-            patient_uid = patient_data.get('firebaseUid') or patient_data.get('id')
-    except:
-        pass
+    # Obtener el UID del paciente (registrado al abrir su expediente; si no, se consulta su perfil)
+    token = request.session.get('user_session_data', {}).get('token')
+    patient_uid = resolver_uid(username, token)
 
     if not patient_uid:
         messages.error(request, "No se pudo identificar al paciente.")
@@ -303,9 +340,10 @@ def recomendar_habito_view(request, username):
             try:
                 # URL API: POST /api/habito-definicion
                 # Ajustar si tu URL es diferente
-                resp_post = requests.post(f"{API_BASE_URL}/habito-definicion", json=payload, headers=headers, timeout=5)
+                resp_post = api_client.post(f"{API_BASE_URL}/habito-definicion", json=payload, headers=headers)
                 
                 if resp_post.status_code in [200, 201]:
+                    bump_definiciones_version(target_id) # El paciente verá el hábito nuevo al recargar
                     messages.success(request, f"Hábito '{selected_habit['nombre']}' asignado correctamente.")
                     return redirect('professional_panel:detalle_paciente', username=username)
                 else:
@@ -0,0 +1,148 @@
+"""
+Motor de series de progreso para los gráficos de hábitos.
+
+Los registros de /habito-registro/{username} se agrupan por hábito en columnas
+compactas (``array``: día como ordinal y valor como float), parseando cada
+fecha una sola vez. Sobre esas columnas se recorta una ventana de fechas con
+búsqueda binaria y se agrega por día, semana o mes, así el tamaño del gráfico
+queda acotado (PROGRESS_MAX_POINTS) sin importar los años de historial.
+"""
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import date
+
+from django.conf import settings
+
+DIARIO = 'diario'
+SEMANAL = 'semanal'
+MENSUAL = 'mensual'
+GRANULARIDADES = (DIARIO, SEMANAL, MENSUAL)
+
+
+def parse_fecha(valor):
+    """'2025-01-31' o '2025-01-31T10:00:00Z' -> date (None si no es una fecha válida)."""
+    try:
+        return date.fromisoformat(str(valor)[:10])
+    except ValueError:
+        return None
+
+
+def _valor_numerico(valor, tipo):
+    # Si es binario, guardamos 1 o 0. Si es número, el valor real.
+    if tipo == 'Binario':
+        return 1.0 if valor else 0.0
+    try:
+        return float(valor)
+    except (TypeError, ValueError):
+        return None
+
+
+class SerieHabito:
+    """Registros de UN hábito en columnas paralelas, ordenadas por día."""
+
+    __slots__ = ('nombre', 'meta', 'tipo', 'dias', 'valores')
+
+    def __init__(self, nombre, meta=None, tipo=None):
+        self.nombre = nombre
+        self.meta = meta
+        self.tipo = tipo
+        self.dias = array('l')      # date.toordinal()
+        self.valores = array('d')
+
+    def __len__(self):
+        return len(self.dias)
+
+    def _ordenar(self):
+        # La API suele devolverlos ya ordenados: sólo se reordena si hace falta
+        if all(a <= b for a, b in zip(self.dias, self.dias[1:])):
+            return
+        orden = sorted(range(len(self.dias)), key=self.dias.__getitem__)
+        self.dias = array('l', (self.dias[i] for i in orden))
+        self.valores = array('d', (self.valores[i] for i in orden))
+
+    def ventana(self, desde=None, hasta=None):
+        """Índices [inicio, fin) de los registros entre ``desde`` y ``hasta`` (fechas, inclusive)."""
+        inicio = bisect_left(self.dias, desde.toordinal()) if desde else 0
+        fin = bisect_right(self.dias, hasta.toordinal()) if hasta else len(self.dias)
+        return inicio, fin
+
+    def agregar(self, granularidad=DIARIO, desde=None, hasta=None):
+        """
+        Promedio por día, semana (lunes) o mes dentro de la ventana.
+        Devuelve (fechas de inicio de cada periodo, promedios).
+        """
+        inicio, fin = self.ventana(desde, hasta)
+        fechas, promedios = [], []
+        clave_actual, suma, cantidad = None, 0.0, 0
+
+        for i in range(inicio, fin):
+            clave = _periodo(self.dias[i], granularidad)
+            if clave != clave_actual:
+                if cantidad:
+                    fechas.append(clave_actual)
+                    promedios.append(suma / cantidad)
+                clave_actual, suma, cantidad = clave, 0.0, 0
+            suma += self.valores[i]
+            cantidad += 1
+        if cantidad:
+            fechas.append(clave_actual)
+            promedios.append(suma / cantidad)
+        return fechas, promedios
+
+    def grafico(self, desde=None, hasta=None, granularidad=None, max_puntos=None):
+        """
+        Payload para Chart.js: {'fechas', 'valores', 'meta', 'tipo', 'granularidad'}.
+        Sin ``granularidad`` se elige la más fina que entre en ``max_puntos``;
+        si ni la mensual entra, se envían los periodos más recientes.
+        """
+        max_puntos = max_puntos or settings.PROGRESS_MAX_POINTS
+        opciones = [granularidad] if granularidad else GRANULARIDADES
+        for opcion in opciones:
+            fechas, promedios = self.agregar(opcion, desde, hasta)
+            if len(fechas) <= max_puntos:
+                break
+        fechas, promedios = fechas[-max_puntos:], promedios[-max_puntos:]
+        return {
+            'fechas': [date.fromordinal(d).isoformat() for d in fechas],
+            'valores': [round(v, 2) for v in promedios],
+            'meta': self.meta,
+            'tipo': self.tipo,
+            'granularidad': opcion,
+        }
+
+
+def _periodo(dia, granularidad):
+    """Ordinal del primer día del periodo al que pertenece ``dia``."""
+    if granularidad == SEMANAL:
+        return dia - date.fromordinal(dia).weekday()
+    if granularidad == MENSUAL:
+        return date.fromordinal(dia).replace(day=1).toordinal()
+    return dia
+
+
+def construir_series(registros, solo=None):
+    """
+    Agrupa los registros por hábito en UNA pasada: dict nombre -> SerieHabito.
+    Con ``solo`` se construye únicamente la serie de ese hábito.
+    """
+    series = {}
+    for reg in registros:
+        nombre = reg.get('nombre_habito')
+        if not nombre or (solo is not None and nombre != solo):
+            continue
+        fecha = parse_fecha(reg.get('fecha', ''))
+        if fecha is None:
+            continue
+
+        serie = series.get(nombre)
+        if serie is None:
+            serie = series[nombre] = SerieHabito(nombre, reg.get('meta'), reg.get('tipo_medicion'))
+        valor = _valor_numerico(reg.get('valor_registrado'), serie.tipo)
+        if valor is None:
+            continue
+        serie.dias.append(fecha.toordinal())
+        serie.valores.append(valor)
+
+    for serie in series.values():
+        serie._ordenar()
+    return series
@@ -0,0 +1,340 @@
+import sys
+import threading
+import time
+from datetime import date
+from functools import partial
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from healthtrack import api_client
+
+from .progress import construir_series
+
+API_BASE_URL = getattr(settings, 'API_BASE_URL', 'http://localhost:3000/api')
+HABITO_DEFINICION_URL = f"{API_BASE_URL}/habito-definicion"
+HABITO_REGISTRO_URL = f"{API_BASE_URL}/habito-registro"
+
+# --- DEFINICIONES DE HÁBITOS CACHEADAS POR USUARIO ---
+# Las definiciones sólo cambian en crear_habito_view, eliminar_habito_view y
+# professional_panel.recomendar_habito_view: cada una sube la versión del usuario
+# (bump_definiciones_version). La clave de la copia incluye la versión, así que al
+# subirla la anterior deja de leerse (y expira sola). El TTL cubre los cambios
+# hechos desde otras instancias, que no comparten esta caché.
+
+
+def _version_key(username):
+    return f"habitos_version:{username.lower()}"
+
+
+def get_definiciones_version(username):
+    return cache.get(_version_key(username), 0)
+
+
+def bump_definiciones_version(username):
+    """Marca que las definiciones de ``username`` cambiaron: la próxima lectura va a la API."""
+    key = _version_key(username)
+    cache.add(key, 0, timeout=None)
+    cache.incr(key)
+
+
+def _definiciones_key(username):
+    return f"habitos:{username.lower()}:v{get_definiciones_version(username)}"
+
+
+def _definiciones(response, key):
+    if response.status_code != 200:
+        # El status llega a la vista en e.response.status_code
+        raise requests.HTTPError(f"Error API definiciones: {response.status_code}", response=response)
+    definiciones = response.json()
+    cache.set(key, definiciones, settings.HABIT_DEFINITIONS_TTL)
+    return definiciones
+
+
+def get_definiciones(username, headers):
+    """
+    Definiciones de hábitos de ``username`` (caché local hasta que cambien).
+    Lanza requests.HTTPError si la API responde con error y
+    requests.RequestException si no hay conexión.
+    """
+    key = _definiciones_key(username)
+    definiciones = cache.get(key)
+    if definiciones is None:
+        response = api_client.get(f"{HABITO_DEFINICION_URL}/{username.lower()}", headers=headers)
+        definiciones = _definiciones(response, key)
+    return definiciones
+
+
+async def aget_definiciones(username, headers):
+    """Versión async de ``get_definiciones``."""
+    key = _definiciones_key(username)
+    definiciones = cache.get(key)
+    if definiciones is None:
+        response = await api_client.aget(f"{HABITO_DEFINICION_URL}/{username.lower()}", headers=headers)
+        definiciones = _definiciones(response, key)
+    return definiciones
+
+
+# --- REGISTROS DE HÁBITOS PAGINADOS ---
+# GET /habito-registro/{username}?limit=&cursor=  (más recientes primero)
+# Respuesta paginada: {'data': [...], 'nextCursor': '...' | null}
+# Si la API aún devuelve todos los registros (array), se ordenan y paginan aquí.
+
+
+def _limite(limit):
+    try:
+        limit = int(limit or settings.RECORD_PAGE_SIZE)
+    except (TypeError, ValueError):
+        limit = settings.RECORD_PAGE_SIZE
+    return max(1, min(limit, settings.RECORD_MAX_PAGE_SIZE))
+
+
+def _params(cursor, limit):
+    params = {'limit': limit}
+    if cursor:
+        params['cursor'] = cursor
+    return params
+
+
+def _pagina(response, cursor, limit):
+    if response.status_code != 200:
+        print(f"Error API registros de hábitos: {response.status_code}")
+        return {'registros': [], 'next_cursor': None}
+
+    data = response.json()
+    if isinstance(data, dict):
+        return {'registros': data.get('data', []), 'next_cursor': data.get('nextCursor')}
+
+    # API sin paginación: compatibilidad
+    data.sort(key=lambda r: r.get('fecha') or '', reverse=True)
+    inicio = int(cursor) if cursor and str(cursor).isdigit() else 0
+    fin = inicio + limit
+    return {'registros': data[inicio:fin], 'next_cursor': str(fin) if fin < len(data) else None}
+
+
+def listar_registros(username, headers, cursor=None, limit=None):
+    """
+    Una página de registros de ``username``, más recientes primero.
+    Devuelve {'registros': [...], 'next_cursor': str | None}.
+    Lanza requests.RequestException si no hay conexión con la API.
+    """
+    limit = _limite(limit)
+    response = api_client.get(f"{HABITO_REGISTRO_URL}/{username}", params=_params(cursor, limit), headers=headers)
+    return _pagina(response, cursor, limit)
+
+
+async def alistar_registros(username, headers, cursor=None, limit=None):
+    """Versión async de ``listar_registros``."""
+    limit = _limite(limit)
+    response = await api_client.aget(f"{HABITO_REGISTRO_URL}/{username}", params=_params(cursor, limit), headers=headers)
+    return _pagina(response, cursor, limit)
+
+
+# --- SERIES DE PROGRESO CACHEADAS POR USUARIO ---
+# progreso_datos_view necesita el historial completo para armar un gráfico. Se descarga
+# una vez y las series de TODOS los hábitos (progress.construir_series) quedan en caché
+# bajo la versión de registros del usuario: cambiar de hábito o de periodo no vuelve a
+# la API. Registrar (anotar_registros) sube la versión; el TTL cubre lo registrado
+# desde otras instancias. ``construidas`` identifica la copia (sirve de base del ETag).
+
+
+def _registros_version_key(username):
+    return f"registros_version:{username.lower()}"
+
+
+def bump_registros_version(username):
+    """Marca que los registros de ``username`` cambiaron: las series se reconstruyen."""
+    key = _registros_version_key(username)
+    cache.add(key, 0, timeout=None)
+    cache.incr(key)
+
+
+def _series_key(username):
+    return f"series:{username.lower()}:v{cache.get(_registros_version_key(username), 0)}"
+
+
+def series_cacheadas(username):
+    """{'series': {nombre: SerieHabito}, 'construidas': float} si están en caché, o None."""
+    return cache.get(_series_key(username))
+
+
+async def aget_series(username, headers):
+    """
+    Series de progreso de ``username`` (ver ``series_cacheadas``), consultando la API si hace falta.
+    Lanza requests.HTTPError si la API responde con error y
+    requests.RequestException si no hay conexión.
+    """
+    key = _series_key(username)
+    entrada = cache.get(key)
+    if entrada is None:
+        response = await api_client.aget(f"{HABITO_REGISTRO_URL}/{username.lower()}", headers=headers)
+        if response.status_code != 200:
+            raise requests.HTTPError(f"Error API registros: {response.status_code}", response=response)
+        data = response.json()
+        if isinstance(data, dict):  # API paginada sin límite: todo viene en 'data'
+            data = data.get('data', [])
+        entrada = {'series': construir_series(data), 'construidas': time.time()}
+        cache.set(key, entrada, settings.PROGRESS_SERIES_TTL)
+    return entrada
+
+
+# --- REGISTRO DEL DÍA EN LOTE ---
+# POST /habito-registro/lote  {'registros': [...]}
+# Respuesta: {'resultados': [{'ok': true, 'registro': {...}} | {'ok': false, 'error': '...'}]} (mismo orden)
+# Si la API no tiene el endpoint (404/405), los POST /habito-registro individuales
+# salen en paralelo por fan_out (acotado por API_FANOUT_MAX_WORKERS).
+
+_lote_disponible = True  # Pasa a False (hasta reiniciar el proceso) si la API no tiene /lote
+ERROR_CONEXION = "Error de conexión con la API de Node.js al intentar guardar."
+ERROR_SIN_CONFIRMAR = "La API no confirmó si se guardó: revisa tu historial antes de repetirlo."
+
+
+def _error_api(resp):
+    if resp.content:
+        try:
+            return resp.json().get('error', resp.text)
+        except ValueError:
+            return resp.text
+    return f"Error API desconocido (código {resp.status_code})."
+
+
+def _sin_confirmar():
+    return {'ok': False, 'error': ERROR_SIN_CONFIRMAR, 'sin_confirmar': True}
+
+
+def _sin_respuesta(error):
+    """
+    Resultado de una escritura que no obtuvo respuesta. Si el request llegó a salir
+    (timeout de lectura) la API pudo haberlo guardado: queda sin confirmar. Sólo un
+    error de conexión (o el circuito abierto) asegura que no se envió nada.
+    """
+    if isinstance(error, requests.Timeout) and not isinstance(error, requests.ConnectTimeout):
+        return _sin_confirmar()
+    return {'ok': False, 'error': ERROR_CONEXION}
+
+
+def _registrar_uno(registro, headers):
+    try:
+        resp = api_client.post(HABITO_REGISTRO_URL, json=registro, headers=headers)
+    except requests.RequestException as e:
+        return _sin_respuesta(e)
+    if resp.status_code == 201:
+        return {'ok': True, 'registro': resp.json()}
+    return {'ok': False, 'error': _error_api(resp)}
+
+
+def _resultados_lote(resp, cantidad):
+    try:
+        resultados = resp.json().get('resultados') if resp.content else None
+    except (ValueError, AttributeError):
+        resultados = None
+    if not isinstance(resultados, list) or len(resultados) != cantidad:
+        # Respuesta sin detalle por registro: no se sabe cuáles quedaron guardados
+        return [_sin_confirmar() for _ in range(cantidad)]
+    return [
+        {'ok': True, 'registro': r.get('registro')} if r.get('ok')
+        else {'ok': False, 'error': r.get('error') or 'Error API desconocido.'}
+        for r in resultados
+    ]
+
+
+def registrar_lote(registros, headers):
+    """
+    Guarda varios registros de hábitos (p. ej. todos los del día) en una sola operación.
+
+    Devuelve una lista paralela a ``registros`` con {'ok': True, 'registro': {...}}
+    o {'ok': False, 'error': '...'} por cada uno. Si no se sabe si quedaron guardados
+    (la API aceptó el lote sin detallar cada registro, o no respondió a tiempo
+    después de recibirlo) llevan además 'sin_confirmar': True.
+    """
+    global _lote_disponible
+    if not registros:
+        return []
+
+    if _lote_disponible:
+        try:
+            resp = api_client.post(f"{HABITO_REGISTRO_URL}/lote", json={'registros': registros}, headers=headers)
+        except requests.RequestException as e:
+            return [_sin_respuesta(e) for _ in registros]
+        if resp.status_code in (200, 201, 207):
+            return _resultados_lote(resp, len(registros))
+        if resp.status_code not in (404, 405):
+            error = _error_api(resp)
+            return [{'ok': False, 'error': error} for _ in registros]
+        print("API sin /habito-registro/lote: se envían registros individuales en paralelo", file=sys.stderr)
+        _lote_disponible = False
+
+    tareas = {i: partial(_registrar_uno, registro, headers) for i, registro in enumerate(registros)}
+    # Sin resultado dentro del plazo de fan_out: el POST pudo haber llegado igual
+    salida = api_client.fan_out(tareas, defaults={i: _sin_confirmar() for i in tareas})
+    return [salida[i] for i in range(len(registros))]
+
+
+# --- CHECKLIST DE HOY ---
+# Índice por usuario y día {id_habito_def: registro} con lo registrado ese día, en la
+# caché 'default' bajo hoy:<username>:<fecha> (o sea, por (hábito, fecha)).
+# Se calienta con GET /habito-registro/{username}?fecha=YYYY-MM-DD (sólo ese día, no
+# el historial) y cada registro hecho desde este proceso (individual, lote o JSON) lo
+# actualiza con ``anotar_registros``. El TTL cubre lo registrado desde otras instancias.
+
+_hoy_lock = threading.Lock()  # Serializa "leer -> anotar -> guardar" dentro del proceso
+
+
+def _hoy_key(username, fecha):
+    return f"hoy:{username.lower()}:{fecha}"
+
+
+def _dia(registro):
+    return str(registro.get('fecha') or '')[:10]  # 'YYYY-MM-DD' o ISO con hora
+
+
+def _indice_del_dia(response, fecha):
+    if response.status_code != 200:
+        raise requests.HTTPError(f"Error API registros del día: {response.status_code}", response=response)
+    data = response.json()
+    if isinstance(data, dict):
+        data = data.get('data', [])
+    # Si la API ignora ?fecha= (devuelve todo el historial) se filtra aquí
+    indice = {}
+    for registro in data:
+        if _dia(registro) == fecha and registro.get('id_habito_def'):
+            indice[registro['id_habito_def']] = registro  # Si hay varios, queda el último
+    return indice
+
+
+def registros_del_dia(username, headers, fecha=None):
+    """
+    {id_habito_def: registro} de lo registrado por ``username`` en ``fecha`` (hoy por defecto).
+    Lanza requests.RequestException si la API no responde o devuelve un error.
+    """
+    fecha = fecha or date.today().isoformat()
+    key = _hoy_key(username, fecha)
+    indice = cache.get(key)
+    if indice is None:
+        response = api_client.get(
+            f"{HABITO_REGISTRO_URL}/{username.lower()}", params={'fecha': fecha}, headers=headers
+        )
+        indice = _indice_del_dia(response, fecha)
+        cache.set(key, indice, settings.HABIT_TODAY_TTL)
+    return indice
+
+
+def olvidar_registros_del_dia(username, fecha=None):
+    """Descarta el índice del día: la próxima lectura lo pide a la API (estado incierto)."""
+    cache.delete(_hoy_key(username, fecha or date.today().isoformat()))
+
+
+def anotar_registros(username, registros):
+    """
+    Suma registros recién guardados al índice de su día (si ese día ya está en caché)
+    e invalida las series de progreso del usuario.
+    """
+    bump_registros_version(username)
+    with _hoy_lock:
+        for fecha in {_dia(r) for r in registros}:
+            key = _hoy_key(username, fecha)
+            indice = cache.get(key)
+            if indice is None:
+                continue  # Se calentará en la próxima lectura, ya con estos registros
+            indice.update((r['id_habito_def'], r) for r in registros if _dia(r) == fecha)
+            cache.set(key, indice, settings.HABIT_TODAY_TTL)
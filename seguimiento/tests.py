@@ -1,3 +1,305 @@
-from django.test import TestCase
+import io
+import json
+from contextlib import redirect_stderr
+from datetime import date
+from unittest import mock
 
-# Create your tests here.
+import requests
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.test import SimpleTestCase
+from django.urls import reverse
+
+from healthtrack.pruebas import APIFalsaTestCase
+
+from . import services
+from .progress import DIARIO, MENSUAL, SEMANAL, construir_series
+
+
+def registro(nombre, fecha, valor, tipo='Numérico', meta=None):
+    return {'nombre_habito': nombre, 'fecha': fecha, 'valor_registrado': valor,
+            'tipo_medicion': tipo, 'meta': meta}
+
+
+def ordinales(*fechas):
+    return [date.fromisoformat(f).toordinal() for f in fechas]
+
+
+class ConstruirSeriesTests(SimpleTestCase):
+
+    def test_agrupa_por_habito_y_ordena_por_dia(self):
+        series = construir_series([
+            registro('Hidratación', '2025-01-03T09:00:00Z', 6, meta=8),
+            registro('Meditación', '2025-01-02', True, tipo='Binario'),
+            registro('Hidratación', '2025-01-01', '4'),
+        ])
+        self.assertEqual(set(series), {'Hidratación', 'Meditación'})
+        agua = series['Hidratación']
+        self.assertEqual(list(agua.dias), ordinales('2025-01-01', '2025-01-03'))
+        self.assertEqual(list(agua.valores), [4.0, 6.0])
+        self.assertEqual(agua.meta, 8)
+
+    def test_binario_se_guarda_como_uno_o_cero(self):
+        series = construir_series([
+            registro('Meditación', '2025-01-01', True, tipo='Binario'),
+            registro('Meditación', '2025-01-02', False, tipo='Binario'),
+        ])
+        self.assertEqual(list(series['Meditación'].valores), [1.0, 0.0])
+
+    def test_descarta_fechas_y_valores_invalidos(self):
+        series = construir_series([
+            registro('Hidratación', 'ayer', 5),
+            registro('Hidratación', '2025-01-01', 'mucho'),
+            registro('Hidratación', '2025-01-02', 5),
+            registro('', '2025-01-02', 5),
+        ])
+        self.assertEqual(list(series), ['Hidratación'])
+        self.assertEqual(len(series['Hidratación']), 1)
+
+    def test_solo_construye_el_habito_pedido(self):
+        series = construir_series([
+            registro('Hidratación', '2025-01-01', 5),
+            registro('Meditación', '2025-01-01', 1),
+        ], solo='Meditación')
+        self.assertEqual(list(series), ['Meditación'])
+
+
+class AgregarTests(SimpleTestCase):
+
+    def setUp(self):
+        # 2025-01-06 es lunes
+        self.serie = construir_series([
+            registro('Hidratación', '2025-01-05', 2),   # domingo: semana del 30/12
+            registro('Hidratación', '2025-01-06', 4),
+            registro('Hidratación', '2025-01-06', 6),   # mismo día: se promedia
+            registro('Hidratación', '2025-01-12', 8),   # domingo: misma semana que el 06
+            registro('Hidratación', '2025-02-03', 10),
+        ])['Hidratación']
+
+    def test_diario_promedia_cada_dia(self):
+        fechas, promedios = self.serie.agregar(DIARIO)
+        self.assertEqual(fechas, ordinales('2025-01-05', '2025-01-06', '2025-01-12', '2025-02-03'))
+        self.assertEqual(promedios, [2.0, 5.0, 8.0, 10.0])
+
+    def test_semanal_empieza_el_lunes(self):
+        fechas, promedios = self.serie.agregar(SEMANAL)
+        self.assertEqual(fechas, ordinales('2024-12-30', '2025-01-06', '2025-02-03'))
+        self.assertEqual(promedios, [2.0, 6.0, 10.0])
+
+    def test_mensual_empieza_el_dia_uno(self):
+        fechas, promedios = self.serie.agregar(MENSUAL)
+        self.assertEqual(fechas, ordinales('2025-01-01', '2025-02-01'))
+        self.assertEqual(promedios, [5.0, 10.0])
+
+    def test_ventana_incluye_los_extremos(self):
+        fechas, promedios = self.serie.agregar(DIARIO, date(2025, 1, 6), date(2025, 1, 12))
+        self.assertEqual(fechas, ordinales('2025-01-06', '2025-01-12'))
+        self.assertEqual(promedios, [5.0, 8.0])
+
+    def test_ventana_vacia(self):
+        self.assertEqual(self.serie.agregar(DIARIO, date(2025, 3, 1)), ([], []))
+
+    def test_grafico_elige_la_granularidad_que_entra(self):
+        grafico = self.serie.grafico(max_puntos=3)
+        self.assertEqual(grafico['granularidad'], SEMANAL)
+        self.assertEqual(grafico['fechas'], ['2024-12-30', '2025-01-06', '2025-02-03'])
+
+
+def respuesta(status, cuerpo=None):
+    resp = requests.Response()
+    resp.status_code = status
+    resp._content = json.dumps(cuerpo).encode() if cuerpo is not None else b''
+    return resp
+
+
+class RegistrarLoteTests(SimpleTestCase):
+
+    def setUp(self):
+        services._lote_disponible = True
+        self.enterContext(redirect_stderr(io.StringIO()))
+        self.registros = [{'id_habito_def': 'h1', 'valor_registrado': 1},
+                          {'id_habito_def': 'h2', 'valor_registrado': 2}]
+
+    def tearDown(self):
+        services._lote_disponible = True
+
+    def api_sin_lote(self, url, json=None, headers=None):
+        if url.endswith('/lote'):
+            return respuesta(404)
+        if json['id_habito_def'] == 'h2':
+            return respuesta(400, {'error': 'Valor fuera de rango'})
+        return respuesta(201, {'id': 'r1', **json})
+
+    def test_sin_lote_envia_los_registros_uno_por_uno(self):
+        with mock.patch.object(services.api_client, 'post', side_effect=self.api_sin_lote) as post:
+            resultados = services.registrar_lote(self.registros, headers={})
+
+        self.assertEqual(resultados, [
+            {'ok': True, 'registro': {'id': 'r1', 'id_habito_def': 'h1', 'valor_registrado': 1}},
+            {'ok': False, 'error': 'Valor fuera de rango'},
+        ])
+        self.assertEqual(post.call_count, 3)
+        self.assertFalse(services._lote_disponible)
+
+    def test_no_vuelve_a_probar_lote_despues_de_un_404(self):
+        with mock.patch.object(services.api_client, 'post', side_effect=self.api_sin_lote) as post:
+            services.registrar_lote(self.registros, headers={})
+            post.reset_mock()
+            services.registrar_lote(self.registros[:1], headers={})
+
+        urls = [c.args[0] for c in post.call_args_list]
+        self.assertEqual(urls, [services.HABITO_REGISTRO_URL])
+
+    def test_timeout_del_lote_queda_sin_confirmar(self):
+        with mock.patch.object(services.api_client, 'post', side_effect=requests.ReadTimeout('lento')):
+            resultados = services.registrar_lote(self.registros, headers={})
+        self.assertEqual(resultados, [services._sin_confirmar()] * 2)
+
+    def test_sin_conexion_nada_se_envio(self):
+        for error in (requests.ConnectionError('caída'), requests.ConnectTimeout('sin conexión')):
+            with mock.patch.object(services.api_client, 'post', side_effect=error):
+                resultados = services.registrar_lote(self.registros, headers={})
+            self.assertEqual(resultados, [{'ok': False, 'error': services.ERROR_CONEXION}] * 2)
+
+    def test_timeout_de_un_registro_individual_queda_sin_confirmar(self):
+        def api(url, json=None, headers=None):
+            if url.endswith('/lote'):
+                return respuesta(404)
+            if json['id_habito_def'] == 'h2':
+                raise requests.ReadTimeout('lento')
+            return respuesta(201, {'id': 'r1', **json})
+
+        with mock.patch.object(services.api_client, 'post', side_effect=api):
+            resultados = services.registrar_lote(self.registros, headers={})
+        self.assertTrue(resultados[0]['ok'])
+        self.assertTrue(resultados[1]['sin_confirmar'])
+
+    def test_lote_sin_detalle_queda_sin_confirmar(self):
+        with mock.patch.object(services.api_client, 'post', return_value=respuesta(201, {'ok': True})):
+            resultados = services.registrar_lote(self.registros, headers={})
+        self.assertTrue(all(r['sin_confirmar'] and not r['ok'] for r in resultados))
+        self.assertTrue(services._lote_disponible)
+
+
+class ProgresoDatosViewTests(APIFalsaTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client = self.login('user1')
+        self.url = reverse('habitos:progreso_datos')
+
+    def datos(self, **extra):
+        params = {'habito': 'Hidratación', **extra.pop('params', {})}
+        return self.client.get(self.url, params, secure=True, **extra)
+
+    def test_devuelve_la_serie_con_etag(self):
+        respuesta = self.datos()
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertTrue(respuesta['ETag'])
+        self.assertIn('no-cache', respuesta['Cache-Control'])
+        self.assertEqual(len(respuesta.json()['fechas']), len(respuesta.json()['valores']))
+
+    def test_misma_serie_responde_304_sin_llamar_a_la_api(self):
+        etag = self.datos()['ETag']
+        respuesta = self.datos(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 304)
+        self.assertEqual(respuesta['ETag'], etag)
+        self.assertEqual(respuesta.content, b'')
+        self.assertEqual(self.llamadas_api(respuesta), 0)
+
+    def test_otros_parametros_tienen_otro_etag(self):
+        etag = self.datos()['ETag']
+        respuesta = self.datos(params={'granularidad': 'mensual'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.json()['granularidad'], 'mensual')
+        self.assertNotEqual(respuesta['ETag'], etag)
+
+    def test_un_registro_nuevo_invalida_el_etag(self):
+        etag = self.datos()['ETag']
+        services.bump_registros_version('user1')
+        respuesta = self.datos(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotEqual(respuesta['ETag'], etag)
+
+    def test_parametros_invalidos_y_habito_sin_registros(self):
+        self.assertEqual(self.datos(params={'granularidad': 'anual'}).status_code, 400)
+        self.assertEqual(self.datos(params={'desde': 'ayer'}).status_code, 400)
+        self.assertEqual(self.datos(params={'habito': 'Inexistente'}).status_code, 404)
+
+
+class RegistrarLoteViewTests(APIFalsaTestCase):
+
+    def setUp(self):
+        super().setUp()
+        services._lote_disponible = True
+        self.client = self.login('user1')
+        self.hoy = date.today().isoformat()
+        self.datos_formulario = {
+            'modo': 'lote', 'fecha_registro': self.hoy,
+            'habito_id': ['user1-agua', 'user1-meditar'],
+            'valor_user1-agua': '6', 'nombre_user1-agua': 'Hidratación',
+            'valor_user1-meditar': '1', 'nombre_user1-meditar': 'Meditación',
+        }
+
+    def enviar(self):
+        respuesta = self.client.post(reverse('habitos:registro_habito'), self.datos_formulario, secure=True)
+        self.assertRedirects(respuesta, reverse('habitos:registro_habito'), fetch_redirect_response=False)
+        return [str(m) for m in get_messages(respuesta.wsgi_request)]
+
+    def test_informa_los_registros_guardados(self):
+        self.assertEqual(self.enviar(), ['¡2 de 2 registros guardados con éxito!'])
+
+    def test_lote_sin_confirmar_lo_informa_y_descarta_el_indice_del_dia(self):
+        cache.set(services._hoy_key('user1', self.hoy), {})
+        with mock.patch.object(services.api_client, 'post', side_effect=requests.ReadTimeout('lento')):
+            mensajes = self.enviar()
+
+        self.assertEqual(mensajes, [f"Hidratación: {services.ERROR_SIN_CONFIRMAR}",
+                                    f"Meditación: {services.ERROR_SIN_CONFIRMAR}"])
+        self.assertIsNone(cache.get(services._hoy_key('user1', self.hoy)))
+
+
+class AccionesRapidasJSONTests(APIFalsaTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client = self.login('user1')
+        self.hoy = date.today().isoformat()
+
+    def registrar(self, **datos):
+        return self.client.post(reverse('habitos:registrar_valor'), datos, secure=True)
+
+    def test_registrar_valor_devuelve_el_registro_y_actualiza_el_indice_del_dia(self):
+        cache.set(services._hoy_key('user1', self.hoy), {})
+        respuesta = self.registrar(id_habito_def='user1-agua', valor_registrado='7')
+
+        self.assertEqual(respuesta.status_code, 201)
+        datos = respuesta.json()
+        self.assertEqual(datos['registro']['id_habito_def'], 'user1-agua')
+        self.assertTrue(datos['html'].strip())
+        self.assertIn('user1-agua', cache.get(services._hoy_key('user1', self.hoy)))
+
+    def test_registrar_valor_con_datos_invalidos(self):
+        self.assertEqual(self.registrar(id_habito_def='user1-agua').status_code, 400)
+        respuesta = self.registrar(id_habito_def='no-existe', valor_registrado='1')
+        self.assertEqual(respuesta.status_code, 400)  # El 4xx de la API se devuelve tal cual
+        self.assertEqual(respuesta.json()['error'], 'Hábito no encontrado')
+
+    def test_registrar_valor_sin_conexion(self):
+        with mock.patch.object(services.api_client, 'post', side_effect=requests.ConnectionError('caída')):
+            respuesta = self.registrar(id_habito_def='user1-agua', valor_registrado='7')
+        self.assertEqual(respuesta.status_code, 502)
+
+    def test_solo_acepta_post(self):
+        self.assertEqual(self.client.get(reverse('habitos:registrar_valor'), secure=True).status_code, 405)
+
+    def test_eliminar_habito_devuelve_su_id_e_invalida_las_definiciones(self):
+        self.api_falsa.habitos_de('user1')  # La API falsa los genera al primer acceso
+        version = cache.get(services._version_key('user1'), 0)
+        url = reverse('habitos:eliminar_habito_json', args=['user1-meditar'])
+
+        respuesta = self.client.post(url, secure=True)
+        self.assertEqual(respuesta.json(), {'id': 'user1-meditar'})
+        self.assertGreater(cache.get(services._version_key('user1')), version)
+
+        self.assertEqual(self.client.post(url, secure=True).status_code, 404)
@@ -8,5 +8,10 @@ urlpatterns = [
     path('crear_habito/', views.crear_habito_view, name='crear_habito'),
     path('registro_habito/', views.registro_habitos_view, name='registro_habito'),
     path('mi_progreso/', views.mi_progreso_view, name='mi_progreso'),
+    path('mi_progreso/datos/', views.progreso_datos_view, name='progreso_datos'),
+    path('mi_progreso/registros/', views.registros_fragmento_view, name='registros_fragmento'),
     path('eliminar/<str:id_habito>/', views.eliminar_habito_view, name='eliminar_habito'),
+    # Acciones rápidas (JSON) de la página "Tu Día"
+    path('registro_habito/valor/', views.registrar_valor_view, name='registrar_valor'),
+    path('eliminar/<str:id_habito>/json/', views.eliminar_habito_json_view, name='eliminar_habito_json'),
 ]
\ No newline at end of file
@@ -1,11 +1,25 @@
 from django.shortcuts import render, redirect
+from django.http import HttpResponse, JsonResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
 from django.contrib.auth.decorators import login_required
+from django.views.decorators.http import require_POST
+from django.template.loader import render_to_string
 from django.contrib import messages
 from django.conf import settings
 from .forms import HabitoDefinicionForm
+from .progress import GRANULARIDADES, parse_fecha
+from .services import (
+    aget_definiciones, aget_series, alistar_registros, anotar_registros, bump_definiciones_version,
+    get_definiciones, olvidar_registros_del_dia, registrar_lote, registros_del_dia, series_cacheadas,
+)
 import requests
+from healthtrack import api_client
+from healthtrack.services import aget_user_role
 from datetime import date
-import json
+import hashlib
+from urllib.parse import urlencode
 
 # --- DEFINICIÓN CENTRALIZADA DE URLS ---
 API_BASE_URL = getattr(settings, 'API_BASE_URL', 'http://localhost:3000/api')
@@ -40,14 +54,14 @@ def crear_habito_view(request):
             }
 
             try:
-                resp = requests.post(
+                resp = api_client.post(
                     HABITO_DEFINICION_URL,
                     json=data,
-                    headers=headers,
-                    timeout=5
+                    headers=headers
                 )
 
                 if resp.status_code == 201:
+                    bump_definiciones_version(data['id_usuario'])
                     messages.success(request, f"Hábito '{data['nombre']}' creado con éxito.")
                     return redirect('habitos:registro_habito')
                 else:
@@ -83,6 +97,10 @@ def registro_habitos_view(request):
         "Content-Type": "application/json",
     }
 
+    # ------- POST: todos los hábitos del día en un solo envío -------
+    if request.method == 'POST' and request.POST.get('modo') == 'lote':
+        return _registrar_lote(request, normalized_username, headers)
+
     # ------- POST: guardar registro individual -------
     if request.method == 'POST':
         # Obtenemos los campos del formulario
@@ -99,26 +117,21 @@ def registro_habitos_view(request):
             messages.error(request, "Error de envío: El identificador del hábito (id_habito_def) no fue recibido. Verifique la plantilla HTML.")
             return redirect('habitos:registro_habito')
 
-        data_registro = {
-            'id_habito_def': id_habito_def,
-            # Enviamos el valor como viene (vacío para checkbox desmarcado, valor para numérico)
-            'valor_registrado': valor_registrado, 
-            'comentario': comentario,
-            'fecha': fecha_registro,
-            'id_usuario': normalized_username, # ✅ Aseguramos el envío del ID de usuario
-        }
-        
+        data_registro = _datos_registro(
+            id_habito_def, valor_registrado, comentario, fecha_registro, normalized_username
+        )
+
 
         try:
-            resp = requests.post(
+            resp = api_client.post(
                 HABITO_REGISTRO_URL, 
                 json=data_registro,
-                headers=headers,
-                timeout=5
+                headers=headers
             )
 
             if resp.status_code == 201:
                 print("DEBUG: resp: ", resp)
+                anotar_registros(normalized_username, [_registro_guardado(data_registro, resp)])
                 messages.success(request, "¡Registro guardado con éxito!")
             else:
                 # Intenta obtener el mensaje de error de la API (incluyendo el error 400 de Node.js)
@@ -132,39 +145,95 @@ def registro_habitos_view(request):
         return redirect('habitos:registro_habito')
 
 
-    # ------- GET: Cargar definiciones de hábitos (Sin cambios, ya verificamos que funciona) -------
+    # ------- GET: Cargar definiciones de hábitos (caché local hasta que cambien) -------
     if request.method == 'GET':
         habitos = []
         try:
-            url_get = f"{HABITO_DEFINICION_URL}/{normalized_username}"
-            
-            response = requests.get(
-                url_get, 
-                headers=headers,
-                timeout=5
-            )
-            
-            if response.status_code == 200:
-                habitos = response.json()
-            else:
-                messages.error(request, f"Error al cargar las definiciones de hábitos: Código {response.status_code}")
-            
+            habitos = get_definiciones(normalized_username, headers)
+        except requests.HTTPError as e:
+            messages.error(request, f"Error al cargar las definiciones de hábitos: Código {e.response.status_code}")
         except requests.exceptions.RequestException as e:
             messages.error(request, f"No se pudo conectar con la API de Node.js: {e}")
             
+        # Checklist: qué hábitos ya tienen registro hoy (sólo los registros de hoy, no el historial)
+        hoy = date.today().isoformat()
+        registrados_hoy = None
+        if habitos:
+            try:
+                registrados_hoy = registros_del_dia(normalized_username, headers, hoy)
+            except requests.RequestException as e:
+                print(f"DEBUG: checklist de hoy no disponible: {e}")
+        for habito in habitos:
+            habito['registro_hoy'] = (registrados_hoy or {}).get(habito.get('id'))
+
         context = {
             'definiciones': habitos, 
             'habitos': habitos,
-            'fecha_actual': date.today().isoformat(),
+            'fecha_actual': hoy,
+            'checklist_disponible': registrados_hoy is not None,
+            'registrados_hoy': sum(1 for h in habitos if h['registro_hoy']),
         }
         return render(request, 'seguimiento/registrar_habito.html', context)
 
 
+# Helper: cuerpo de POST /habito-registro
+def _datos_registro(id_habito_def, valor_registrado, comentario, fecha_registro, normalized_username):
+    return {
+        'id_habito_def': id_habito_def,
+        # Enviamos el valor como viene (vacío para checkbox desmarcado, valor para numérico)
+        'valor_registrado': valor_registrado, 
+        'comentario': comentario,
+        'fecha': fecha_registro,
+        'id_usuario': normalized_username, # ✅ Aseguramos el envío del ID de usuario
+    }
+
+
+# Helper: registro tal como quedó en la API (con los datos enviados si la respuesta no los trae)
+def _registro_guardado(data_registro, resp=None, registro=None):
+    if resp is not None and resp.content:
+        registro = resp.json()
+    return {**data_registro, **(registro or {})}
+
+
+# Helper: POST del formulario "Registrar el día" (valor_<id> por hábito; vacío = no se registra)
+def _registrar_lote(request, normalized_username, headers):
+    fecha_registro = request.POST.get('fecha_registro', date.today().isoformat())
+    registros, nombres = [], []
+    for id_habito_def in request.POST.getlist('habito_id'):
+        valor = request.POST.get(f'valor_{id_habito_def}', '').strip()
+        if not valor:
+            continue
+        registros.append(_datos_registro(id_habito_def, valor, '', fecha_registro, normalized_username))
+        nombres.append(request.POST.get(f'nombre_{id_habito_def}') or id_habito_def)
+
+    if not registros:
+        messages.warning(request, "No ingresaste ningún valor para registrar.")
+        return redirect('habitos:registro_habito')
+
+    resultados = registrar_lote(registros, headers)
+    anotar_registros(normalized_username, [
+        _registro_guardado(enviado, registro=resultado['registro'])
+        for enviado, resultado in zip(registros, resultados) if resultado['ok']
+    ])
+    if any(r.get('sin_confirmar') for r in resultados):
+        olvidar_registros_del_dia(normalized_username, fecha_registro)
+    guardados = sum(1 for r in resultados if r['ok'])
+    if guardados:
+        messages.success(request, f"¡{guardados} de {len(registros)} registros guardados con éxito!")
+    for nombre, resultado in zip(nombres, resultados):
+        if not resultado['ok']:
+            messages.error(request, f"{nombre}: {resultado['error']}")
+    return redirect('habitos:registro_habito')
+
+
+# Vista async: mientras espera a la API no ocupa un hilo del servidor (ASGI)
+# La página sólo lleva la lista de hábitos y el historial; cada gráfico se pide
+# a progreso_datos_view cuando el usuario lo selecciona.
 @login_required
-def mi_progreso_view(request):
+async def mi_progreso_view(request):
     username = request.user.username.lower()
 
-    user_data = request.session.get('user_session_data', {})
+    user_data = await request.session.aget('user_session_data', {})
     token = user_data.get('token')
     if not token:
         messages.error(request, "Sesión expirada. Inicia sesión nuevamente.")
@@ -175,64 +244,123 @@ def mi_progreso_view(request):
         "Accept": "application/json",
     }
 
-    registros = []
+    # Definiciones (para el selector del gráfico) y la primera página del historial en paralelo
+    datos = await api_client.afan_out(
+        {
+            'habitos': aget_definiciones(username, headers),
+            'registros': alistar_registros(username, headers),
+        },
+        defaults={'habitos': None, 'registros': None},
+    )
+    pagina = datos['registros']
+    if pagina is None:
+        messages.error(request, "Error de conexión al obtener el progreso.")
+        pagina = {'registros': [], 'next_cursor': None}
 
-    try:
-        url_progreso = f"{HABITO_REGISTRO_URL}/{username}"
-        resp = requests.get(url_progreso, headers=headers, timeout=5)
+    context = {
+        "registros": pagina['registros'],
+        "registros_next_url": _url_registros(pagina['next_cursor']),
+        "lista_habitos": [h.get('nombre') for h in datos['habitos'] or [] if h.get('nombre')],
+    }
 
-        if resp.status_code == 200:
-            registros = resp.json()
-        else:
-            # Manejamos error silenciosamente
-            pass 
+    await aget_user_role(request)  # Rol de la navegación, antes de render()
+    return render(request, 'seguimiento/mi_progreso.html', context)
 
-    except requests.RequestException:
-        messages.error(request, "Error de conexión al obtener el progreso.")
 
-    # -------------------------------------------------------
-    # 📊 LÓGICA DE PROCESAMIENTO DE DATOS para el Gráfico
-    # -------------------------------------------------------
-    
-    datos_por_habito = {}
-    registros_ordenados = sorted(registros, key=lambda x: x['fecha'])
-
-    for reg in registros_ordenados:
-        nombre = reg.get('nombre_habito')
-        valor = reg.get('valor_registrado')
-        fecha = reg.get('fecha', '').split('T')[0]
-        meta = reg.get('meta')
-        tipo = reg.get('tipo_medicion')
-
-        if nombre and nombre not in datos_por_habito:
-            datos_por_habito[nombre] = {
-                'fechas': [],
-                'valores': [],
-                'meta': meta,
-                'tipo': tipo
-            }
-        
-        if nombre:
-            datos_por_habito[nombre]['fechas'].append(fecha)
-            
-            # Si es binario, guardamos 1 o 0. Si es número, el valor real.
-            if tipo == 'Binario':
-                datos_por_habito[nombre]['valores'].append(1 if valor else 0)
-            else:
-                datos_por_habito[nombre]['valores'].append(valor)
+# Helper: URL del fragmento con la página siguiente del historial (None si no hay más)
+def _url_registros(cursor):
+    if not cursor:
+        return None
+    return f"{reverse('habitos:registros_fragmento')}?{urlencode({'cursor': cursor})}"
+
 
-    # Convertimos a JSON string
-    datos_grafico_json = json.dumps(datos_por_habito)
+@login_required
+async def registros_fragmento_view(request):
+    """Filas HTML de la página ``?cursor=`` del historial de mi_progreso ("Cargar más")."""
+    username = request.user.username.lower()
+    user_data = await request.session.aget('user_session_data', {})
+    token = user_data.get('token')
+    if not token:
+        return HttpResponse(status=401)
+
+    cursor = request.GET.get('cursor')
+    headers = {
+        "Authorization": f"Bearer {token}",
+        "Accept": "application/json",
+    }
+    try:
+        pagina = await alistar_registros(username, headers, cursor=cursor, limit=request.GET.get('limit'))
+    except requests.RequestException:
+        return HttpResponse(status=502)
 
     context = {
-        "registros": registros,
-        "datos_grafico_json": datos_grafico_json,
-        "lista_habitos": list(datos_por_habito.keys())
+        "registros": pagina['registros'],
+        "registros_next_url": _url_registros(pagina['next_cursor']),
+        "cursor": cursor,
     }
+    return render(request, 'seguimiento/components/filas_registros.html', context)
+
+
+@login_required
+async def progreso_datos_view(request):
+    """
+    Serie de UN hábito para el gráfico de mi_progreso (JSON).
+
+    GET ?habito=<nombre>&desde=YYYY-MM-DD&hasta=YYYY-MM-DD&granularidad=diario|semanal|mensual
+    Responde con ETag: si el navegador ya tiene esa misma serie recibe un 304 sin cuerpo.
+    El ETag sale de la copia cacheada de las series (services.aget_series) y de los
+    parámetros, así el 304 se resuelve antes de tocar la API o de agregar nada.
+    """
+    username = request.user.username.lower()
+    user_data = await request.session.aget('user_session_data', {})
+    token = user_data.get('token')
+    if not token:
+        return JsonResponse({'error': 'Sesión expirada.'}, status=401)
+
+    habito = request.GET.get('habito')
+    granularidad = request.GET.get('granularidad') or None
+    desde = parse_fecha(request.GET['desde']) if request.GET.get('desde') else None
+    hasta = parse_fecha(request.GET['hasta']) if request.GET.get('hasta') else None
+    if (not habito or granularidad not in (None, *GRANULARIDADES)
+            or (request.GET.get('desde') and not desde) or (request.GET.get('hasta') and not hasta)):
+        return JsonResponse({'error': 'Parámetros inválidos.'}, status=400)
+
+    def _etag(entrada):
+        partes = (entrada['construidas'], habito, desde, hasta, granularidad, settings.PROGRESS_MAX_POINTS)
+        return quote_etag(hashlib.md5(repr(partes).encode()).hexdigest())
+
+    # private + no-cache: el navegador guarda la serie pero la revalida con If-None-Match
+    entrada = series_cacheadas(username)
+    if entrada is not None:
+        etag = _etag(entrada)
+        no_modificado = get_conditional_response(request, etag=etag)
+        if no_modificado is not None:
+            no_modificado.headers['ETag'] = etag
+            patch_cache_control(no_modificado, private=True, no_cache=True)
+            return no_modificado
+    else:
+        headers = {
+            "Authorization": f"Bearer {token}",
+            "Accept": "application/json",
+        }
+        try:
+            entrada = await aget_series(username, headers)
+        except requests.HTTPError as e:
+            return JsonResponse({'error': f'Error API ({e.response.status_code}).'}, status=502)
+        except requests.RequestException:
+            return JsonResponse({'error': 'Error de conexión al obtener el progreso.'}, status=502)
+
+    serie = entrada['series'].get(habito)
+    if serie is None:
+        return JsonResponse({'error': 'No hay registros para este hábito.'}, status=404)
+
+    etag = _etag(entrada)
+    response = JsonResponse(serie.grafico(desde, hasta, granularidad))
+    patch_cache_control(response, private=True, no_cache=True)
+    response.headers['ETag'] = etag
+    return get_conditional_response(request, etag=etag, response=response)
+
 
-    return render(request, 'seguimiento/mi_progreso.html', context)
-    
-    
 @login_required
 def eliminar_habito_view(request, id_habito):
 
@@ -251,9 +379,10 @@ def eliminar_habito_view(request, id_habito):
     try:
         url_delete = f"{HABITO_DEFINICION_URL}/{id_habito}"
         
-        resp = requests.delete(url_delete, headers=headers, timeout=5)
+        resp = api_client.delete(url_delete, headers=headers)
 
         if resp.status_code == 200:
+            bump_definiciones_version(request.user.username)
             messages.success(request, "Hábito eliminado correctamente.")
         else:
             error_msg = resp.json().get('error', resp.text) if resp.content else "Error API desconocido."
@@ -263,4 +392,75 @@ def eliminar_habito_view(request, id_habito):
         messages.error(request, "Error de conexión al intentar eliminar el hábito.")
 
     # Redirigir de vuelta a la lista de registros
-    return redirect('habitos:registro_habito')
\ No newline at end of file
+    return redirect('habitos:registro_habito')
+
+
+# --- ACCIONES RÁPIDAS (JSON) ---
+# La página "Tu Día" las usa con fetch: cada acción es UNA escritura en la API y
+# la respuesta trae sólo lo que cambió (sin redirect ni volver a renderizar la página).
+# Sin JavaScript, los formularios siguen enviándose a registro_habitos_view.
+
+def _headers_json(request):
+    token = request.session.get('user_session_data', {}).get('token')
+    if not token:
+        return None
+    return {
+        "Authorization": f"Bearer {token}",
+        "Accept": "application/json",
+        "Content-Type": "application/json",
+    }
+
+
+def _error_json(resp):
+    error_msg = resp.json().get('error', resp.text) if resp.content else f"Error API desconocido (código {resp.status_code})."
+    # Los 4xx de la API se devuelven tal cual (datos inválidos); el resto es un fallo de la API
+    return JsonResponse({'error': error_msg}, status=resp.status_code if 400 <= resp.status_code < 500 else 502)
+
+
+@login_required
+@require_POST
+def registrar_valor_view(request):
+    """Registra UN valor de hábito. Devuelve el registro y el HTML del estado de su tarjeta."""
+    headers = _headers_json(request)
+    if not headers:
+        return JsonResponse({'error': 'Sesión expirada.'}, status=401)
+
+    id_habito_def = request.POST.get('id_habito_def')
+    valor_registrado = request.POST.get('valor_registrado', '').strip()
+    if not id_habito_def or not valor_registrado:
+        return JsonResponse({'error': 'Faltan el hábito o el valor.'}, status=400)
+
+    data_registro = _datos_registro(
+        id_habito_def, valor_registrado, request.POST.get('comentario', ''),
+        request.POST.get('fecha_registro') or date.today().isoformat(), request.user.username.lower(),
+    )
+    try:
+        resp = api_client.post(HABITO_REGISTRO_URL, json=data_registro, headers=headers)
+    except requests.RequestException:
+        return JsonResponse({'error': 'Error de conexión con la API de Node.js al intentar guardar.'}, status=502)
+    if resp.status_code != 201:
+        return _error_json(resp)
+
+    registro = _registro_guardado(data_registro, resp)
+    anotar_registros(request.user.username, [registro])
+    html = render_to_string('seguimiento/components/estado_habito.html', {'registro_hoy': registro}, request=request)
+    return JsonResponse({'registro': registro, 'html': html}, status=201)
+
+
+@login_required
+@require_POST
+def eliminar_habito_json_view(request, id_habito):
+    """Elimina un hábito. Devuelve su id para quitar la tarjeta de la página."""
+    headers = _headers_json(request)
+    if not headers:
+        return JsonResponse({'error': 'Sesión expirada.'}, status=401)
+
+    try:
+        resp = api_client.delete(f"{HABITO_DEFINICION_URL}/{id_habito}", headers=headers)
+    except requests.RequestException:
+        return JsonResponse({'error': 'Error de conexión al intentar eliminar el hábito.'}, status=502)
+    if resp.status_code != 200:
+        return _error_json(resp)
+
+    bump_definiciones_version(request.user.username)
+    return JsonResponse({'id': id_habito})